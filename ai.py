@@ -0,0 +1,238 @@
+import os
+import random
+import time
+from concurrent.futures import Future, ProcessPoolExecutor, wait
+
+from board import SpecialType, dump_state, load_state
+from zobrist import ZobristTable, TranspositionTable
+
+# 向前看时无路可走的惩罚分
+DEADLOCK_PENALTY = 50
+
+
+def candidate_moves(board):
+    """所有候选操作：可行交换 ('swap', a, b) 和特殊符文激活 ('special', pos)"""
+    moves = [('swap', a, b) for a, b in board.find_valid_moves()]
+    for i, row in enumerate(board.grid):
+        for j, gem in enumerate(row):
+            if gem and gem.special_type != SpecialType.NONE:
+                moves.append(('special', (i, j)))
+    return moves
+
+
+def apply_move(board, move):
+    """在棋盘上执行操作并结算连锁，返回 CascadeStep 列表"""
+    if move[0] == 'special':
+        # 消除符文所在格即引爆它，波及的符文继续连锁
+        return board.resolve_cascade(initial_removal=[move[1]])
+
+    (r1, c1), (r2, c2) = move[1], move[2]
+    board.swap(r1, c1, r2, c2)
+    return board.resolve_cascade()
+
+
+def greedy_swap(board):
+    """不展开补充，估计下一步得分最高的交换，返回 (交换, 估计分数)
+
+    结果只取决于棋盘本身，开启缓存时按棋盘哈希保存。
+    """
+    if board.cache is not None:
+        cached = board.cache.get('greedy', board.hash)
+        if cached is not None:
+            return cached
+    best_move, best_score = None, -1
+    for (r1, c1), (r2, c2) in board.find_valid_moves():
+        board.swap(r1, c1, r2, c2)
+        matches = board.find_matches()[0]
+        board.swap(r1, c1, r2, c2)
+        score = len(matches) * 10 + 5
+        if score > best_score:
+            best_move, best_score = ('swap', (r1, c1), (r2, c2)), score
+    if board.cache is not None:
+        board.cache.put('greedy', board.hash, (best_move, best_score))
+    return best_move, best_score
+
+
+def rollout(board, move, depth):
+    """一次蒙特卡洛模拟：按棋盘的随机数补充执行 move，之后贪心走 depth-1 步"""
+    value = sum(step.score for step in apply_move(board, move))
+    for level in range(1, depth):
+        next_move, estimate = greedy_swap(board)
+        if next_move is None:
+            value -= DEADLOCK_PENALTY
+            break
+        if level == depth - 1:
+            value += estimate
+        else:
+            value += sum(step.score for step in apply_move(board, next_move))
+    return value
+
+
+# 每个进程一份哈希表和置换表，多次搜索之间复用
+_search_tables = {}
+
+
+def search_tables(gem_types, rows, cols, cache_size, eviction):
+    key = (tuple(gem_types), rows, cols, cache_size, eviction)
+    if key not in _search_tables:
+        _search_tables[key] = (ZobristTable(rows, cols, gem_types),
+                               TranspositionTable(cache_size, eviction))
+    return _search_tables[key]
+
+
+def run_rollouts(state, gem_types, tasks, depth, time_limit, cache_size=0, eviction='lru'):
+    """执行一批模拟，超过 time_limit 秒后停止；在工作进程中运行
+
+    state 为 dump_state() 打包的棋盘，tasks 为 [(候选编号, 操作, 随机种子), ...]。
+    返回 ([(候选编号, 得分), ...], 缓存统计)，缓存统计中的命中数为本批次的增量。
+    """
+    if not tasks:
+        return [], {}
+    deadline = time.perf_counter() + time_limit
+    board, _ = load_state(state, gem_types=gem_types)
+    if cache_size <= 0:
+        cache = None  # 不用置换表时也不维护哈希
+    else:
+        zobrist, cache = search_tables(gem_types, board.rows, board.cols, cache_size, eviction)
+        board.enable_hashing(zobrist, cache)
+        hits, misses = cache.hits, cache.misses
+
+    # 每次模拟前从快照恢复棋盘
+    snapshot = board.snapshot()
+    results = []
+    for index, move, seed in tasks:
+        if time.perf_counter() >= deadline:
+            break
+        board.rng = random.Random(seed)
+        board.restore(snapshot)
+        results.append((index, rollout(board, move, depth)))
+
+    if cache is None:
+        return results, {}
+    stats = cache.stats()
+    stats['hits'] -= hits
+    stats['misses'] -= misses
+    return results, stats
+
+
+class AIPlayer:
+    """电脑对手：对每个候选操作在随机补充下做多次模拟，选平均得分最高的
+
+    rollouts 为每个候选的模拟次数，depth 为向前看的步数，time_budget 为
+    每步的思考时间（秒）。workers 大于0时模拟分发到进程池，为 None 时使用
+    全部CPU核心。cache_size 和 eviction 配置每个进程的置换表；模拟的补充是随机的，
+    棋盘很少重复，置换表的开销大于收益，默认不用（cache_size 为 0）。
+    """
+
+    def __init__(self, rollouts=16, depth=2, time_budget=0.08, workers=None, seed=None,
+                 cache_size=0, eviction='lru'):
+        self.rollouts = rollouts
+        self.depth = depth
+        self.time_budget = time_budget
+        self.cache_size = cache_size
+        self.eviction = eviction
+        self.workers = (os.cpu_count() or 1) if workers is None else workers
+        self.rng = random.Random(seed)
+        self.executor = None
+        self.last_stats = {}
+
+    def start(self):
+        """提前启动进程池，避免第一步计时包含进程启动"""
+        if self.workers > 0 and self.executor is None:
+            self.executor = ProcessPoolExecutor(max_workers=self.workers)
+            wait([self.executor.submit(run_rollouts, b'', [], [], 1, 0,
+                                       self.cache_size, self.eviction)
+                  for _ in range(self.workers)])
+
+    def close(self):
+        if self.executor:
+            self.executor.shutdown(wait=False, cancel_futures=True)
+            self.executor = None
+
+    def choose_move(self, board):
+        """返回最佳操作，没有可行操作时返回 None；阻塞到搜索完成"""
+        return self.begin_move(board).result()
+
+    def begin_move(self, board):
+        """开始为 board 搜索，返回 PendingMove
+
+        使用进程池时模拟在后台进行，调用方可以继续处理界面，等 done() 为 True
+        后再取结果；之后修改 board 不影响这次搜索。
+        """
+        start = time.perf_counter()
+        moves = candidate_moves(board)
+        if len(moves) <= 1:
+            return PendingMove(self, moves, [], start)
+
+        # 按轮次交错排列，时间不够时每个候选的模拟次数仍然接近
+        tasks = [(index, move, self.rng.getrandbits(32))
+                 for _ in range(self.rollouts)
+                 for index, move in enumerate(moves)]
+        state = dump_state(board)
+        return PendingMove(self, moves, self.submit(state, board.gem_types, tasks, start), start)
+
+    def submit(self, state, gem_types, tasks, start):
+        """在本进程中执行模拟或分发到进程池，返回各批模拟的 Future 列表"""
+        # 留出汇总结果的时间
+        time_limit = max(0.0, self.time_budget - (time.perf_counter() - start)) * 0.9
+        if self.workers <= 0:
+            future = Future()
+            future.set_result(run_rollouts(state, gem_types, tasks, self.depth, time_limit,
+                                           self.cache_size, self.eviction))
+            return [future]
+
+        self.start()
+        chunks = [tasks[i::self.workers] for i in range(self.workers)]
+        return [self.executor.submit(run_rollouts, state, gem_types, chunk,
+                                     self.depth, time_limit,
+                                     self.cache_size, self.eviction)
+                for chunk in chunks if chunk]
+
+    def collect(self, futures):
+        """等待各批模拟完成，返回 (结果, 汇总的缓存统计)"""
+        results = []
+        cache_stats = {'hits': 0, 'misses': 0, 'entries': 0, 'evictions': 0, 'memory_bytes': 0}
+        for future in futures:
+            chunk_results, stats = future.result()
+            results.extend(chunk_results)
+            for key in cache_stats:
+                cache_stats[key] += stats.get(key, 0)
+        total = cache_stats['hits'] + cache_stats['misses']
+        cache_stats['hit_rate'] = cache_stats['hits'] / total if total else 0.0
+        return results, cache_stats
+
+
+class PendingMove:
+    """AIPlayer.begin_move() 开始的一次搜索"""
+
+    def __init__(self, player, moves, futures, start):
+        self.player = player
+        self.moves = moves
+        self.futures = futures
+        self.start = start
+
+    def done(self):
+        return all(future.done() for future in self.futures)
+
+    def result(self):
+        """汇总模拟，返回平均得分最高的操作，没有可行操作时返回 None"""
+        moves = self.moves
+        if len(moves) <= 1:
+            return moves[0] if moves else None
+        results, cache_stats = self.player.collect(self.futures)
+
+        totals = [0.0] * len(moves)
+        counts = [0] * len(moves)
+        for index, value in results:
+            totals[index] += value
+            counts[index] += 1
+
+        best_index = max((i for i in range(len(moves)) if counts[i]),
+                         key=lambda i: totals[i] / counts[i], default=0)
+        self.player.last_stats = {
+            'candidates': len(moves),
+            'rollouts': len(results),
+            'elapsed': time.perf_counter() - self.start,
+            'cache': cache_stats
+        }
+        return moves[best_index]
@@ -0,0 +1,194 @@
+import numpy as np
+
+
+class GemAnimator:
+    """宝石动画状态（结构数组），按格子存储，一次向量化更新整个棋盘
+
+    棋盘逻辑可以一次算完整个连锁，这里保存的是屏幕上正在显示的内容，
+    包括每个格子显示的宝石类型编号和特殊符文编号。
+    """
+
+    def __init__(self, rows, cols, cell_size, offset_x, offset_y, drop_speed=0.5):
+        self.rows = rows
+        self.cols = cols
+        self.cell_size = cell_size
+        self.offset_x = offset_x
+        self.offset_y = offset_y
+        self.drop_speed = drop_speed
+
+        shape = (rows, cols)
+        # 每个格子上的宝石最终都停在格子本身的位置，所以目标坐标是常量
+        self.target_x = np.tile(np.arange(cols, dtype=np.float64) * cell_size + offset_x, (rows, 1))
+        self.target_y = np.tile((np.arange(rows, dtype=np.float64) * cell_size + offset_y)[:, None], (1, cols))
+
+        self.x = self.target_x.copy()
+        self.y = self.target_y.copy()
+        # 上一个模拟步的位置，渲染时在两步之间插值
+        self.prev_x = self.x.copy()
+        self.prev_y = self.y.copy()
+        self.alpha = np.full(shape, 255.0)
+        self.scale = np.ones(shape)
+        self.remove_timer = np.ones(shape)
+        self.effect_angle = np.zeros(shape)
+        self.gem_type = np.full(shape, -1, dtype=np.int16)
+        self.special = np.zeros(shape, dtype=np.int8)
+        self.occupied = np.zeros(shape, dtype=bool)
+        self.removing = np.zeros(shape, dtype=bool)
+        self.moving = np.zeros(shape, dtype=bool)
+
+        # 随宝石一起移动的状态数组
+        self._carried = (self.x, self.y, self.prev_x, self.prev_y, self.alpha, self.scale,
+                         self.remove_timer, self.effect_angle,
+                         self.gem_type, self.special,
+                         self.occupied, self.removing)
+
+    def reset(self, codes):
+        """按 Board.type_codes() 的结果放上静止的宝石"""
+        codes = np.array(codes, dtype=np.int16).reshape(self.rows, self.cols, 2)
+        self.gem_type[:] = codes[:, :, 0]
+        self.special[:] = codes[:, :, 1]
+        self.x[:] = self.target_x
+        self.y[:] = self.target_y
+        self.prev_x[:] = self.target_x
+        self.prev_y[:] = self.target_y
+        self.alpha.fill(255.0)
+        self.scale.fill(1.0)
+        self.remove_timer.fill(1.0)
+        self.effect_angle.fill(0.0)
+        np.copyto(self.occupied, self.gem_type >= 0)
+        self.removing.fill(False)
+        self.moving.fill(False)
+
+    def place(self, row, col, gem_type, special=0, start_row=None):
+        """在格子上放一颗新宝石，start_row 不为空时从该行位置落下"""
+        self.gem_type[row, col] = gem_type
+        self.special[row, col] = special
+        self.x[row, col] = self.target_x[row, col]
+        if start_row is None:
+            self.y[row, col] = self.target_y[row, col]
+        else:
+            self.y[row, col] = start_row * self.cell_size + self.offset_y
+        self.prev_x[row, col] = self.x[row, col]
+        self.prev_y[row, col] = self.y[row, col]
+        self.alpha[row, col] = 255.0
+        self.scale[row, col] = 1.0
+        self.remove_timer[row, col] = 1.0
+        self.effect_angle[row, col] = 0.0
+        self.occupied[row, col] = True
+        self.removing[row, col] = False
+        self.moving[row, col] = self.y[row, col] != self.target_y[row, col]
+
+    def set_special(self, row, col, special):
+        """格子上的宝石升级为特殊符文"""
+        self.place(row, col, self.gem_type[row, col], special)
+
+    def clear(self, row, col):
+        """格子变空"""
+        self.occupied[row, col] = False
+        self.removing[row, col] = False
+        self.moving[row, col] = False
+
+    def move(self, src, dst):
+        """宝石从 src 格移动到 dst 格，保留当前屏幕位置"""
+        for array in self._carried:
+            array[dst] = array[src]
+        self.moving[dst] = True
+        self.clear(*src)
+
+    def swap(self, a, b):
+        """交换两个格子上的宝石"""
+        for array in self._carried:
+            array[a], array[b] = array[b], array[a]
+        self.moving[a] = self.occupied[a]
+        self.moving[b] = self.occupied[b]
+
+    def mark_removing(self, row, col):
+        """开始消除动画"""
+        if self.occupied[row, col]:
+            self.removing[row, col] = True
+            self.remove_timer[row, col] = 1.0
+
+    def step(self, dt):
+        """推进所有宝石一个模拟步，返回消除动画已结束的格子掩码
+
+        缓动按 dt 线性缩放，dt 应为固定步长；过大的 dt 会让宝石越过目标。
+        """
+        np.copyto(self.prev_x, self.x)
+        np.copyto(self.prev_y, self.y)
+        dx = self.target_x - self.x
+        dy = self.target_y - self.y
+        active = self.occupied & ((np.abs(dx) > 0.1) | (np.abs(dy) > 0.1))
+
+        # 未到位的宝石向目标缓动，已到位的直接吸附
+        factor = self.drop_speed * dt * 60
+        np.copyto(self.x, self.x + dx * factor, where=active)
+        np.copyto(self.y, self.y + dy * factor, where=active)
+        np.copyto(self.x, self.target_x, where=~active)
+        np.copyto(self.y, self.target_y, where=~active)
+        np.copyto(self.moving, active)
+
+        self.effect_angle += dt * 2
+
+        # 消除动画：淡出并缩小
+        removing = self.removing & self.occupied
+        if removing.any():
+            self.remove_timer[removing] -= dt
+            progress = 1.0 - np.maximum(0.0, self.remove_timer[removing])
+            self.alpha[removing] = 255 * (1.0 - progress)
+            self.scale[removing] = 1.0 - progress * 0.5
+            return removing & (self.remove_timer <= 0)
+        return np.zeros_like(removing)
+
+    def any_moving(self):
+        return bool(self.moving.any())
+
+    def any_removing(self):
+        return bool((self.removing & self.occupied).any())
+
+    def is_animating(self):
+        return self.any_moving() or self.any_removing()
+
+    def state(self, row, col, blend=1.0):
+        """返回绘制参数 (x, y, alpha, scale, effect_angle)
+
+        blend 为上一步与当前步之间的插值系数，1.0 表示当前步的位置。
+        """
+        x, y = self.x[row, col], self.y[row, col]
+        if blend < 1.0:
+            prev_x, prev_y = self.prev_x[row, col], self.prev_y[row, col]
+            x = prev_x + (x - prev_x) * blend
+            y = prev_y + (y - prev_y) * blend
+        return (float(x), float(y),
+                float(self.alpha[row, col]), float(self.scale[row, col]),
+                float(self.effect_angle[row, col]))
+
+
+class FixedTimestep:
+    """固定步长时钟：累积每帧真实经过的时间，按固定步长推进模拟
+
+    模拟结果与帧率无关。一帧最多执行 max_ticks 步，落后更多时丢弃积压
+    的时间（跳帧），避免慢帧后为追赶越来越慢。blend 为渲染插值系数。
+    """
+
+    def __init__(self, tick_rate=60, max_ticks=5):
+        self.dt = 1.0 / tick_rate
+        self.max_ticks = max_ticks
+        self.accumulator = 0.0
+        self.ticks = 0    # 累计执行的模拟步数
+        self.skipped = 0  # 跳帧丢弃的模拟步数
+
+    def advance(self, elapsed):
+        """加入一帧经过的秒数，返回本帧应执行的模拟步数"""
+        self.accumulator += elapsed
+        steps = min(int(self.accumulator / self.dt), self.max_ticks)
+        self.accumulator -= steps * self.dt
+        if self.accumulator >= self.dt:
+            dropped = int(self.accumulator / self.dt)
+            self.skipped += dropped
+            self.accumulator -= dropped * self.dt
+        self.ticks += steps
+        return steps
+
+    @property
+    def blend(self):
+        return min(1.0, self.accumulator / self.dt)
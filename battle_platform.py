@@ -1,9 +1,9 @@
 import pygame
 import socket
-import threading
 import time
-import os
 from constants import GameState
+from render_backend import prepare_surface
+from font_manager import get_font
 
 class Button:
     def __init__(self, text, x, y, width=200, height=50, active=True, font=None):
@@ -41,6 +41,94 @@ class Button:
     def clicked(self, pos):
         return self.active and self.rect.collidepoint(pos)
 
+class VirtualList:
+    """只渲染可见行的列表控件
+
+    items 为 [(键, 外观, 数据), ...]，外观是决定这一行画成什么样的元组，
+    render_row(数据, 外观, 悬停, 选中) 返回这一行的 Surface。每行的 Surface
+    缓存到外观、悬停或选中状态改变为止。hotspot 为行内可点击区域（相对行左上角），
+    鼠标在其中时该行处于悬停状态。绘制时记录可见行的位置，点击检测只查这些行。
+    """
+
+    def __init__(self, rect, row_height, render_row, padding=10, hotspot=None):
+        self.rect = rect
+        self.row_height = row_height
+        self.render_row = render_row
+        self.padding = padding
+        self.hotspot = hotspot
+        self.items = []
+        self.cache = {}          # 键 -> (外观, 悬停, 选中, Surface)
+        self.scroll_offset = 0
+        self.visible = []        # [(行 Rect, 键, 数据), ...] 上一次绘制的可见行
+        self.renders = 0         # 重新渲染的行数
+
+    def set_items(self, items):
+        self.items = items
+        keys = {key for key, _, _ in items}
+        for key in [key for key in self.cache if key not in keys]:
+            del self.cache[key]
+        self.scroll(0)
+
+    def content_height(self):
+        return len(self.items) * self.row_height + self.padding
+
+    def scroll(self, dy):
+        limit = max(0, self.content_height() - self.rect.height)
+        self.scroll_offset = max(0, min(self.scroll_offset + dy, limit))
+
+    def row_at(self, pos):
+        """返回 (行 Rect, 键, 数据)，pos 不在任何可见行上时返回 None"""
+        if not self.rect.collidepoint(pos):
+            return None
+        for row in self.visible:
+            if row[0].collidepoint(pos):
+                return row
+        return None
+
+    def in_hotspot(self, row_rect, pos):
+        return (self.hotspot is not None and
+                self.hotspot.move(row_rect.topleft).collidepoint(pos))
+
+    def hotspot_item(self, pos):
+        """点击位置在某行的可点击区域内时返回该行的数据"""
+        row = self.row_at(pos)
+        if row and self.in_hotspot(row[0], pos):
+            return row[2]
+        return None
+
+    def draw(self, screen, selected_key=None, mouse_pos=None):
+        """把可见行画到 screen 上的 rect 区域"""
+        first = max(0, (self.scroll_offset - self.padding) // self.row_height)
+        last = min(len(self.items),
+                   (self.scroll_offset - self.padding + self.rect.height) // self.row_height + 1)
+        top = self.rect.y + self.padding - self.scroll_offset
+
+        previous_clip = screen.get_clip()
+        screen.set_clip(self.rect)
+        self.visible = []
+        for index in range(first, last):
+            key, look, item = self.items[index]
+            row_rect = pygame.Rect(self.rect.x, top + index * self.row_height,
+                                   self.rect.width, self.row_height)
+            hovered = mouse_pos is not None and self.in_hotspot(row_rect, mouse_pos)
+            selected = key == selected_key
+            cached = self.cache.get(key)
+            if cached is None or cached[:3] != (look, hovered, selected):
+                cached = (look, hovered, selected, self.render_row(item, look, hovered, selected))
+                self.cache[key] = cached
+                self.renders += 1
+            screen.blit(cached[3], row_rect)
+            self.visible.append((row_rect, key, item))
+        screen.set_clip(previous_clip)
+
+    def draw_scrollbar(self, screen):
+        total = self.content_height()
+        if total <= self.rect.height:
+            return
+        position = self.scroll_offset / (total - self.rect.height) * (self.rect.height - 40)
+        pygame.draw.rect(screen, (60, 60, 80),
+                         (self.rect.right - 15, self.rect.top + position, 10, 40))
+
 class Player:
     def __init__(self, name, ip):
         self.name = name
@@ -60,31 +148,9 @@ class BattlePlatform:
         self.screen = screen
         self.network = network_manager
         
-        # 初始化字体
-        try:
-            font_path = os.path.join('assets', 'simhei.ttf')
-            if os.path.exists(font_path):
-                self.font = pygame.font.Font(font_path, 24)        # 从36调整到24
-                self.small_font = pygame.font.Font(font_path, 20)  # 从24调整到20
-            else:
-                font_names = ['SimHei', 'Microsoft YaHei', 'PingFang SC']
-                font_loaded = False
-                for font_name in font_names:
-                    try:
-                        self.font = pygame.font.SysFont(font_name, 24)        # 从36调整到24
-                        self.small_font = pygame.font.SysFont(font_name, 20)  # 从24调整到20
-                        font_loaded = True
-                        break
-                    except:
-                        continue
-                
-                if not font_loaded:
-                    self.font = pygame.font.Font(None, 24)        # 从36调整到24
-                    self.small_font = pygame.font.Font(None, 20)  # 从24调整到20
-        except Exception as e:
-            print(f"字体加载错误: {e}")
-            self.font = pygame.font.Font(None, 24)        # 从36调整到24
-            self.small_font = pygame.font.Font(None, 20)  # 从24调整到20
+        # 初始化字体（与其他界面共享）
+        self.font = get_font(24)
+        self.small_font = get_font(20)
         
         # 定义左右两栏的区域（使用固定尺寸）
         self.left_panel = pygame.Rect(20, 50, 380, 500)
@@ -92,17 +158,18 @@ class BattlePlatform:
         
         # 创建背景surface
         self.background = pygame.Surface(self.screen.get_size())
-        self.background = self.background.convert()
+        self.background = prepare_surface(self.background)
         self.background.fill((30, 30, 50))
         
-        # 创建面板surface
-        self.left_surface = pygame.Surface((380, 500))
-        self.right_surface = pygame.Surface((360, 500))
+        # 玩家列表和房间列表，只渲染可见的行
+        self.player_list = VirtualList(self.left_panel, 45, self.render_player_row)
+        self.room_list = VirtualList(self.right_panel, 60, self.render_room_row, padding=60,
+                                     hotspot=pygame.Rect(300, 0, 50, 25))
+        self.local_ip = self.network.get_local_ip()
         
-        # 玩家列表
-        self.online_players = {}
+        # 列表对应的状态存储版本，版本变化时才重建
+        self.list_revisions = {'player': None, 'room': None}
         self.current_room = None
-        self.scroll_offset = 0
         self.selected_player = None
         
         # 调整按钮位置和尺寸
@@ -135,96 +202,56 @@ class BattlePlatform:
         # 开始搜索局域网玩家
         self.start_discovery()
         
-        # 添加更新计时器
-        self.last_update = 0
-        self.update_interval = 1.0  # 每秒更新一次
-        
-        self.rooms = {}  # 存储可见的房间
-        
         # 创建房间浮窗
         self.room_overlay = RoomOverlay(screen, network_manager, self.font)
         
     def start_discovery(self):
-        """开始搜索局域网玩家"""
-        threading.Thread(target=self.discover_players, daemon=True).start()
-        
-    def discover_players(self):
-        """搜索局域网玩家"""
-        while True:
-            try:
-                # 广播自己的存在
-                self.network.broadcast_presence()
-                
-                # 更新在线玩家状态
-                current_time = time.time()
-                for ip, player in list(self.online_players.items()):
-                    if current_time - player.last_seen > 5:  # 5秒未响应视为离线
-                        del self.online_players[ip]
-                
-                time.sleep(2)  # 每2秒更新一次
-            except Exception as e:
-                print(f"发现玩家出错: {e}")
-                
+        """开始按计划发送发现信标"""
+        self.network.discovery.start()
+        
     def handle_event(self, event):
         # 如果在房间中，优先处理房间事件
         if self.network.current_room:
             if self.room_overlay.handle_event(event):
-                if self.network.current_room.status == "游戏中":
+                if self.network.current_room and self.network.current_room.status == "游戏中":
                     # 切换到游戏状态
                     return "START_GAME"
                 # 如果返回True但不是开始游戏，表示离开房间
-                self.network.current_room = None
+                self.set_current_room(None)
             return
         
         if event.type == pygame.MOUSEBUTTONDOWN:
             # 处理玩家列表点击
             if self.left_panel.collidepoint(event.pos):
-                list_y = event.pos[1] - self.left_panel.top + self.scroll_offset
-                index = int(list_y // 45)
-                if 0 <= index < len(self.online_players):
-                    self.selected_player = list(self.online_players.values())[index]
+                self.handle_player_selection(event.pos)
+                if self.selected_player:
                     print(f"选中玩家: {self.selected_player}")
             
-            # 处理房间加入点击
+            # 处理房间加入点击：只检查可见行的加入按钮
             elif self.right_panel.collidepoint(event.pos):
-                mouse_pos = event.pos
-                relative_y = mouse_pos[1] - self.right_panel.y
-                
-                # 遍历房间列表检查点击
-                y = 60
-                for room_id, room in self.rooms.items():
-                    if room.status == "等待中":  # 只处理等待中的房间
-                        join_button_rect = pygame.Rect(
-                            self.right_panel.x + 300,  # 加入按钮的x位置
-                            self.right_panel.y + y,    # 房间项的y位置
-                            50,                        # 按钮宽度
-                            25                         # 按钮高度
-                        )
-                        
-                        if join_button_rect.collidepoint(mouse_pos):
-                            print(f"尝试加入房间: {room_id}")
-                            if self.network.join_room(room_id, room.host.ip):
-                                self.current_room = room
-                                print(f"成功加入房间: {room_id}")
-                            break
-                    y += 60
+                room = self.room_list.hotspot_item(event.pos)
+                if room and self.can_join(room):
+                    print(f"尝试加入房间: {room.room_id}")
+                    if self.network.join_room(room.room_id, room.host.ip):
+                        self.set_current_room(room)
+                        print(f"成功加入房间: {room.room_id}")
             
             # 处理其他按钮点击
             for name, button in self.buttons.items():
                 if button.clicked(event.pos):
                     if name == 'refresh':
-                        self.network.broadcast_presence()
+                        self.network.discovery.request_fast()
+                        self.list_revisions = dict.fromkeys(self.list_revisions)
                         self.update()
                     else:
                         self.handle_button_click(name)
                     
         elif event.type == pygame.MOUSEWHEEL:
-            # 只在鼠标在玩家列表区域时处理滚动
-            if self.left_panel.collidepoint(pygame.mouse.get_pos()):
-                self.scroll_offset = max(0, min(
-                    self.scroll_offset - event.y * 20,
-                    max(0, len(self.online_players) * 45 - self.left_panel.height)
-                ))
+            # 鼠标所在的列表滚动
+            mouse_pos = pygame.mouse.get_pos()
+            for view in (self.player_list, self.room_list):
+                if view.rect.collidepoint(mouse_pos):
+                    view.scroll(-event.y * 20)
         
     def refresh_player_list(self):
         """刷新玩家列表"""
@@ -252,43 +279,129 @@ class BattlePlatform:
     def start_game(self):
         """开始游戏"""
         if self.can_start_game():
-            self.network.send_data({'type': 'start_game'})
+            self.network.start_room_game()
             
     def leave_room(self):
         """离开房间"""
         if self.current_room:
-            self.network.send_data({'type': 'leave_room'})
-            self.current_room = None
+            self.network.leave_current_room()
+            self.set_current_room(None)
             self.buttons['ready'].active = False
             self.buttons['start'].active = False
             self.buttons['leave'].active = False
             
     def handle_player_selection(self, mouse_pos):
         """处理玩家选择"""
-        y = mouse_pos[1] - self.player_list_rect.top + self.scroll_offset
-        index = int(y // 40)
-        if 0 <= index < len(self.online_players):
-            self.selected_player = list(self.online_players.values())[index]
+        row = self.player_list.row_at(mouse_pos)
+        if row:
+            self.selected_player = row[2]
             
     def invite_player(self, player):
         """邀请玩家"""
         if self.current_room and not self.current_room.guest:
             self.network.send_invite(player.ip)
             
+    def set_current_room(self, room):
+        """切换自己所在的房间；房间列表的可加入状态随之变化，需要重建"""
+        self.current_room = room
+        self.list_revisions['room'] = None
+    
     def update(self):
-        """更新游戏状态"""
-        current_time = time.time()
-        if current_time - self.last_update >= self.update_interval:
-            self.last_update = current_time
-            
-            # 更新玩家列表和房间列表
-            if self.network:
-                self.online_players = {p.ip: p for p in self.network.players}
-                self.rooms = self.network.rooms
-                
-                # 更新房间浮窗
-                if self.network.current_room:
-                    self.room_overlay.update()
+        """只重建状态存储中版本有变化的列表"""
+        store = self.network.store
+        revision = store.kind_revision('player')
+        if revision != self.list_revisions['player']:
+            self.list_revisions['player'] = revision
+            self.refresh_player_rows()
+        revision = store.kind_revision('room')
+        if revision != self.list_revisions['room']:
+            self.list_revisions['room'] = revision
+            self.refresh_room_rows()
+        
+        # 更新房间浮窗
+        if self.network.current_room:
+            self.room_overlay.update()
+    
+    def can_join(self, room):
+        """只有等待中的、别人创建的房间可以加入"""
+        return (room.status == "等待中" and
+                not self.current_room and
+                room.host.ip != self.local_ip)
+    
+    def refresh_player_rows(self):
+        """按状态存储中的玩家重建列表项，内容没变的行继续使用缓存"""
+        self.player_list.set_items([
+            (player.ip, (player.name, player.ip, player.status), player)
+            for player in self.network.store.values('player')
+        ])
+    
+    def refresh_room_rows(self):
+        """按状态存储中的房间重建列表项"""
+        rooms = []
+        for room_id, room in self.network.store.items('room'):
+            # 跳过自己创建的房间
+            if self.current_room and room_id == self.current_room.room_id:
+                continue
+            rooms.append((room_id, (room.host.name, self.room_status_text(room), room.status,
+                                    self.can_join(room)), room))
+        self.room_list.set_items(rooms)
+    
+    def room_status_text(self, room):
+        if room.status == "等待中":
+            return "等待加入"
+        if room.status == "准备中":
+            if room.host_ready and room.guest_ready:
+                return "全部准备"
+            ready_count = sum([room.host_ready, room.guest_ready])
+            return f"准备中({ready_count}/2)"
+        return room.status
+    
+    def render_player_row(self, player, look, hovered, selected):
+        """渲染玩家列表的一行"""
+        name, ip, status = look
+        surface = pygame.Surface((self.left_panel.width, 45))
+        surface.fill((40, 40, 60))
+        if selected:
+            pygame.draw.rect(surface, (60, 60, 80), (5, 0, 370, 35))
+        
+        # 绘制玩家信息
+        name_text = self.small_font.render(f"{name}", True, (255, 255, 255))
+        ip_text = self.small_font.render(f"{ip}", True, (200, 200, 200))
+        status_text = self.small_font.render(status, True,
+                                           (100, 255, 100) if status == "在线"
+                                           else (255, 100, 100))
+        surface.blit(name_text, (15, 8))
+        surface.blit(ip_text, (150, 8))
+        surface.blit(status_text, (280, 8))
+        return surface
+    
+    def render_room_row(self, room, look, hovered, selected):
+        """渲染房间列表的一行，hovered 表示鼠标在加入按钮上"""
+        host_name, status_text, status, joinable = look
+        surface = pygame.Surface((self.right_panel.width, 60))
+        surface.fill((40, 40, 60))
+        
+        # 绘制房间基本信息
+        room_text = self.small_font.render(f"房间: {room.room_id[:8]}...", True, (200, 200, 200))
+        host_text = self.small_font.render(f"主机: {host_name}", True, (200, 200, 200))
+        status_render = self.small_font.render(
+            status_text,
+            True,
+            (100, 255, 100) if status == "等待中" else 
+            (255, 200, 100) if status == "准备中" else
+            (255, 100, 100)
+        )
+        surface.blit(room_text, (10, 0))
+        surface.blit(host_text, (10, 20))
+        surface.blit(status_render, (10, 40))
+        
+        # 显示加入按钮（只对可以加入的房间显示）
+        if joinable:
+            join_button = self.room_list.hotspot
+            pygame.draw.rect(surface, (80, 80, 100) if hovered else (60, 60, 80), join_button)
+            join_text = self.small_font.render("加入", True, (255, 255, 255))
+            surface.blit(join_text, join_text.get_rect(center=join_button.center))
+        return surface
     
     def draw(self):
         # 绘制基础背景
@@ -302,100 +415,16 @@ class BattlePlatform:
         self.screen.blit(self.cached_texts['left_title'], (30, 20))
         self.screen.blit(self.cached_texts['right_title'], (430, 20))
         
-        # 绘制玩家列表到左面板
-        self.left_surface.fill((40, 40, 60))
-        y = 10 - self.scroll_offset
-        
-        # 使用online_players字典而不是network.players
-        for player in self.online_players.values():
-            if y + 40 >= 0 and y <= 500:
-                if player == self.selected_player:
-                    pygame.draw.rect(self.left_surface, (60, 60, 80),
-                                   (5, y, 370, 35))
-                
-                # 绘制玩家信息
-                name_text = self.small_font.render(f"{player.name}", True, (255, 255, 255))
-                ip_text = self.small_font.render(f"{player.ip}", True, (200, 200, 200))
-                status_text = self.small_font.render(player.status, True,
-                                                   (100, 255, 100) if player.status == "在线"
-                                                   else (255, 100, 100))
-                
-                self.left_surface.blit(name_text, (15, y + 8))
-                self.left_surface.blit(ip_text, (150, y + 8))
-                self.left_surface.blit(status_text, (280, y + 8))
-            y += 45
-        
-        # 绘制房间列表到右面板
-        self.right_surface.fill((40, 40, 60))
-        if self.rooms:
-            y = 60
-            for room_id, room in self.rooms.items():
-                # 跳过自己创建的房间
-                if self.current_room and room_id == self.current_room.room_id:
-                    continue
-                    
-                # 绘制房间基本信息
-                room_text = self.small_font.render(
-                    f"房间: {room_id[:8]}...",
-                    True, (200, 200, 200)
-                )
-                host_text = self.small_font.render(
-                    f"主机: {room.host.name}",
-                    True, (200, 200, 200)
-                )
-                
-                # 显示房间状态
-                status_text = ""
-                if room.status == "等待中":
-                    status_text = "等待加入"
-                elif room.status == "准备中":
-                    if room.host_ready and room.guest_ready:
-                        status_text = "全部准备"
-                    else:
-                        ready_count = sum([room.host_ready, room.guest_ready])
-                        status_text = f"准备中({ready_count}/2)"
-                else:
-                    status_text = room.status
-                
-                status_render = self.small_font.render(
-                    status_text,
-                    True,
-                    (100, 255, 100) if room.status == "等待中" else 
-                    (255, 200, 100) if room.status == "准备中" else
-                    (255, 100, 100)
-                )
-                
-                self.right_surface.blit(room_text, (10, y))
-                self.right_surface.blit(host_text, (10, y + 20))
-                self.right_surface.blit(status_render, (10, y + 40))
-                
-                # 显示加入按钮（只对等待中的房间显示）
-                if (room.status == "等待中" and 
-                    not self.current_room and 
-                    room.host.ip != self.network.get_local_ip()):
-                    join_button = pygame.Rect(300, y, 50, 25)
-                    mouse_pos = pygame.mouse.get_pos()
-                    adjusted_pos = (
-                        mouse_pos[0] - self.right_panel.x,
-                        mouse_pos[1] - self.right_panel.y
-                    )
-                    
-                    if join_button.collidepoint(adjusted_pos):
-                        pygame.draw.rect(self.right_surface, (80, 80, 100), join_button)
-                    else:
-                        pygame.draw.rect(self.right_surface, (60, 60, 80), join_button)
-                    
-                    join_text = self.small_font.render("加入", True, (255, 255, 255))
-                    text_rect = join_text.get_rect(center=join_button.center)
-                    self.right_surface.blit(join_text, text_rect)
-                
-                y += 60
+        # 绘制玩家列表和房间列表的可见行
+        mouse_pos = pygame.mouse.get_pos()
+        selected_key = self.selected_player.ip if self.selected_player else None
+        self.player_list.draw(self.screen, selected_key)
+        if self.room_list.items:
+            self.room_list.draw(self.screen, mouse_pos=mouse_pos)
         else:
-            self.right_surface.blit(self.cached_texts['no_room'], (10, 60))
-        
-        # 将面板surface绘制到屏幕
-        self.screen.blit(self.left_surface, self.left_panel)
-        self.screen.blit(self.right_surface, self.right_panel)
+            self.room_list.visible = []
+            self.screen.blit(self.cached_texts['no_room'],
+                             (self.right_panel.x + 10, self.right_panel.y + 60))
         
         # 绘制分隔线
         pygame.draw.line(self.screen, (60, 60, 80), 
@@ -406,21 +435,12 @@ class BattlePlatform:
             button.draw(self.screen)
         
         # 绘制滚动条
-        if len(self.online_players) * 45 > self.left_panel.height:
-            scroll_height = self.left_panel.height
-            scroll_pos = (self.scroll_offset / 
-                         (len(self.online_players) * 45 - self.left_panel.height) * 
-                         (scroll_height - 40))
-            pygame.draw.rect(self.screen, (60, 60, 80),
-                           (self.left_panel.right - 15, 
-                            self.left_panel.top + scroll_pos, 10, 40))
+        self.player_list.draw_scrollbar(self.screen)
+        self.room_list.draw_scrollbar(self.screen)
         
         # 在最后绘制房间浮窗
         if self.network.current_room:
             self.room_overlay.draw()
-        
-        # 使用双缓冲更新显示
-        pygame.display.flip() 
     
     def handle_button_click(self, button_name):
         """处理按钮点击事件"""
@@ -428,7 +448,7 @@ class BattlePlatform:
             if button_name == 'create_room':
                 room = self.network.create_room()
                 if room:
-                    self.current_room = room
+                    self.set_current_room(room)
                     self.buttons['ready'].active = True
                     self.buttons['leave'].active = True
                     print("创建房间成功")
@@ -440,20 +460,13 @@ class BattlePlatform:
             
             elif button_name == 'start':
                 if self.can_start_game():
-                    self.network.send_data({
-                        'type': 'start_game',
-                        'room_id': self.current_room.room_id
-                    })
+                    self.network.start_room_game()
                     print("发送开始游戏请求")
             
             elif button_name == 'leave':
                 if self.current_room:
-                    self.network.send_data({
-                        'type': 'leave_room',
-                        'room_id': self.current_room.room_id,
-                        'player_ip': self.network.get_local_ip()
-                    })
-                    self.current_room = None
+                    self.network.leave_current_room()
+                    self.set_current_room(None)
                     self.buttons['ready'].active = False
                     self.buttons['start'].active = False
                     self.buttons['leave'].active = False
@@ -525,6 +538,7 @@ class RoomOverlay:
         self.screen = screen
         self.network = network
         self.font = font
+        self.local_ip = network.get_local_ip()
         
         # 浮窗位置和大小
         window_width, window_height = screen.get_size()
@@ -551,6 +565,15 @@ class RoomOverlay:
                           button_width, button_height, font=font)
         }
     
+    def ready_flags(self, room):
+        """(房主已准备, 客人已准备)，自己一方以本地的准备状态为准
+
+        房间对象属于网络层，界面只读，不把本地状态写回房间。
+        """
+        if room.host.ip == self.local_ip:
+            return self.network.is_ready, room.guest_ready
+        return room.host_ready, self.network.is_ready
+    
     def update(self):
         """更新房间状态和按钮"""
         if self.network.current_room:
@@ -560,21 +583,15 @@ class RoomOverlay:
             self.buttons['ready'].text = "取消准备" if is_ready else "准备"
             
             # 更新开始按钮状态
-            is_host = room.host.ip == self.network.get_local_ip()
+            is_host = room.host.ip == self.local_ip
+            host_ready, guest_ready = self.ready_flags(room)
             can_start = (
                 room.guest and                # 有客人加入
-                room.host_ready and           # 房主已准备
-                room.guest_ready and          # 客人已准备
+                host_ready and                # 房主已准备
+                guest_ready and               # 客人已准备
                 is_host                       # 是房主
             )
             self.buttons['start'].active = can_start
-            
-            # 更新房间状态显示
-            if room.guest:
-                if is_host:
-                    room.host_ready = is_ready
-                else:
-                    room.guest_ready = is_ready
     
     def draw(self):
         """绘制房间浮窗"""
@@ -593,7 +610,7 @@ class RoomOverlay:
         
         # 绘制房间信息
         room = self.network.current_room
-        is_host = room.host.ip == self.network.get_local_ip()
+        host_ready, guest_ready = self.ready_flags(room)
         
         # 房间标题
         title = self.font.render(f"房间号: {room.room_id[:8]}...", True, (255, 255, 255))
@@ -601,29 +618,29 @@ class RoomOverlay:
         
         # 房间状态
         status_text = "等待玩家加入" if not room.guest else (
-            "全部准备完成" if room.host_ready and room.guest_ready else "等待准备"
+            "全部准备完成" if host_ready and guest_ready else "等待准备"
         )
         status = self.font.render(status_text, True, (200, 200, 200))
         self.surface.blit(status, (20, 140))
         
         # 房主信息
         host_text = self.font.render(f"房主: {room.host.name}", True, (255, 255, 255))
-        host_ready = self.font.render(
-            "√ 已准备" if room.host_ready else "× 未准备",
-            True, (100, 255, 100) if room.host_ready else (255, 100, 100)
+        host_ready_text = self.font.render(
+            "√ 已准备" if host_ready else "× 未准备",
+            True, (100, 255, 100) if host_ready else (255, 100, 100)
         )
         self.surface.blit(host_text, (20, 60))
-        self.surface.blit(host_ready, (200, 60))
+        self.surface.blit(host_ready_text, (200, 60))
         
         # 客人信息
         if room.guest:
             guest_text = self.font.render(f"玩家: {room.guest.name}", True, (255, 255, 255))
-            guest_ready = self.font.render(
-                "√ 已准备" if room.guest_ready else "× 未准备",
-                True, (100, 255, 100) if room.guest_ready else (255, 100, 100)
+            guest_ready_text = self.font.render(
+                "√ 已准备" if guest_ready else "× 未准备",
+                True, (100, 255, 100) if guest_ready else (255, 100, 100)
             )
             self.surface.blit(guest_text, (20, 100))
-            self.surface.blit(guest_ready, (200, 100))
+            self.surface.blit(guest_ready_text, (200, 100))
         else:
             waiting_text = self.font.render("等待玩家加入...", True, (200, 200, 200))
             self.surface.blit(waiting_text, (20, 100))
@@ -648,21 +665,12 @@ class RoomOverlay:
                     elif name == 'start' and button.active:
                         # 发送开始游戏消息
                         try:
-                            self.network.send_data({
-                                'type': 'start_game',
-                                'room_id': self.network.current_room.room_id,
-                                'host_ip': self.network.current_room.host.ip
-                            })
-                            self.network.current_room.status = "游戏中"
+                            self.network.start_room_game()
                             print("已发送开始游戏消息")
                             return True  # 返回True触发游戏开始
                         except Exception as e:
                             print(f"发送开始游戏消息失败: {e}")
                     elif name == 'leave':
-                        self.network.send_data({
-                            'type': 'leave_room',
-                            'room_id': self.network.current_room.room_id,
-                            'player_ip': self.network.get_local_ip()
-                        })
+                        self.network.leave_current_room()
                         return True  # 返回True表示离开房间
         return False
\ No newline at end of file
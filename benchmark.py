@@ -0,0 +1,1506 @@
+import argparse
+import asyncio
+import base64
+import collections
+import contextlib
+import io
+import json
+import math
+import os
+import platform
+import random
+import selectors
+import socket
+import sys
+import threading
+import time
+import tracemalloc
+
+from board import Board, Gem, SpecialType, GEM_TYPES, GRID_SIZE, gem_type_names, load_state
+from animation import GemAnimator
+from ai import AIPlayer, apply_move, candidate_moves
+from network_manager import (MESSAGE_CODECS, RECV_BUFFER, SOCKET_RECV_BUFFER, NetworkManager, Player, Room,
+                             encode_message, decode_message, decode_packet)
+from match_server import MatchServer
+from constants import MIN_START_MOVES, MATCH_MOVES
+from spectator import MatchPublisher, MatchFeed
+from reliable_channel import ReliableChannel, SENDER_TIMEOUT
+from discovery import BeaconScheduler, MODE_LOBBY, MODE_HIDDEN, BEACON_INTERVAL
+from render_backend import OffscreenBackend
+
+# 基准套件的基线结果，与本文件放在一起
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'benchmark_baseline.json')
+
+
+class DictGem:
+    """旧版宝石对象的内存布局（普通类 + __dict__），仅用于对比"""
+    def __init__(self, type, row, col):
+        self.type = type
+        self.row = row
+        self.col = col
+        self.target_row = row
+        self.target_col = col
+        self.y = row * 60.0
+        self.x = col * 60.0
+        self.alpha = 255
+        self.scale = 1.0
+        self.removing = False
+        self.remove_timer = 1.0
+        self.moving = False
+        self.special_type = None
+        self.special_effect_angle = 0
+
+
+def measure(factory, count):
+    """返回 factory 创建 count 个对象后每个对象占用的字节数"""
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    objects = [factory(i) for i in range(count)]
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del objects
+    return (after - before) / count
+
+
+def find_swap(board, rng):
+    """随机找一个能形成匹配的交换"""
+    rows, cols = board.rows, board.cols
+    candidates = [(i, j, i, j + 1) for i in range(rows) for j in range(cols - 1)]
+    candidates += [(i, j, i + 1, j) for i in range(rows - 1) for j in range(cols)]
+    rng.shuffle(candidates)
+    for r1, c1, r2, c2 in candidates:
+        if board.is_valid_swap((r1, c1), (r2, c2)):
+            board.swap(r1, c1, r2, c2)
+            return True
+    return False
+
+
+def run_cascade(board):
+    """消除所有匹配直到棋盘稳定，返回连锁步数"""
+    steps = 0
+    while True:
+        matches, _ = board.find_matches()
+        if not matches:
+            return steps
+        for i, j in matches:
+            board.remove(i, j)
+        board.fill_empty()
+        steps += 1
+
+
+def bench_memory(args):
+    rng = random.Random(args.seed)
+    gem_types = ['FIRE', 'WATER', 'WIND', 'EARTH', 'LIGHT', 'SHADOW']
+
+    print("=== 内存基准 ===")
+    dict_gem = measure(lambda i: DictGem(gem_types[i % 6], 0, 0), 10000)
+    slot_gem = measure(lambda i: Gem(gem_types[i % 6]), 10000)
+    print(f"单个宝石: 旧版 {dict_gem:.0f} 字节, __slots__ {slot_gem:.0f} 字节")
+
+    def make_board(i):
+        board = Board(gem_types, GRID_SIZE, rng=random.Random(args.seed + i))
+        board.initialize()
+        return board
+
+    def make_spectator_board(i):
+        board = make_board(i)
+        animator = GemAnimator(GRID_SIZE, GRID_SIZE, 60, 0, 0)
+        animator.reset(board.type_codes())
+        return board, animator
+
+    per_board = measure(make_board, args.boards)
+    per_spectator = measure(make_spectator_board, args.boards)
+    print(f"每个棋盘(模拟器): {per_board:.0f} 字节")
+    print(f"每个棋盘(观战, 含动画数组): {per_spectator:.0f} 字节, "
+          f"{args.boards} 个共 {per_spectator * args.boards / 1024:.1f} KB")
+
+    # 连锁消除中的对象分配
+    board = make_board(0)
+    pool = board.pool
+    allocated_before = pool.allocated
+    reused_before = pool.reused
+    cascades = 0
+    steps = 0
+    tracemalloc.start()
+    for _ in range(args.cascades):
+        if not find_swap(board, rng):
+            board.initialize()
+            continue
+        steps += run_cascade(board)
+        cascades += 1
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    cascades = max(cascades, 1)
+    print(f"连锁次数: {cascades}, 平均步数: {steps / cascades:.2f}")
+    print(f"每次连锁新建宝石: {(pool.allocated - allocated_before) / cascades:.2f}, "
+          f"复用宝石: {(pool.reused - reused_before) / cascades:.2f}")
+    print(f"连锁过程内存峰值: {peak / 1024:.1f} KB, 结束时: {current / 1024:.1f} KB")
+
+
+def bench_generate(args):
+    print("=== 棋盘生成基准 ===")
+    timings = []
+    total_moves = 0
+    for seed in range(args.seed, args.seed + args.boards):
+        board = Board(rows=args.size)
+        start = time.perf_counter()
+        moves = board.initialize(min_moves=args.min_moves, seed=seed)
+        timings.append(time.perf_counter() - start)
+        total_moves += moves
+        assert not board.find_matches()[0], f"种子 {seed} 生成了初始匹配"
+
+    # 同一种子必须得到同一棋盘
+    first = Board(rows=args.size)
+    second = Board(rows=args.size)
+    first.initialize(min_moves=args.min_moves, seed=args.seed)
+    second.initialize(min_moves=args.min_moves, seed=args.seed)
+    deterministic = all(a.type == b.type for row_a, row_b in zip(first.grid, second.grid)
+                        for a, b in zip(row_a, row_b))
+
+    timings.sort()
+    print(f"{args.size}x{args.size}, {args.boards} 个棋盘, 至少 {args.min_moves} 个可行交换")
+    print(f"生成耗时: 平均 {sum(timings) / len(timings) * 1e6:.1f} us, "
+          f"中位 {timings[len(timings) // 2] * 1e6:.1f} us, 最大 {timings[-1] * 1e6:.1f} us")
+    print(f"平均可行交换: {total_moves / args.boards:.1f}, 结果可复现: {deterministic}")
+
+
+def bench_ai(args):
+    print("=== 电脑对手基准 ===")
+    ai = AIPlayer(rollouts=args.rollouts, depth=args.depth,
+                  time_budget=args.budget / 1000, workers=args.workers, seed=args.seed,
+                  cache_size=args.cache_size, eviction=args.eviction)
+    ai.start()
+    rng = random.Random(args.seed)
+
+    def play(choose):
+        board = Board(rng=random.Random(args.seed))
+        board.initialize(min_moves=3)
+        score = 0
+        timings = []
+        rollouts = []
+        hits = misses = memory = 0
+        for _ in range(args.moves):
+            start = time.perf_counter()
+            move = choose(board)
+            timings.append(time.perf_counter() - start)
+            if 'rollouts' in ai.last_stats:
+                rollouts.append(ai.last_stats.pop('rollouts'))
+            cache = ai.last_stats.pop('cache', None)
+            if cache:
+                hits += cache['hits']
+                misses += cache['misses']
+                memory = cache['memory_bytes']
+            if move is None:
+                board.initialize(min_moves=3)
+                continue
+            score += sum(step.score for step in apply_move(board, move))
+        lookups = hits + misses
+        return score, timings, rollouts, (hits / lookups if lookups else 0.0), memory
+
+    try:
+        ai_score, timings, rollouts, hit_rate, memory = play(ai.choose_move)
+    finally:
+        ai.close()
+    random_score, _, _, _, _ = play(lambda board: rng.choice(candidate_moves(board) or [None]))
+
+    print(f"{args.moves} 步, 每个候选 {args.rollouts} 次模拟, 深度 {args.depth}, "
+          f"预算 {args.budget} ms, 工作进程 {ai.workers}")
+    print(f"每步耗时: 平均 {sum(timings) / len(timings) * 1000:.1f} ms, "
+          f"最大 {max(timings) * 1000:.1f} ms, 平均完成 {sum(rollouts) / max(len(rollouts), 1):.0f} 次模拟")
+    print(f"得分: 电脑 {ai_score}, 随机走法 {random_score}")
+    if args.cache_size > 0:
+        print(f"置换表: 命中率 {hit_rate:.1%}, 内存 {memory / 1024:.1f} KB "
+              f"(容量 {args.cache_size}, 淘汰策略 {args.eviction})")
+    else:
+        print("置换表: 未使用")
+
+
+def time_per_call(func, repeat):
+    """返回 func 每次调用的平均耗时（秒）"""
+    start = time.perf_counter()
+    for _ in range(repeat):
+        func()
+    return (time.perf_counter() - start) / repeat
+
+
+def bench_scaling(args):
+    # 渲染在离屏 Surface 上进行，不需要显示设备
+    os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+    os.environ.setdefault('SDL_AUDIODRIVER', 'dummy')
+    import pygame
+    from game import CELL_SIZE, draw_grid
+
+    print("=== 棋盘规模基准 ===")
+    gem_types = gem_type_names(args.types)
+    # 超出的宝石种类没有图片，渲染时循环使用已有图片
+    image_types = [GEM_TYPES[i % len(GEM_TYPES)] for i in range(len(gem_types))]
+    sizes = args.sizes
+    results = {}
+    cascade_steps = {}
+    for size in sizes:
+        rng = random.Random(args.seed)
+        board = Board(gem_types, size, rng=rng)
+        board.initialize()
+        codes = board.type_codes()
+        cells = [(i, j) for i in range(size) for j in range(size)]
+        repeat = max(10, args.repeat * sizes[0] ** 2 // size ** 2)
+
+        def refill():
+            # 随机挖掉一成格子后下落补充，只计补充的时间，返回 (耗时, 移动的宝石数)
+            board.load_codes(codes)
+            for i, j in rng.sample(cells, len(cells) // 10):
+                board.remove(i, j)
+            start = time.perf_counter()
+            drops, spawns = board.fill_empty()
+            return time.perf_counter() - start, len(drops) + len(spawns)
+
+        def activate():
+            # 三种特殊符文各激活一次：计算影响范围并结算连锁，返回 (耗时, 连锁步数)
+            board.load_codes(codes)
+            steps = 0
+            start = time.perf_counter()
+            for special_type in (SpecialType.EXPLOSIVE, SpecialType.LINE, SpecialType.MAGIC):
+                row, col = rng.randrange(size), rng.randrange(size)
+                steps += len(board.resolve_cascade(
+                    initial_removal=board.special_area(row, col, special_type)))
+            return time.perf_counter() - start, steps
+
+        surface = pygame.Surface((size * CELL_SIZE, size * CELL_SIZE))
+        animator = GemAnimator(size, size, CELL_SIZE, 0, 0)
+        animator.reset(codes)
+
+        def render():
+            animator.step(1 / 60)
+            draw_grid(surface, animator, image_types)
+
+        # 大棋盘上一次激活引发的连锁步数更多、一个空位上方需要下落的宝石也更多，
+        # 这两项按实际工作量（连锁步数、移动的宝石数）折算成整盘耗时
+        activations = [activate() for _ in range(repeat)]
+        activation_steps = sum(steps for _, steps in activations)
+        cascade_steps[size] = activation_steps / repeat
+        refills = [refill() for _ in range(repeat)]
+        moved = sum(count for _, count in refills)
+
+        board.load_codes(codes)
+        results[size] = {
+            '查找匹配': time_per_call(board.find_matches, repeat),
+            '下落补充': sum(elapsed for elapsed, _ in refills) / moved * size ** 2,
+            '特殊符文': sum(elapsed for elapsed, _ in activations) / activation_steps,
+            '渲染一帧': time_per_call(render, max(3, repeat // 10))
+        }
+
+    operations = list(results[sizes[0]])
+    print(f"{len(gem_types)} 种宝石, 每格耗时 (us)，下落补充按每颗移动的宝石计，特殊符文按每个连锁步计:")
+    print("棋盘".ljust(8) + "".join(name.ljust(10) for name in operations) + "激活连锁步数")
+    for size in sizes:
+        row = "".join(f"{results[size][name] / size ** 2 * 1e6:<14.3f}" for name in operations)
+        print(f"{size}x{size}".ljust(10) + row + f"{cascade_steps[size]:.1f}")
+
+    # 总耗时对格子数的对数斜率，接近 1 表示线性增长
+    first, last = sizes[0], sizes[-1]
+    ratio = math.log(last ** 2 / first ** 2)
+    for name in operations:
+        slope = math.log(results[last][name] / results[first][name]) / ratio
+        verdict = "近线性" if slope <= args.max_slope else "超线性"
+        print(f"{name}: 增长指数 {slope:.2f} ({verdict})")
+
+
+def bench_chain(args):
+    print("=== 特殊符文连锁基准 ===")
+    rng = random.Random(args.seed)
+    patterns = {
+        '爆炸': [SpecialType.EXPLOSIVE],
+        '直线': [SpecialType.LINE],
+        '魔法球': [SpecialType.MAGIC],
+        '混合': [SpecialType.EXPLOSIVE, SpecialType.LINE, SpecialType.MAGIC]
+    }
+    for size in args.sizes:
+        board = Board(rows=size, rng=random.Random(args.seed))
+        board.initialize()
+        base = board.type_codes()
+        print(f"{size}x{size}, 每个格子都是特殊符文:")
+        for name, specials in patterns.items():
+            # 最坏情况：整盘都是特殊符文，引爆一个会波及全部
+            codes = [[(type_code, rng.choice(specials).value) for type_code, _ in row]
+                     for row in base]
+            board.load_codes(codes)
+            origin = [(rng.randrange(size), rng.randrange(size))]
+            removed, triggered = board.chain_area(origin)
+            chain_time = time_per_call(lambda: board.chain_area(origin), args.repeat)
+
+            def resolve():
+                board.load_codes(codes)
+                start = time.perf_counter()
+                board.resolve_cascade(initial_removal=origin)
+                return time.perf_counter() - start
+            resolve_time = sum(resolve() for _ in range(args.repeat)) / args.repeat
+
+            print(f"  {name}: 引爆 {len(triggered)} 个符文, 消除 {len(removed)} 格, "
+                  f"连锁计算 {chain_time * 1e6:.1f} us, 含补充的完整结算 {resolve_time * 1e6:.1f} us")
+
+
+def bench_swap(args):
+    print("=== 交换检查基准 ===")
+    for size in args.sizes:
+        board = Board(rows=size, rng=random.Random(args.seed))
+        board.initialize()
+        pairs = [((i, j), (i, j + 1)) for i in range(size) for j in range(size - 1)]
+        pairs += [((i, j), (i + 1, j)) for i in range(size - 1) for j in range(size)]
+
+        def full_scan():
+            # 旧做法：先交换，整盘查找匹配，失败再换回
+            for (r1, c1), (r2, c2) in pairs:
+                board.swap(r1, c1, r2, c2)
+                board.find_matches()
+                board.swap(r1, c1, r2, c2)
+
+        def local_check():
+            for a, b in pairs:
+                board.is_valid_swap(a, b)
+
+        repeat = max(1, args.repeat // size)
+        full = time_per_call(full_scan, repeat) / len(pairs)
+        local = time_per_call(local_check, repeat) / len(pairs)
+        valid = sum(board.is_valid_swap(a, b) for a, b in pairs)
+        print(f"{size}x{size}: {len(pairs)} 个相邻交换, 其中可行 {valid} 个")
+        print(f"  整盘扫描 {full * 1e6:.2f} us/次, 局部检查 {local * 1e6:.2f} us/次, "
+              f"快 {full / local:.0f} 倍")
+
+
+def bench_loop(args):
+    os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+    os.environ.setdefault('SDL_AUDIODRIVER', 'dummy')
+    import pygame
+    from game import Game, FRAME_RATE, WINDOW_WIDTH, WINDOW_HEIGHT
+
+    print("=== 主循环基准 ===")
+    with contextlib.redirect_stdout(io.StringIO()):
+        game = Game(backend=OffscreenBackend(WINDOW_WIDTH, WINDOW_HEIGHT))
+        game.start_single_player()
+    game.moves = 10 ** 6
+    rng = random.Random(args.seed)
+
+    frames = 0
+    start = last_time = time.perf_counter()
+    ticks_before = game.timestep.ticks
+    with contextlib.redirect_stdout(io.StringIO()):
+        while time.perf_counter() - start < args.seconds:
+            # 模拟玩家：动画结束后随机走一步可行交换
+            if not game.animating:
+                moves = game.board.find_valid_moves()
+                if moves:
+                    (r1, c1), (r2, c2) = rng.choice(moves)
+                    game.swap_gems(r1, c1, r2, c2)
+                else:
+                    game.initialize_grid()
+            if args.load_ms:
+                time.sleep(args.load_ms / 1000)
+
+            now = time.perf_counter()
+            game.step_frame(now - last_time)
+            last_time = now
+            game.backend.present()
+            frames += 1
+            if not args.uncapped:
+                game.clock.tick(FRAME_RATE)
+    elapsed = time.perf_counter() - start
+    ticks = game.timestep.ticks - ticks_before
+
+    mode = "不限帧率" if args.uncapped else f"限制 {FRAME_RATE} 帧"
+    print(f"{mode}, 每帧额外负载 {args.load_ms} ms, 运行 {elapsed:.1f} 秒")
+    print(f"渲染: {frames / elapsed:.1f} 帧/秒")
+    print(f"模拟: {ticks / elapsed:.1f} 步/秒, 跳过 {game.timestep.skipped} 步")
+    pygame.quit()
+
+
+def bench_idle(args):
+    os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+    os.environ.setdefault('SDL_AUDIODRIVER', 'dummy')
+    import pygame
+    from game import Game, WINDOW_WIDTH, WINDOW_HEIGHT
+
+    print("=== 空闲主循环基准 ===")
+    with contextlib.redirect_stdout(io.StringIO()):
+        game = Game(backend=OffscreenBackend(WINDOW_WIDTH, WINDOW_HEIGHT))
+        if args.screen == 'board':
+            game.start_single_player()
+
+    # 到时间后投递退出事件，run() 结束时会调用 sys.exit
+    timer = threading.Timer(args.seconds, lambda: pygame.event.post(pygame.event.Event(pygame.QUIT)))
+    timer.start()
+    wall_start = time.perf_counter()
+    cpu_start = time.process_time()
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            game.run(idle_wait=not args.busy)
+    except SystemExit:
+        pass
+    wall = time.perf_counter() - wall_start
+    cpu = time.process_time() - cpu_start
+
+    screen = "主菜单" if args.screen == 'menu' else "静止棋盘"
+    mode = "每帧重绘" if args.busy else "空闲等待"
+    print(f"{screen}, {mode}, 运行 {wall:.1f} 秒")
+    print(f"刷新: {game.frame_count / wall:.1f} 帧/秒, CPU 占用 {cpu / wall:.1%}")
+
+
+def bench_spectate(args):
+    print("=== 观战增量基准 ===")
+    rng = random.Random(args.seed)
+    board = Board(rng=random.Random(args.seed))
+    board.initialize(min_moves=3)
+
+    # 模拟网络：按丢包率丢弃数据报，其余按发送顺序送达
+    queue = []
+
+    def send(data, ip):
+        if rng.random() >= args.loss:
+            queue.append(data)
+        return True
+
+    room_id, player_ip = '1718000000000', '192.168.1.10'
+    publisher = MatchPublisher(send, encode_message)
+    feed = MatchFeed(room_id, player_ip)
+    publisher.start(room_id, player_ip, board, 0, args.moves)
+    publisher.subscribe('spectator')
+    delta_bytes = []
+
+    def deliver():
+        while queue:
+            data = queue.pop(0)
+            message = decode_packet(data)
+            if message['type'] == 'board_delta':
+                delta_bytes.append(len(data))
+            if feed.receive(message):
+                # 观战端请求补发，请求本身也可能丢失
+                if rng.random() >= args.loss:
+                    publisher.send_keyframe(['spectator'])
+        # 补发间隔只在真实时间下有意义，模拟时每步都允许请求
+        feed.last_resync = 0.0
+
+    deliver()
+    score = 0
+    in_sync = 0
+    for move_index in range(args.moves):
+        moves = candidate_moves(board)
+        if not moves:
+            board.initialize(min_moves=3)
+            publisher.send_keyframe()
+            deliver()
+            in_sync += feed.board.snapshot() == board.snapshot()
+            continue
+        move = rng.choice(moves)
+        steps = apply_move(board, move)
+        score += sum(step.score for step in steps)
+        publisher.publish_move(move, steps, score, args.moves - move_index - 1)
+        deliver()
+        in_sync += feed.board is not None and feed.board.snapshot() == board.snapshot()
+
+    keyframe_bytes = len(encode_message(publisher.keyframe()))
+    state_bytes = len(encode_message({'type': 'game_state', 'room_id': '1718000000',
+                                      'player_ip': '192.168.1.10', 'score': score, 'moves_left': 0}))
+    print(f"{args.moves} 步, 丢包率 {args.loss:.0%}, 每 {publisher.keyframe_interval} 步一个关键帧")
+    print(f"增量推送: 平均 {publisher.bytes_sent / args.moves:.0f} 字节/步 (含关键帧), "
+          f"二进制增量平均 {sum(delta_bytes) / max(len(delta_bytes), 1):.0f} 字节")
+    print(f"每步发送整盘: {keyframe_bytes} 字节/步")
+    print(f"旧的每帧广播分数: {state_bytes * 60} 字节/秒 (60 帧)")
+    print(f"同步: {in_sync / args.moves:.1%} 的步后观战棋盘与玩家一致, "
+          f"缺号 {feed.gaps} 次, 请求补发 {feed.resyncs} 次")
+
+
+def bench_control(args):
+    print("=== 控制消息可靠投递基准 ===")
+    rng = random.Random(args.seed)
+    clock = [0.0]
+    in_flight = []  # [(送达时间, 目标IP, 数据)]
+    wire = {'packets': 0, 'bytes': 0}
+
+    # 模拟网络：按丢包率丢弃，其余经过单程延迟后送达
+    def send(data, ip):
+        wire['packets'] += 1
+        wire['bytes'] += len(data)
+        if rng.random() >= args.loss:
+            in_flight.append((clock[0] + args.latency / 1000, ip, data))
+        return True
+
+    ips = ('192.168.1.10', '192.168.1.11')
+    channels = {ip: ReliableChannel(send, encode_message, ip, clock=lambda: clock[0]) for ip in ips}
+    delivered = {}  # (发送方, 序号) -> 送达时间
+    sent_at = {}
+
+    def deliver():
+        in_flight.sort(key=lambda item: item[0])
+        while in_flight and in_flight[0][0] <= clock[0]:
+            _, ip, data = in_flight.pop(0)
+            message = decode_message(data)
+            channel = channels[ip]
+            if message['type'] == 'ack':
+                channel.handle_ack(message)
+            elif channel.receive(message, message['rel_from']):
+                key = (message['rel_from'], message['rel_seq'])
+                delivered[key] = clock[0] - sent_at[key]
+
+    # 一局房间会话的控制消息：加入、反复切换准备、开始、结果、离开，两方交替发送
+    session = ['join_request'] + ['ready_state'] * 6 + ['start_game', 'game_result', 'leave_room']
+    step = 0.01
+    for index in range(args.messages):
+        sender, receiver = (ips[0], ips[1]) if index % 2 else (ips[1], ips[0])
+        message = {'type': session[index % len(session)], 'room_id': '1718000000',
+                   'player_ip': sender, 'is_ready': True, 'is_host': sender == ips[0]}
+        seq = channels[sender].send_message(message, receiver)
+        sent_at[(sender, seq)] = clock[0]
+        # 下一条消息前推进一段时间
+        for _ in range(int(args.interval / step)):
+            clock[0] += step
+            deliver()
+            for channel in channels.values():
+                channel.poll()
+    while any(not channel.idle() for channel in channels.values()) or in_flight:
+        clock[0] += step
+        deliver()
+        for channel in channels.values():
+            channel.poll()
+
+    reliable_rate = len(delivered) / args.messages
+    latencies = sorted(delivered.values())
+    retransmits = sum(channel.retransmits for channel in channels.values())
+    duplicates = sum(channel.duplicates for channel in channels.values())
+    print(f"{args.messages} 条控制消息, 丢包率 {args.loss:.0%}, 单程延迟 {args.latency:.0f} ms")
+    print(f"可靠通道: 送达 {reliable_rate:.1%}, {wire['packets']} 个数据报 (含确认), "
+          f"{wire['bytes']} 字节, 重传 {retransmits} 次, 去重 {duplicates} 次")
+    if latencies:
+        print(f"送达延迟: 中位 {latencies[len(latencies) // 2] * 1000:.0f} ms, "
+              f"最大 {latencies[-1] * 1000:.0f} ms")
+
+    # 旧做法：每条控制消息广播一次，再广播一次完整房间状态，局域网内每台主机都要接收
+    room_bytes = len(encode_message({
+        'type': 'room', 'room_id': '1718000000', 'host_name': 'host', 'host_ip': ips[0],
+        'status': '准备中', 'guest': 'guest', 'guest_ip': ips[1],
+        'host_ready': True, 'guest_ready': False}))
+    control_bytes = len(encode_message({'type': 'ready_state', 'room_id': '1718000000',
+                                        'player_ip': ips[0], 'is_ready': True, 'is_host': True}))
+    once_rate = 1 - args.loss
+    print(f"广播一次: 送达 {once_rate:.1%}, 每台主机接收 {args.messages * 2} 个数据报, "
+          f"{args.messages * (control_bytes + room_bytes)} 字节")
+    # 靠重复广播达到同样的送达率需要的次数
+    target = min(reliable_rate, 0.999)
+    if 0 < args.loss < 1 and target > once_rate:
+        repeats = math.ceil(math.log(1 - target) / math.log(args.loss))
+        print(f"重复广播 {repeats} 次达到 {target:.1%}: 每台主机接收 {args.messages * 2 * repeats} 个数据报, "
+              f"{args.messages * (control_bytes + room_bytes) * repeats} 字节")
+
+
+def bench_discovery(args):
+    print("=== 发现信标基准 ===")
+    rng = random.Random(args.seed)
+    clock = [0.0]
+    sent = []  # 每个信标的发送时间
+
+    # 每台主机一个调度器，假设都已发现其他所有主机
+    schedulers = [BeaconScheduler(lambda: sent.append(clock[0]), lambda: args.hosts - 1,
+                                  clock=lambda: clock[0], rng=random.Random(rng.random()))
+                  for _ in range(args.hosts)]
+    # 主机陆续启动，打开大厅的比例由 --lobby 决定
+    for scheduler in schedulers:
+        scheduler.next_time = rng.uniform(0, BEACON_INTERVAL)
+        scheduler.set_mode(MODE_LOBBY if rng.random() < args.lobby else MODE_HIDDEN)
+
+    step = 0.01
+    while clock[0] < args.seconds:
+        clock[0] += step
+        for scheduler in schedulers:
+            scheduler.tick()
+
+    # 稳定后（跳过启动时的快速信标）每秒的信标数和最忙的一秒
+    settled = [t for t in sent if t >= args.seconds / 2]
+    window = args.seconds - args.seconds / 2
+    per_second = {}
+    for t in settled:
+        per_second[int(t)] = per_second.get(int(t), 0) + 1
+    rate = len(settled) / window
+    old_rate = args.hosts / 2.0
+    print(f"{args.hosts} 台主机, {args.lobby:.0%} 打开大厅, 模拟 {args.seconds:.0f} 秒")
+    print(f"信标: 局域网合计 {rate:.1f} 个/秒, 最忙的一秒 {max(per_second.values(), default=0)} 个, "
+          f"每台主机每秒接收 {rate:.1f} 个")
+    print(f"旧的每 2 秒广播: 局域网合计 {old_rate:.1f} 个/秒")
+
+
+def wait_until(condition, timeout):
+    """轮询直到 condition() 为真，返回是否在 timeout 秒内满足"""
+    deadline = time.perf_counter() + timeout
+    while not condition():
+        if time.perf_counter() > deadline:
+            return False
+        time.sleep(0.005)
+    return True
+
+
+def bench_rooms(args):
+    print("=== 多房间会话基准 ===")
+    # 同一台机器上的两个实例：一个代为主持所有房间，一个代为加入，经本机回环通信
+    with contextlib.redirect_stdout(io.StringIO()):
+        host = NetworkManager(port=0)
+        guest = NetworkManager(port=0)
+        announcer = host.socket
+        rooms = [Room(Player(f"host{i}", '127.0.0.1')) for i in range(args.rooms)]
+        room_ids = [room.room_id for room in rooms]
+        host_sessions = [host.host_room(room) for room in rooms]
+        # 发现消息走组播，这里直接单播给加入方的公共端口；突发时接收缓冲可能
+        # 溢出，没收到的房间再通告一次
+        deadline = time.perf_counter() + args.timeout
+        missing = rooms
+        while missing and time.perf_counter() < deadline:
+            for room in missing:
+                announcer.sendto(encode_message(host.room_message(room)), ('127.0.0.1', guest.port))
+            time.sleep(0.1)
+            missing = [room for room in rooms if room.room_id not in guest.rooms]
+
+        def guest_session(i):
+            return guest.sessions.get(room_ids[i])
+
+        phases = []
+
+        # 执行一个阶段，等待每个房间都满足 check(房间序号)
+        def phase(name, action, check):
+            start = time.perf_counter()
+            action()
+            done = wait_until(lambda: all(check(i) for i in range(args.rooms)), args.timeout)
+            count = sum(1 for i in range(args.rooms) if check(i))
+            phases.append((name, time.perf_counter() - start, count, done))
+
+        def join():
+            for room_id in room_ids:
+                guest.join_room(room_id, '127.0.0.1', host.port, local=False)
+        phase("加入", join, lambda i: host_sessions[i].peer_port is not None
+              and guest_session(i) is not None and guest_session(i).peer_port is not None)
+
+        def ready():
+            for room_id in room_ids:
+                host.send_ready_state(True, room_id)
+                guest.send_ready_state(True, room_id)
+        phase("准备", ready, lambda i: host_sessions[i].opponent_ready
+              and guest_session(i) is not None and guest_session(i).opponent_ready)
+
+        phase("开始", lambda: [host.start_room_game(room_id) for room_id in room_ids],
+              lambda i: guest_session(i) is not None and guest_session(i).room.status == "游戏中")
+
+        # 游戏状态不经过可靠通道，统计最后一次状态到达的房间
+        def states():
+            for step in range(1, args.states + 1):
+                for room_id in room_ids:
+                    guest.broadcast_game_state(step * 10, args.states - step, room_id)
+        phase("对局状态", states, lambda i: host_sessions[i].opponent_score == args.states * 10)
+
+        phase("结果", lambda: [guest.broadcast_game_result(True, room_id) for room_id in room_ids],
+              lambda i: host_sessions[i].opponent_result is True)
+
+        phase("离开", lambda: [guest.leave_room(room_id) for room_id in room_ids],
+              lambda i: rooms[i].guest is None and not guest.sessions)
+
+    print(f"{args.rooms} 个房间, 每个房间 {args.states} 次对局状态, 经本机回环")
+    for name, elapsed, count, done in phases:
+        print(f"{name}: {elapsed * 1000:.0f} ms, 完成 {count}/{args.rooms} 个房间"
+              f"{'' if done else '（超时）'}")
+    for name, manager in (("主持方", host), ("加入方", guest)):
+        channel = manager.reliable
+        print(f"{name}: 可靠消息 {channel.sent} 条, 确认 {channel.acks} 个, "
+              f"重传 {channel.retransmits} 次, 失败 {channel.failures} 次, "
+              f"剩余会话 {len(manager.sessions)} 个")
+
+
+def bench_server(args):
+    print("=== 比赛服务器基准 ===")
+    rng = random.Random(args.seed)
+    # 服务器在后台线程的事件循环中运行
+    loop = asyncio.new_event_loop()
+    transport, server = loop.run_until_complete(
+        loop.create_datagram_endpoint(MatchServer, local_addr=('127.0.0.1', 0)))
+    server_addr = ('127.0.0.1', transport.get_extra_info('sockname')[1])
+    threading.Thread(target=loop.run_forever, daemon=True).start()
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        # 两个客户端实例，各自代表每局比赛中的一方，棋盘与客户端相同方式生成
+        managers = [NetworkManager(port=0), NetworkManager(port=0)]
+        clients = []  # (管理器, 会话, 棋盘)
+        for _ in range(args.matches):
+            room = Room(Player("host", '127.0.0.1'))
+            for index, manager in enumerate(managers):
+                session = manager.open_session(room, is_host=index == 0)
+                board = Board()
+                board.initialize(min_moves=MIN_START_MOVES, seed=int(room.room_id))
+                clients.append((manager, session, board))
+        for manager in managers:
+            manager.match_server = server_addr
+        for manager, session, _ in clients:
+            manager.join_match(session.room_id)
+        wait_until(lambda: len(server.matches) == args.matches and
+                   all(len(match.players) == 2 for match in server.matches.values()), args.timeout)
+
+        def apply_resync(session, board):
+            message = session.resync
+            session.resync = None
+            load_state(base64.b64decode(message['state']), board)
+            board.rng = random.Random(message['seed'])
+
+        start = time.perf_counter()
+        cheats = 0
+        stuck = set()  # 有玩家无路可走的比赛，不会结束
+        for _ in range(MATCH_MOVES):
+            for manager, session, board in clients:
+                if session.resync:
+                    apply_resync(session, board)
+                moves = candidate_moves(board)
+                if not moves:
+                    stuck.add(session.room_id)
+                    continue
+                if rng.random() < args.cheat:
+                    # 提交一个不可行的交换，等服务器发回棋盘
+                    cheats += 1
+                    manager.send_match_move(('swap', (0, 0), (0, 0)), session.room_id)
+                    wait_until(lambda: session.resync is not None, args.timeout)
+                    apply_resync(session, board)
+                move = rng.choice(moves)
+                apply_move(board, move)
+                manager.send_match_move(move, session.room_id)
+        sent = time.perf_counter() - start
+        done = wait_until(lambda: all(session.server_result is not None for _, session, _ in clients
+                                      if session.room_id not in stuck), args.timeout)
+        elapsed = time.perf_counter() - start
+
+    # 每局结束时客户端和服务器的棋盘应当一致
+    consistent = 0
+    for _, session, board in clients:
+        player = server.matches[session.room_id].players.get(('127.0.0.1', session.port))
+        if player and player.board.snapshot() == board.snapshot():
+            consistent += 1
+    finished = sum(1 for match in server.matches.values() if match.finished)
+    loop.call_soon_threadsafe(loop.stop)
+
+    print(f"{args.matches} 局比赛, 每名玩家 {MATCH_MOVES} 步, {args.cheat:.0%} 的操作前插入无效操作")
+    print(f"提交用时 {sent:.2f} 秒, 全部结果送达 {elapsed:.2f} 秒{'' if done else '（超时）'}")
+    print(f"服务器: 处理 {server.moves} 个操作, 拒绝 {server.rejected} 个 (插入 {cheats} 个), "
+          f"平均每个操作 {server.apply_time / max(server.moves, 1) * 1000:.3f} ms, "
+          f"单核约 {server.moves / max(server.apply_time, 1e-9):.0f} 个操作/秒")
+    print(f"结束的比赛 {finished}/{args.matches}, 客户端与服务器棋盘一致 {consistent}/{len(clients)}, "
+          f"有玩家无路可走 {len(stuck)} 局")
+    print(f"服务器可靠消息: {server.reliable.sent} 条, 重传 {server.reliable.retransmits} 次")
+
+
+def udp_receive_errors():
+    """系统累计的 UDP 接收缓冲溢出丢包数（Linux），无法读取时为 None"""
+    try:
+        with open('/proc/net/snmp') as f:
+            header, values = [line.split() for line in f if line.startswith('Udp:')][:2]
+        return int(values[header.index('RcvbufErrors')])
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def resident_memory():
+    """本进程的常驻内存（MB，Linux），无法读取时为 None"""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 1024 / 1024
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def percentile(values, fraction):
+    """已排序列表的百分位数"""
+    return values[min(int(len(values) * fraction), len(values) - 1)] if values else 0.0
+
+
+class SimulatedPeer:
+    """负载测试中的一台模拟主机
+
+    用自己的回环地址（127.0.x.y）发送，被测实例看到的是不同的主机。按真实的
+    消息格式发送在线状态、自己主持的房间和开始游戏，并作为客人循环加入被测
+    实例主持的 guest_room：加入、准备、对局状态、离开。发送时按 loss 随机
+    丢弃；可靠消息带序号，用被测实例的确认测量往返延迟，不重传。restart()
+    模拟主机重启：换一个新的IP、epoch 和房间。
+    """
+
+    def __init__(self, index, target_port, rng, loss, guest_room):
+        self.address = f"127.0.{1 + index // 250}.{1 + index % 250}"
+        self.socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.socket.bind((self.address, 0))
+        self.target_port = target_port
+        self.rng = rng
+        self.loss = loss
+        self.guest_room = guest_room
+        self.session_port = None  # 被测实例的房间会话端口，收到房间回复后使用
+        self.sent = collections.Counter()  # 消息类型 -> 实际发出的个数
+        self.lost = collections.Counter()  # 消息类型 -> 模拟丢弃的个数
+        self.acks_sent = 0
+        self.restarts = 0
+        self.restart(index)
+
+    def restart(self, identity):
+        self.ip = f"10.{identity // 62500 % 250}.{identity // 250 % 250}.{1 + identity % 250}"
+        self.name = f"peer{identity}"
+        self.room_id = str(10 ** 12 + identity)
+        self.epoch = self.rng.getrandbits(31)
+        self.seq = 0
+        self.pending = {}  # 序号 -> 发送时间
+        self.restarts += 1
+
+    def send(self, message, reliable=False, port=None):
+        if reliable:
+            self.seq += 1
+            message = dict(message, rel_from=self.ip, rel_epoch=self.epoch, rel_seq=self.seq)
+            self.pending[self.seq] = time.perf_counter()
+        if self.rng.random() < self.loss:
+            self.lost[message['type']] += 1
+            return
+        self.sent[message['type']] += 1
+        self.socket.sendto(encode_message(message), ('127.0.0.1', port or self.target_port))
+
+    def presence(self):
+        self.send({'type': 'presence', 'name': self.name, 'ip': self.ip})
+
+    def announce(self, status):
+        self.send({'type': 'room', 'room_id': self.room_id, 'host_name': self.name,
+                   'host_ip': self.ip, 'status': status, 'guest': None, 'guest_ip': None,
+                   'host_ready': False, 'guest_ready': False})
+
+    def start_game(self):
+        self.send({'type': 'start_game', 'room_id': self.room_id, 'host_ip': self.ip}, reliable=True)
+
+    def guest_message(self, message_type, reliable=True, **fields):
+        """发给被测实例主持的房间，知道会话端口后直接发往会话"""
+        message = dict(fields, type=message_type, room_id=self.guest_room, player_ip=self.ip)
+        self.send(message, reliable, self.session_port)
+
+    def receive(self, latencies):
+        """处理被测实例发来的一个数据报：记录确认的往返时间，回确认"""
+        data, addr = self.socket.recvfrom(RECV_BUFFER)
+        message = decode_message(data)
+        if message['type'] == 'ack':
+            sent_at = self.pending.pop(message['ack_seq'], None) \
+                if message['ack_epoch'] == self.epoch else None
+            if sent_at is not None:
+                latencies.append(time.perf_counter() - sent_at)
+            return
+        if 'rel_seq' in message:
+            self.socket.sendto(encode_message({'type': 'ack', 'ack_epoch': message['rel_epoch'],
+                                               'ack_seq': message['rel_seq']}), addr)
+            self.acks_sent += 1
+        if message['type'] == 'room' and message.get('session_port'):
+            self.session_port = message['session_port']
+
+
+def bench_soak(args):
+    print("=== 网络负载与长时间运行测试 ===")
+    rng = random.Random(args.seed)
+    sink = open(os.devnull, 'w')
+    with contextlib.redirect_stdout(sink):
+        target = NetworkManager(port=0, recv_buffer=args.recv_buffer)
+        # 被测实例为每台模拟主机主持一个房间，由它作为客人循环加入
+        guest_rooms = [target.host_room(Room(Player("target", target.local_ip))).room_id
+                       for _ in range(args.peers)]
+    peers = [SimulatedPeer(index, target.port, random.Random(rng.random()), args.loss, guest_rooms[index])
+             for index in range(args.peers)]
+    addresses = {peer.address for peer in peers}
+
+    # 统计监听线程处理的、来自模拟主机的消息和每条消息的处理时间
+    handled = collections.Counter()
+    handle_time = [0.0]
+    handle_message = target.handle_message
+
+    def counting_handle(message, sock=None, addr=None):
+        start = time.perf_counter()
+        handle_message(message, sock, addr)
+        handle_time[0] += time.perf_counter() - start
+        if addr and addr[0] in addresses:
+            handled[message['type']] += 1
+    target.handle_message = counting_handle
+
+    # 模拟主机收到的确认和回复在另一个线程中处理
+    latencies = []
+    stop = threading.Event()
+    selector = selectors.DefaultSelector()
+    for peer in peers:
+        selector.register(peer.socket, selectors.EVENT_READ, peer)
+
+    def receive_loop():
+        while not stop.is_set():
+            for key, _ in selector.select(0.05):
+                try:
+                    key.data.receive(latencies)
+                except (OSError, ValueError, KeyError):
+                    pass
+    receiver = threading.Thread(target=receive_loop, daemon=True)
+
+    # 每台主机的下一次在线状态、房间通告和客人阶段，起始时间随机错开
+    cycle = args.cycle
+    next_presence = [rng.uniform(0, 1 / args.presence_rate) for _ in peers]
+    cycle_start = [rng.uniform(0, cycle) for _ in peers]
+    next_state = [0.0] * args.peers
+    phase = ['idle'] * args.peers
+    next_identity = args.peers
+    restart_times = []
+    samples = []
+    errors_before = udp_receive_errors()
+
+    step = 0.005
+    with contextlib.redirect_stdout(sink):
+        receiver.start()
+        start = time.perf_counter()
+        next_report = args.report
+        last_handled = 0
+        while True:
+            now = time.perf_counter() - start
+            if now >= args.seconds:
+                break
+            for index, peer in enumerate(peers):
+                if now >= next_presence[index]:
+                    next_presence[index] = now + rng.expovariate(args.presence_rate)
+                    peer.presence()
+                    peer.announce("游戏中" if phase[index] == 'playing' else "等待中")
+                # 客人阶段：一个周期内加入、准备、发送对局状态、离开
+                elapsed = now - cycle_start[index]
+                if elapsed < 0:
+                    continue
+                if phase[index] == 'idle':
+                    peer.session_port = None
+                    peer.guest_message('join_request', player_name=peer.name,
+                                       session_port=peer.socket.getsockname()[1])
+                    phase[index] = 'joined'
+                elif phase[index] == 'joined' and elapsed >= 0.1 * cycle:
+                    peer.guest_message('ready_state', is_ready=True, is_host=False)
+                    peer.start_game()
+                    phase[index] = 'playing'
+                elif phase[index] == 'playing':
+                    if elapsed >= 0.9 * cycle:
+                        peer.guest_message('leave_room')
+                        phase[index] = 'left'
+                    elif now >= next_state[index]:
+                        next_state[index] = now + 1 / args.state_rate
+                        peer.guest_message('game_state', reliable=False,
+                                           score=int(elapsed * 100), moves_left=30)
+                elif phase[index] == 'left' and elapsed >= cycle:
+                    cycle_start[index] += cycle
+                    phase[index] = 'idle'
+                    # 一部分主机在周期之间重启，换一个新的身份
+                    if rng.random() < args.churn * cycle:
+                        peer.restart(next_identity)
+                        next_identity += 1
+                        restart_times.append(now)
+            if now >= next_report:
+                total = sum(handled.values())
+                # 去重表只应记录当前的主机和超时之内重启掉的旧身份
+                senders_limit = args.peers + sum(1 for t in restart_times if now - t <= SENDER_TIMEOUT + 1)
+                samples.append((now, (total - last_handled) / args.report, len(target.players),
+                                len(target.rooms), len(target.sessions),
+                                (len(target.reliable.received), senders_limit),
+                                sum(len(target.store.items(kind)) for kind in ('player', 'room', 'match')),
+                                target.receive_stats()['queued_bytes'], resident_memory()))
+                last_handled = total
+                next_report += args.report
+            time.sleep(step)
+        time.sleep(0.5)  # 等待最后的消息和确认
+        stop.set()
+        receiver.join()
+        # 之后到达的消息不再处理，监听线程不再输出
+        target.handle_message = lambda message, sock=None, addr=None: None
+    errors_after = udp_receive_errors()
+
+    sent = collections.Counter()
+    lost = collections.Counter()
+    for peer in peers:
+        sent.update(peer.sent)
+        lost.update(peer.lost)
+    total_sent = sum(sent.values())
+    # 同一批中较旧的对局状态和在线状态被合并，不进入 handle_message
+    coalesced = collections.Counter(target.coalesced)
+    total_handled = sum(handled[kind] + coalesced[kind] for kind in sent)
+    print(f"{args.peers} 台模拟主机, {args.seconds:.0f} 秒, 模拟丢包率 {args.loss:.0%}, "
+          f"重启 {sum(peer.restarts - 1 for peer in peers)} 次")
+    print(f"{'消息类型':<14}{'发出':>8}{'模拟丢弃':>10}{'处理':>8}{'合并':>8}{'丢失':>8}")
+    for kind in sorted(sent, key=lambda kind: -sent[kind]):
+        print(f"{kind:<14}{sent[kind]:>8}{lost[kind]:>10}{handled[kind]:>8}{coalesced[kind]:>8}"
+              f"{sent[kind] - handled[kind] - coalesced[kind]:>8}")
+    print(f"接收循环: {total_handled / args.seconds:.0f} 条/秒, 平均每条处理 "
+          f"{handle_time[0] / max(sum(handled.values()), 1) * 1e6:.0f} us, "
+          f"丢失 {total_sent - total_handled} 条 ({(total_sent - total_handled) / max(total_sent, 1):.2%})")
+    stats = target.receive_stats()
+    print(f"接收批次: {stats['batches']} 批, 平均 {stats['mean_batch']:.1f} 条, 最大 {stats['max_batch']} 条, "
+          f"读到上限 {stats['full_batches']} 次, 接收缓冲 {stats['recv_buffer'] // 1024} KB")
+    if errors_before is not None and errors_after is not None:
+        print(f"系统接收缓冲溢出: {errors_after - errors_before} 个数据报")
+    acked = sorted(latencies)
+    reliable_sent = sum(sent[kind] for kind in ('join_request', 'ready_state', 'start_game', 'leave_room'))
+    print(f"可靠消息确认: {len(acked)}/{reliable_sent}, 往返延迟 "
+          f"p50 {percentile(acked, 0.5) * 1000:.1f} ms, p90 {percentile(acked, 0.9) * 1000:.1f} ms, "
+          f"p99 {percentile(acked, 0.99) * 1000:.1f} ms, 最大 {percentile(acked, 1.0) * 1000:.1f} ms")
+    print(f"被测实例: 可靠消息 {target.reliable.sent} 条, 重传 {target.reliable.retransmits} 次, "
+          f"失败 {target.reliable.failures} 次, 模拟主机回确认 {sum(peer.acks_sent for peer in peers)} 个")
+    print(f"{'时间':>6}{'条/秒':>8}{'玩家':>6}{'房间':>6}{'会话':>6}{'去重表/上限':>12}{'存储':>6}"
+          f"{'积压字节':>10}{'内存MB':>8}")
+    for now, rate, players, rooms, sessions, (senders, limit), stored, queued, memory in samples:
+        print(f"{now:>6.0f}{rate:>8.0f}{players:>6}{rooms:>6}{sessions:>6}{f'{senders}/{limit}':>12}{stored:>6}"
+              f"{queued if queued is not None else '-':>10}{memory if memory is not None else 0:>8.1f}")
+    over = [(now, senders, limit) for now, _, _, _, _, (senders, limit), *_ in samples if senders > limit]
+    if over:
+        print(f"去重表超出上限 {len(over)} 次，重启的主机没有被清理: " +
+              ", ".join(f"{now:.0f}s {senders}/{limit}" for now, senders, limit in over))
+        sys.exit(1)
+    print(f"去重表: 未超出上限（当前主机数加上 {SENDER_TIMEOUT:.0f} 秒内重启的旧身份）")
+
+
+def bench_lobby(args):
+    os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+    os.environ.setdefault('SDL_AUDIODRIVER', 'dummy')
+    import pygame
+    from battle_platform import BattlePlatform
+    from network_manager import NetworkManager, Player, Room
+
+    print("=== 对战大厅列表基准 ===")
+    backend = OffscreenBackend(800, 600)
+    pygame.font.init()
+    with contextlib.redirect_stdout(io.StringIO()):
+        network = NetworkManager()
+        platform_screen = BattlePlatform(backend.surface, network)
+    # 局域网活动：大量在线玩家和房间
+    # 直接写入状态存储，和监听线程收到广播时一样
+    players = [Player(f"player-{i}", f"10.0.{i // 250}.{i % 250}") for i in range(args.players)]
+    for player in players:
+        network.store.put('player', player.ip, player)
+    for i in range(args.rooms):
+        room = Room(players[i % len(players)])
+        room.room_id = str(1718000000 + i)
+        room.status = ("等待中", "准备中", "游戏中")[i % 3]
+        room.host_ready = room.guest_ready = False
+        network.store.put('room', room.room_id, room)
+
+    def frame():
+        start = time.perf_counter()
+        platform_screen.update()
+        platform_screen.draw()
+        backend.present()
+        return time.perf_counter() - start
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        cold = frame()
+        renders = platform_screen.player_list.renders + platform_screen.room_list.renders
+        still = [frame() for _ in range(args.frames)]
+        # 滚动：每帧滚动 20 像素，新出现的行需要渲染
+        scrolled = []
+        for _ in range(args.frames):
+            platform_screen.player_list.scroll(20)
+            platform_screen.room_list.scroll(20)
+            scrolled.append(frame())
+        # 每帧有一个房间的状态变化：只重建房间列表，玩家列表不动
+        rooms = network.store.values('room')
+        changed = []
+        for i in range(args.frames):
+            room = rooms[i % len(rooms)]
+            room.host_ready = not room.host_ready
+            network.store.put('room', room.room_id, room)
+            changed.append(frame())
+    scroll_renders = (platform_screen.player_list.renders + platform_screen.room_list.renders
+                      - renders)
+
+    print(f"{args.players} 名玩家, {args.rooms} 个房间")
+    print(f"首帧: {cold * 1000:.2f} ms, 渲染 {renders} 行")
+    print(f"静止: 平均 {sum(still) / len(still) * 1000:.3f} ms/帧")
+    print(f"滚动: 平均 {sum(scrolled) / len(scrolled) * 1000:.3f} ms/帧, "
+          f"每帧渲染 {scroll_renders / args.frames:.1f} 行")
+    print(f"每帧一个房间变化: 平均 {sum(changed) / len(changed) * 1000:.3f} ms/帧")
+
+
+def diff_pixels(surface, reference):
+    """返回两个同样大小的画面中颜色不同的像素数"""
+    import pygame
+    current = pygame.image.tobytes(surface, 'RGB')
+    expected = pygame.image.tobytes(reference, 'RGB')
+    if current == expected:
+        return 0
+    return sum(current[i:i + 3] != expected[i:i + 3] for i in range(0, len(current), 3))
+
+
+def bench_render(args):
+    os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+    os.environ.setdefault('SDL_AUDIODRIVER', 'dummy')
+    import pygame
+    from game import Game, WINDOW_WIDTH, WINDOW_HEIGHT
+
+    print("=== 离屏渲染基准 ===")
+    backend = OffscreenBackend(WINDOW_WIDTH, WINDOW_HEIGHT)
+    with contextlib.redirect_stdout(io.StringIO()):
+        game = Game(backend=backend)
+        game.start_single_player()
+        game.initialize_grid(seed=args.seed)
+    game.moves = 10 ** 6
+    rng = random.Random(args.seed)
+    for directory in (args.snapshot_dir, args.compare):
+        if directory and not os.path.isdir(directory):
+            if directory == args.compare:
+                print(f"对比目录不存在: {directory}")
+                sys.exit(1)
+            os.makedirs(directory)
+
+    # 模拟按固定步长推进，渲染画面只取决于种子和帧号
+    frame_times = []
+    snapshots = 0
+    mismatches = []
+    with contextlib.redirect_stdout(io.StringIO()):
+        for frame in range(args.frames):
+            if not game.animating:
+                moves = game.board.find_valid_moves()
+                if moves:
+                    (r1, c1), (r2, c2) = rng.choice(moves)
+                    game.swap_gems(r1, c1, r2, c2)
+                else:
+                    game.initialize_grid(seed=rng.getrandbits(32))
+            game.update(game.timestep.dt)
+
+            start = time.perf_counter()
+            game.draw()
+            frame_times.append(time.perf_counter() - start)
+            backend.present()
+
+            if frame % args.snapshot_every:
+                continue
+            name = f"frame_{frame:05d}.png"
+            if args.snapshot_dir:
+                backend.snapshot(os.path.join(args.snapshot_dir, name))
+                snapshots += 1
+            if args.compare:
+                path = os.path.join(args.compare, name)
+                if not os.path.exists(path):
+                    mismatches.append((name, "缺少参考图"))
+                    continue
+                reference = pygame.image.load(path)
+                if reference.get_size() != backend.surface.get_size():
+                    mismatches.append((name, f"尺寸不同 {reference.get_size()}"))
+                    continue
+                changed = diff_pixels(backend.surface, reference)
+                if changed > args.max_diff_pixels:
+                    mismatches.append((name, f"{changed} 个像素不同"))
+
+    frame_times.sort()
+    average = sum(frame_times) / len(frame_times)
+    p95 = frame_times[min(len(frame_times) - 1, int(len(frame_times) * 0.95))]
+    print(f"{WINDOW_WIDTH}x{WINDOW_HEIGHT}, {len(frame_times)} 帧")
+    print(f"每帧绘制: 平均 {average * 1000:.3f} ms, p95 {p95 * 1000:.3f} ms, "
+          f"最慢 {frame_times[-1] * 1000:.3f} ms ({1 / average:.0f} 帧/秒)")
+    if args.snapshot_dir:
+        print(f"已保存 {snapshots} 张截图到 {args.snapshot_dir}")
+    if args.compare:
+        if mismatches:
+            for name, reason in mismatches:
+                print(f"  {name}: {reason}")
+            print(f"与参考图不一致: {len(mismatches)} 张")
+            sys.exit(1)
+        print(f"与 {args.compare} 中的参考图一致")
+    pygame.quit()
+
+
+def measure_case(func, min_time, rounds=5, alloc_calls=20):
+    """重复调用 func，返回 (每秒次数, 每次调用的峰值分配字节)
+
+    计时分 rounds 轮，每轮至少 min_time 秒，取最快的一轮；分配量在 tracemalloc
+    下另外调用 alloc_calls 次，取每次调用期间内存峰值增量的平均值。
+    """
+    func()  # 预热
+    best = 0.0
+    for _ in range(rounds):
+        calls = 0
+        start = time.perf_counter()
+        while True:
+            func()
+            calls += 1
+            elapsed = time.perf_counter() - start
+            if elapsed >= min_time:
+                break
+        best = max(best, calls / elapsed)
+
+    tracemalloc.start()
+    total = 0
+    for _ in range(alloc_calls):
+        before = tracemalloc.get_traced_memory()[0]
+        tracemalloc.reset_peak()
+        func()
+        total += tracemalloc.get_traced_memory()[1] - before
+    tracemalloc.stop()
+    return best, total / alloc_calls
+
+
+def suite_cases(seed):
+    """基准套件的所有用例 [(名称, 函数), ...]，输入都由固定种子生成"""
+    os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+    os.environ.setdefault('SDL_AUDIODRIVER', 'dummy')
+    with contextlib.redirect_stdout(io.StringIO()):
+        import pygame
+        import game
+
+    cases = []
+    rng = random.Random(seed)
+    board = Board(rng=random.Random(seed))
+    board.initialize()
+    random_codes = board.type_codes()
+    size = board.rows
+
+    # 查找匹配：随机棋盘、整盘同色（全部匹配）、两两成对的条纹（扫描最长但没有匹配）
+    same_codes = [[(0, 0)] * size for _ in range(size)]
+    pair_codes = [[(((i // 2) + (j // 2)) % 2, 0) for j in range(size)] for i in range(size)]
+    for name, codes in (('random', random_codes), ('all_same', same_codes), ('pairs', pair_codes)):
+        match_board = Board()
+        match_board.load_codes(codes)
+        cases.append((f'find_matches.{name}', match_board.find_matches))
+
+    generate_seeds = iter(range(10 ** 9))
+    cases.append(('initialize', lambda: Board().initialize(min_moves=3, seed=next(generate_seeds))))
+
+    # 完整连锁：从同一个棋盘和随机数状态执行同一个交换
+    (r1, c1), (r2, c2) = board.find_valid_moves()[0]
+
+    def cascade():
+        board.rng = random.Random(seed)
+        board.load_codes(random_codes)
+        board.swap(r1, c1, r2, c2)
+        board.resolve_cascade()
+    cases.append(('cascade', cascade))
+
+    # 快照：打包（不使用缓存的快照）、从快照恢复、从类型编号列表恢复作为对比
+    board.load_codes(random_codes)
+    snapshot = board.snapshot()
+
+    def pack():
+        board.packed = None
+        board.snapshot()
+    cases.append(('board.snapshot', pack))
+    cases.append(('board.restore', lambda: board.restore(snapshot)))
+    cases.append(('board.load_codes', lambda: board.load_codes(random_codes)))
+
+    # 激活特殊符文：棋盘中央放一个对应的符文
+    for special_type in (SpecialType.EXPLOSIVE, SpecialType.LINE, SpecialType.MAGIC):
+        codes = [row[:] for row in random_codes]
+        codes[size // 2][size // 2] = (codes[size // 2][size // 2][0], special_type.value)
+
+        def activate(codes=codes):
+            board.rng = random.Random(seed)
+            board.load_codes(codes)
+            board.resolve_cascade(initial_removal=[(size // 2, size // 2)])
+        cases.append((f'special.{special_type.name.lower()}', activate))
+
+    # 渲染：单个宝石、整个棋盘和完整的游戏画面，画到离屏 Surface 上
+    surface = pygame.Surface((game.WINDOW_WIDTH, game.WINDOW_HEIGHT))
+    animator = GemAnimator(size, size, game.CELL_SIZE, 0, 0)
+    animator.reset(random_codes)
+    cases.append(('render.draw_gem', lambda: game.draw_gem(surface, 'FIRE', SpecialType.LINE, 0, 0)))
+    cases.append(('render.draw_grid', lambda: game.draw_grid(surface, animator, board.gem_types)))
+    with contextlib.redirect_stdout(io.StringIO()):
+        instance = game.Game(backend=OffscreenBackend(game.WINDOW_WIDTH, game.WINDOW_HEIGHT))
+        instance.start_single_player()
+    cases.append(('render.game_draw', instance.draw))
+
+    # 网络消息编解码
+    message = {
+        'type': 'room',
+        'room_id': '1718000000',
+        'host_name': 'player-host',
+        'host_ip': '192.168.1.10',
+        'status': '准备中',
+        'guest': 'player-guest',
+        'host_ready': True,
+        'guest_ready': False
+    }
+    for codec, (encode, decode) in MESSAGE_CODECS.items():
+        data = encode(message)
+        cases.append((f'codec.{codec}.encode', lambda encode=encode: encode(message)))
+        cases.append((f'codec.{codec}.decode', lambda decode=decode, data=data: decode(data)))
+    return cases
+
+
+def bench_suite(args):
+    print("=== 基准套件 ===")
+    # 游戏实例的网络线程会打印日志，测量期间屏蔽输出，结束后统一打印
+    with contextlib.redirect_stdout(io.StringIO()):
+        cases = [(name, func) for name, func in suite_cases(args.seed)
+                 if not args.only or any(pattern in name for pattern in args.only)]
+        results = {name: measure_case(func, args.min_time) for name, func in cases}
+
+    baseline = {}
+    if not args.save_baseline and os.path.exists(args.baseline):
+        with open(args.baseline, encoding='utf-8') as f:
+            baseline = json.load(f)['results']
+
+    regressions = []
+    print(f"{'用例':<24}{'次/秒':>14}{'分配(字节/次)':>16}   对比基线")
+    for name, (ops, alloc) in results.items():
+        results[name] = {'ops_per_sec': ops, 'alloc_bytes': alloc}
+
+        note = ""
+        if name in baseline:
+            base = baseline[name]
+            speed = ops / base['ops_per_sec'] - 1
+            note = f"速度 {speed:+.0%}"
+            if base['alloc_bytes']:
+                note += f", 分配 {alloc / base['alloc_bytes'] - 1:+.0%}"
+            # 分配量允许少量抖动（如哈希表扩容）
+            slower = speed < -args.tolerance
+            heavier = alloc > base['alloc_bytes'] * (1 + args.tolerance) + 256
+            if slower or heavier:
+                regressions.append(name)
+                note += "  <-- 退化"
+        print(f"{name:<24}{ops:>14,.0f}{alloc:>16,.0f}   {note}")
+
+    if args.save_baseline:
+        with open(args.baseline, 'w', encoding='utf-8') as f:
+            json.dump({
+                'python': platform.python_version(),
+                'platform': platform.platform(),
+                'results': results
+            }, f, indent=2, ensure_ascii=False)
+            f.write('\n')
+        print(f"基线已保存到 {args.baseline}")
+    elif not baseline:
+        print(f"没有基线文件 {args.baseline}，可用 --save-baseline 生成")
+    elif regressions:
+        print(f"性能退化: {', '.join(regressions)} (容差 {args.tolerance:.0%})")
+        sys.exit(1)
+    else:
+        print(f"与基线相比没有退化 (容差 {args.tolerance:.0%})")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="魔法符文消除基准测试")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    memory = subparsers.add_parser('memory', help="宝石对象和棋盘的内存占用")
+    memory.add_argument('--boards', type=int, default=100, help="同时存在的棋盘数")
+    memory.add_argument('--cascades', type=int, default=200, help="模拟的连锁次数")
+    memory.add_argument('--seed', type=int, default=1)
+    memory.set_defaults(func=bench_memory)
+
+    generate = subparsers.add_parser('generate', help="无初始匹配棋盘的生成耗时")
+    generate.add_argument('--boards', type=int, default=1000)
+    generate.add_argument('--size', type=int, default=GRID_SIZE)
+    generate.add_argument('--min-moves', type=int, default=3)
+    generate.add_argument('--seed', type=int, default=1)
+    generate.set_defaults(func=bench_generate)
+
+    ai = subparsers.add_parser('ai', help="电脑对手完整对局的每步耗时")
+    ai.add_argument('--moves', type=int, default=30)
+    ai.add_argument('--rollouts', type=int, default=16)
+    ai.add_argument('--depth', type=int, default=2)
+    ai.add_argument('--budget', type=float, default=80, help="每步思考时间（毫秒）")
+    ai.add_argument('--workers', type=int, default=None, help="进程数，0 表示不用进程池")
+    ai.add_argument('--cache-size', type=int, default=0, help="置换表条目上限，0 表示不用置换表")
+    ai.add_argument('--eviction', choices=['lru', 'fifo'], default='lru')
+    ai.add_argument('--seed', type=int, default=1)
+    ai.set_defaults(func=bench_ai)
+
+    scaling = subparsers.add_parser('scaling', help="棋盘从 8x8 到 64x64 时各操作的耗时增长")
+    scaling.add_argument('--sizes', type=int, nargs='+', default=[8, 16, 32, 64])
+    scaling.add_argument('--types', type=int, default=6, help="宝石种类数")
+    scaling.add_argument('--repeat', type=int, default=200, help="最小棋盘上每项的重复次数")
+    scaling.add_argument('--max-slope', type=float, default=1.2, help="判定为近线性的增长指数上限")
+    scaling.add_argument('--seed', type=int, default=1)
+    scaling.set_defaults(func=bench_scaling)
+
+    chain = subparsers.add_parser('chain', help="整盘特殊符文时的连锁引爆耗时")
+    chain.add_argument('--sizes', type=int, nargs='+', default=[8, 16, 32])
+    chain.add_argument('--repeat', type=int, default=200)
+    chain.add_argument('--seed', type=int, default=1)
+    chain.set_defaults(func=bench_chain)
+
+    swap = subparsers.add_parser('swap', help="判断交换是否可行的耗时")
+    swap.add_argument('--sizes', type=int, nargs='+', default=[8, 16, 32, 64])
+    swap.add_argument('--repeat', type=int, default=80)
+    swap.add_argument('--seed', type=int, default=1)
+    swap.set_defaults(func=bench_swap)
+
+    loop = subparsers.add_parser('loop', help="固定步长主循环的渲染帧率和模拟步率")
+    loop.add_argument('--seconds', type=float, default=5)
+    loop.add_argument('--uncapped', action='store_true', help="不限制渲染帧率")
+    loop.add_argument('--load-ms', type=float, default=0, help="每帧额外的模拟负载（毫秒）")
+    loop.add_argument('--seed', type=int, default=1)
+    loop.set_defaults(func=bench_loop)
+
+    idle = subparsers.add_parser('idle', help="无动画时主循环的刷新率和CPU占用")
+    idle.add_argument('--seconds', type=float, default=5)
+    idle.add_argument('--screen', choices=['menu', 'board'], default='menu')
+    idle.add_argument('--busy', action='store_true', help="关闭空闲等待，作为对比")
+    idle.set_defaults(func=bench_idle)
+
+    spectate = subparsers.add_parser('spectate', help="观战增量推送的流量和丢包恢复")
+    spectate.add_argument('--moves', type=int, default=500)
+    spectate.add_argument('--loss', type=float, default=0.1, help="模拟丢包率")
+    spectate.add_argument('--seed', type=int, default=1)
+    spectate.set_defaults(func=bench_spectate)
+
+    control = subparsers.add_parser('control', help="控制消息可靠投递的送达率和流量")
+    control.add_argument('--messages', type=int, default=200)
+    control.add_argument('--loss', type=float, default=0.2, help="模拟丢包率")
+    control.add_argument('--latency', type=float, default=5, help="单程延迟（毫秒）")
+    control.add_argument('--interval', type=float, default=0.5, help="两条控制消息之间的秒数")
+    control.add_argument('--seed', type=int, default=1)
+    control.set_defaults(func=bench_control)
+
+    discovery = subparsers.add_parser('discovery', help="大量主机时发现信标的局域网流量")
+    discovery.add_argument('--hosts', type=int, default=200)
+    discovery.add_argument('--lobby', type=float, default=0.5, help="打开大厅的主机比例")
+    discovery.add_argument('--seconds', type=float, default=240)
+    discovery.add_argument('--seed', type=int, default=1)
+    discovery.set_defaults(func=bench_discovery)
+
+    rooms = subparsers.add_parser('rooms', help="一个进程同时主持大量房间时的会话往返")
+    rooms.add_argument('--rooms', type=int, default=300)
+    rooms.add_argument('--states', type=int, default=10, help="每个房间发送的对局状态次数")
+    rooms.add_argument('--timeout', type=float, default=10, help="每个阶段最长等待的秒数")
+    rooms.set_defaults(func=bench_rooms)
+
+    match_server = subparsers.add_parser('server', help="比赛服务器同时运行很多局比赛时的校验耗时")
+    match_server.add_argument('--matches', type=int, default=48)
+    match_server.add_argument('--cheat', type=float, default=0.05, help="插入无效操作的比例")
+    match_server.add_argument('--timeout', type=float, default=20)
+    match_server.add_argument('--seed', type=int, default=1)
+    match_server.set_defaults(func=bench_server)
+
+    soak = subparsers.add_parser('soak', help="模拟大量主机向一个实例持续发送消息的负载和内存增长")
+    soak.add_argument('--peers', type=int, default=100)
+    soak.add_argument('--seconds', type=float, default=60)
+    soak.add_argument('--loss', type=float, default=0.0, help="模拟主机发送时的丢包率")
+    soak.add_argument('--presence-rate', type=float, default=0.5, help="每台主机每秒的在线状态和房间通告数")
+    soak.add_argument('--state-rate', type=float, default=10, help="对局中每秒的对局状态数")
+    soak.add_argument('--cycle', type=float, default=5, help="客人加入到离开一个周期的秒数")
+    soak.add_argument('--churn', type=float, default=0.02, help="每台主机每秒重启的概率")
+    soak.add_argument('--recv-buffer', type=int, default=SOCKET_RECV_BUFFER, help="被测实例的 SO_RCVBUF（字节）")
+    soak.add_argument('--report', type=float, default=5, help="记录一次内存和吞吐的间隔（秒）")
+    soak.add_argument('--seed', type=int, default=1)
+    soak.set_defaults(func=bench_soak)
+
+    lobby = subparsers.add_parser('lobby', help="大量玩家和房间时对战大厅的每帧耗时")
+    lobby.add_argument('--players', type=int, default=500)
+    lobby.add_argument('--rooms', type=int, default=300)
+    lobby.add_argument('--frames', type=int, default=300)
+    lobby.set_defaults(func=bench_lobby)
+
+    render = subparsers.add_parser('render', help="离屏渲染的每帧耗时，保存或对比截图")
+    render.add_argument('--frames', type=int, default=600)
+    render.add_argument('--snapshot-dir', help="把截图保存到此目录")
+    render.add_argument('--snapshot-every', type=int, default=60, help="每隔多少帧截图一次")
+    render.add_argument('--compare', help="与此目录中的参考截图逐像素对比")
+    render.add_argument('--max-diff-pixels', type=int, default=0, help="允许不同的像素数")
+    render.add_argument('--seed', type=int, default=1)
+    render.set_defaults(func=bench_render)
+
+    suite = subparsers.add_parser('suite', help="引擎、渲染和网络热点路径的基准套件，与基线对比")
+    suite.add_argument('--baseline', default=BASELINE_PATH, help="基线文件路径")
+    suite.add_argument('--save-baseline', action='store_true', help="把本次结果保存为基线")
+    suite.add_argument('--tolerance', type=float, default=0.3, help="判定为退化的相对变化")
+    suite.add_argument('--min-time', type=float, default=0.2, help="每轮计时的最短秒数")
+    suite.add_argument('--only', nargs='+', help="只运行名称包含这些字符串的用例")
+    suite.add_argument('--seed', type=int, default=1)
+    suite.set_defaults(func=bench_suite)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
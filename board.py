@@ -0,0 +1,685 @@
+import random
+import struct
+from collections import deque
+from enum import Enum
+
+# 默认棋盘大小
+GRID_SIZE = 8
+
+# 宝石类型名称（与 game.py 中的图片对应）
+GEM_TYPES = ['FIRE', 'WATER', 'WIND', 'EARTH', 'LIGHT', 'SHADOW']
+
+def gem_type_names(count):
+    """返回 count 种宝石类型名称，超出默认六种时补充编号名称"""
+    return GEM_TYPES[:count] + [f'TYPE{i}' for i in range(len(GEM_TYPES), count)]
+
+# 快照中每个格子占一个字节：高6位为类型编号+1（0表示空格），低2位为特殊符文
+MAX_SNAPSHOT_TYPES = 63
+
+# 存档格式：文件头 + 棋盘快照。文件头依次为标识、版本、行数、列数、宝石种类数、
+# 分数、剩余步数、当前连击、最大连击，小端序
+SAVE_MAGIC = b'SXSV'
+SAVE_VERSION = 1
+SAVE_HEADER = struct.Struct('<4sBBBBiiii')
+
+# 特殊符文类型
+class SpecialType(Enum):
+    NONE = 0
+    EXPLOSIVE = 1  # 爆炸符文
+    LINE = 2       # 直线符文
+    MAGIC = 3      # 魔法球
+
+class Gem:
+    """宝石只保存类型信息，位置和动画状态由棋盘和 GemAnimator 管理"""
+    __slots__ = ('type', 'special_type')
+
+    def __init__(self, type, special_type=SpecialType.NONE):
+        self.type = type
+        self.special_type = special_type
+
+    def __repr__(self):
+        return f"Gem({self.type}, {self.special_type.name})"
+
+class GemPool:
+    """宝石对象池，回收被消除的宝石，避免每次填充都分配新对象"""
+
+    def __init__(self):
+        self.free = []
+        self.allocated = 0  # 新建的宝石数量
+        self.reused = 0     # 从池中复用的次数
+
+    def acquire(self, gem_type, special_type=SpecialType.NONE):
+        if self.free:
+            gem = self.free.pop()
+            gem.type = gem_type
+            gem.special_type = special_type
+            self.reused += 1
+            return gem
+        self.allocated += 1
+        return Gem(gem_type, special_type)
+
+    def release(self, gem):
+        if gem is not None:
+            self.free.append(gem)
+
+    def stats(self):
+        return {
+            'allocated': self.allocated,
+            'reused': self.reused,
+            'free': len(self.free)
+        }
+
+class CascadeStep:
+    """连锁中的一步：消除、生成特殊符文、下落和补充，供渲染按顺序回放"""
+
+    def __init__(self, removed, specials, drops, spawns, combo, score, triggered=()):
+        self.removed = removed    # [(行, 列), ...] 被消除的格子
+        self.specials = specials  # {(行, 列): SpecialType} 原地升级的特殊符文
+        self.triggered = triggered  # [((行, 列), SpecialType), ...] 这一步被引爆的特殊符文
+        self.drops = drops        # [((行, 列), (新行, 列)), ...]
+        self.spawns = spawns      # [(行, 列, 起始行, 类型), ...]
+        self.combo = combo        # 这一步之后的连击数
+        self.score = score        # 这一步获得的分数
+
+    def __repr__(self):
+        return (f"CascadeStep(removed={len(self.removed)}, specials={len(self.specials)}, "
+                f"triggered={len(self.triggered)}, combo={self.combo}, score={self.score})")
+
+class Board:
+    """与渲染无关的棋盘逻辑，可用于游戏、模拟器和观战
+
+    rows、cols 为棋盘的行数和列数（cols 省略时为正方形棋盘），
+    宝石种类数由 gem_types 决定。
+    """
+
+    def __init__(self, gem_types=GEM_TYPES, rows=GRID_SIZE, cols=None, rng=None, pool=None):
+        self.gem_types = list(gem_types)
+        self.rows = rows
+        self.cols = rows if cols is None else cols
+        self.rng = rng or random
+        self.pool = pool or GemPool()
+        self.grid = [[None for _ in range(self.cols)] for _ in range(rows)]
+        self.type_index = {gem_type: i for i, gem_type in enumerate(self.gem_types)}
+
+        # Zobrist 哈希和置换表，默认关闭
+        self.zobrist = None
+        self.cache = None
+        self.hash = 0
+
+        # 最近一次 snapshot() 的结果，棋盘改变时作废
+        self.packed = None
+
+    def enable_hashing(self, zobrist, cache=None):
+        """开启增量维护的 Zobrist 哈希，给定 cache 时缓存匹配和可行交换"""
+        self.zobrist = zobrist
+        self.cache = cache
+        self.rehash()
+
+    def rehash(self):
+        """完整重新计算哈希"""
+        if self.zobrist:
+            self.hash = self.zobrist.hash_grid(self.grid)
+
+    def copy(self, rng=None):
+        """复制棋盘，用于搜索和模拟；新棋盘有自己的对象池，共享哈希表和缓存"""
+        board = Board(self.gem_types, self.rows, self.cols, rng=rng or self.rng)
+        board.grid = [[Gem(gem.type, gem.special_type) if gem else None for gem in row]
+                      for row in self.grid]
+        board.zobrist = self.zobrist
+        board.cache = self.cache
+        board.hash = self.hash
+        return board
+
+    def snapshot(self):
+        """返回棋盘的紧凑快照（bytes，每格一个字节，按行排列）
+
+        快照不可变，可以直接保存、比较或发送；棋盘没有改变时重复调用
+        返回同一个对象，不再重新打包。
+        """
+        if self.packed is None:
+            if len(self.gem_types) > MAX_SNAPSHOT_TYPES:
+                raise ValueError(f"快照最多支持 {MAX_SNAPSHOT_TYPES} 种宝石")
+            index = self.type_index
+            self.packed = bytes((index[gem.type] + 1) << 2 | gem.special_type.value if gem else 0
+                                for row in self.grid for gem in row)
+        return self.packed
+
+    def restore(self, snapshot):
+        """恢复到 snapshot() 保存的状态"""
+        if len(snapshot) != self.rows * self.cols:
+            raise ValueError(f"快照大小 {len(snapshot)} 与棋盘 {self.rows}x{self.cols} 不符")
+        self.clear()
+        acquire = self.pool.acquire
+        gem_types = self.gem_types
+        specials = list(SpecialType)
+        cols = self.cols
+        for i, row in enumerate(self.grid):
+            for j, code in enumerate(snapshot[i * cols:(i + 1) * cols]):
+                if code:
+                    row[j] = acquire(gem_types[(code >> 2) - 1], specials[code & 3])
+        self.packed = bytes(snapshot)
+        self.rehash()
+
+    def load_codes(self, codes):
+        """按 type_codes() 的结果恢复棋盘"""
+        self.clear()
+        for i, row in enumerate(codes):
+            for j, (type_code, special_code) in enumerate(row):
+                if type_code >= 0:
+                    self.grid[i][j] = self.pool.acquire(self.gem_types[type_code],
+                                                        SpecialType(special_code))
+        self.rehash()
+
+    def clear(self):
+        """清空棋盘，宝石回收到对象池"""
+        for row in self.grid:
+            for j, gem in enumerate(row):
+                if gem is not None:
+                    self.pool.release(gem)
+                    row[j] = None
+        self.hash = 0
+        self.packed = None
+
+    def initialize(self, min_moves=0, seed=None):
+        """单次构造没有初始匹配的棋盘
+
+        每个格子只从不会和左边、上边两个宝石连成三个的类型中选取，
+        不需要整盘重试。min_moves > 0 时再局部修改少量格子，保证至少
+        有 min_moves 个可行交换（无法满足时尽量接近）。给定 seed 时结果确定。
+        返回棋盘上可行交换的数量。
+        """
+        if seed is not None:
+            self.rng = random.Random(seed)
+
+        self.clear()
+        grid = self.grid
+        for i in range(self.rows):
+            for j in range(self.cols):
+                grid[i][j] = self.pool.acquire(self.rng.choice(self._allowed_types(i, j)))
+
+        move_count = len(self._valid_moves_in(range(self.rows), range(self.cols)))
+        if move_count < min_moves:
+            move_count = self._ensure_moves(min_moves, move_count)
+        self.rehash()
+        return move_count
+
+    def _allowed_types(self, row, col):
+        """不会与左边或上边已有宝石组成三连的类型"""
+        grid = self.grid
+        banned = set()
+        if col >= 2 and grid[row][col-1].type == grid[row][col-2].type:
+            banned.add(grid[row][col-1].type)
+        if row >= 2 and grid[row-1][col].type == grid[row-2][col].type:
+            banned.add(grid[row-1][col].type)
+        return [t for t in self.gem_types if t not in banned]
+
+    def _ensure_moves(self, min_moves, move_count):
+        """按随机顺序逐个尝试修改格子类型，直到可行交换足够"""
+        cells = [(i, j) for i in range(self.rows) for j in range(self.cols)]
+        self.rng.shuffle(cells)
+        for i, j in cells:
+            gem = self.grid[i][j]
+            original = gem.type
+            before = len(self._valid_moves_near(i, j))
+            best_type, best_gain = original, 0
+            for gem_type in self.gem_types:
+                if gem_type == original:
+                    continue
+                gem.type = gem_type
+                if self._has_match_at(i, j):
+                    continue
+                gain = len(self._valid_moves_near(i, j)) - before
+                if gain > best_gain:
+                    best_type, best_gain = gem_type, gain
+            gem.type = best_type
+            move_count += best_gain
+            if move_count >= min_moves:
+                break
+        return move_count
+
+    def _has_match_at(self, row, col):
+        """检查经过 (row, col) 的横向或纵向是否有三连"""
+        grid = self.grid
+        gem = grid[row][col]
+        if gem is None:
+            return False
+        gem_type = gem.type
+
+        count = 1
+        j = col - 1
+        while j >= 0 and grid[row][j] and grid[row][j].type == gem_type:
+            count += 1
+            j -= 1
+        j = col + 1
+        while j < self.cols and grid[row][j] and grid[row][j].type == gem_type:
+            count += 1
+            j += 1
+        if count >= 3:
+            return True
+
+        count = 1
+        i = row - 1
+        while i >= 0 and grid[i][col] and grid[i][col].type == gem_type:
+            count += 1
+            i -= 1
+        i = row + 1
+        while i < self.rows and grid[i][col] and grid[i][col].type == gem_type:
+            count += 1
+            i += 1
+        return count >= 3
+
+    def is_valid_swap(self, a, b):
+        """判断交换两个相邻格子能否形成匹配，不修改棋盘
+
+        只检查经过两个格子、距离2以内的行和列，耗时与棋盘大小无关。
+        假定棋盘当前没有匹配，可用于界面预览和电脑对手。
+        """
+        (row1, col1), (row2, col2) = a, b
+        if abs(row1 - row2) + abs(col1 - col2) != 1:
+            return False
+        if not (0 <= row1 < self.rows and 0 <= col1 < self.cols and
+                0 <= row2 < self.rows and 0 <= col2 < self.cols):
+            return False
+        gem1, gem2 = self.grid[row1][col1], self.grid[row2][col2]
+        if gem1 is None or gem2 is None or gem1.type == gem2.type:
+            return False
+        # 交换后 gem1 到 b、gem2 到 a；原位置换成了不同类型，不能计入连线
+        return (self._forms_line(row2, col2, gem1.type, a) or
+                self._forms_line(row1, col1, gem2.type, b))
+
+    def _forms_line(self, row, col, gem_type, skip):
+        """gem_type 放在 (row, col) 时是否与距离2以内的同类连成三个，skip 格不计入"""
+        grid = self.grid
+        count = 1
+        for j in (col - 1, col - 2):
+            gem = grid[row][j] if j >= 0 else None
+            if gem is None or gem.type != gem_type or (row, j) == skip:
+                break
+            count += 1
+        for j in (col + 1, col + 2):
+            gem = grid[row][j] if j < self.cols else None
+            if gem is None or gem.type != gem_type or (row, j) == skip:
+                break
+            count += 1
+        if count >= 3:
+            return True
+
+        count = 1
+        for i in (row - 1, row - 2):
+            gem = grid[i][col] if i >= 0 else None
+            if gem is None or gem.type != gem_type or (i, col) == skip:
+                break
+            count += 1
+        for i in (row + 1, row + 2):
+            gem = grid[i][col] if i < self.rows else None
+            if gem is None or gem.type != gem_type or (i, col) == skip:
+                break
+            count += 1
+        return count >= 3
+
+    def _valid_moves_in(self, rows, cols):
+        """返回指定范围内以 (行, 列) 为左上端点的可行交换"""
+        moves = []
+        for i in rows:
+            for j in cols:
+                if j + 1 < self.cols and self.is_valid_swap((i, j), (i, j + 1)):
+                    moves.append(((i, j), (i, j + 1)))
+                if i + 1 < self.rows and self.is_valid_swap((i, j), (i + 1, j)):
+                    moves.append(((i, j), (i + 1, j)))
+        return moves
+
+    def _valid_moves_near(self, row, col):
+        """可能受 (row, col) 类型影响的可行交换"""
+        return self._valid_moves_in(range(max(0, row - 3), min(self.rows, row + 3)),
+                                    range(max(0, col - 3), min(self.cols, col + 3)))
+
+    def find_valid_moves(self):
+        """返回所有能形成匹配的相邻交换 [((行, 列), (行, 列)), ...]"""
+        if self.cache is not None:
+            cached = self.cache.get('moves', self.hash)
+            if cached is not None:
+                return list(cached)
+        moves = self._valid_moves_in(range(self.rows), range(self.cols))
+        if self.cache is not None:
+            self.cache.put('moves', self.hash, tuple(moves))
+        return moves
+
+    def swap(self, row1, col1, row2, col2):
+        """交换两个格子上的宝石"""
+        grid = self.grid
+        gem1, gem2 = grid[row1][col1], grid[row2][col2]
+        if self.zobrist:
+            key = self.zobrist.key
+            self.hash ^= (key(row1, col1, gem1) ^ key(row2, col2, gem2) ^
+                          key(row1, col1, gem2) ^ key(row2, col2, gem1))
+        grid[row1][col1], grid[row2][col2] = gem2, gem1
+        self.packed = None
+
+    def remove(self, row, col):
+        """移除格子上的宝石"""
+        gem = self.grid[row][col]
+        if self.zobrist:
+            self.hash ^= self.zobrist.key(row, col, gem)
+        self.grid[row][col] = None
+        self.pool.release(gem)
+        self.packed = None
+
+    def find_matches(self):
+        """查找匹配的宝石并返回特殊符文信息"""
+        if self.cache is not None:
+            cached = self.cache.get('matches', self.hash)
+            if cached is not None:
+                return set(cached[0]), dict(cached[1])
+        matches, special_matches = self._scan_matches()
+        if self.cache is not None:
+            self.cache.put('matches', self.hash, (frozenset(matches), special_matches.copy()))
+        return matches, special_matches
+
+    def _scan_matches(self):
+        """扫描整个棋盘查找匹配"""
+        grid = self.grid
+        rows, cols = self.rows, self.cols
+        matches = set()
+        special_matches = {}
+
+        # 检查水平匹配
+        for i in range(rows):
+            j = 0
+            while j < cols:
+                if not grid[i][j]:
+                    j += 1
+                    continue
+
+                current_type = grid[i][j].type
+                match_length = 1
+                k = j + 1
+
+                # 计算水平匹配长度
+                while k < cols and grid[i][k] and grid[i][k].type == current_type:
+                    match_length += 1
+                    k += 1
+
+                # 如果找到匹配
+                if match_length >= 3:
+                    matches.update((i, j+n) for n in range(match_length))
+
+                    # 根据匹配长度生成特殊符文
+                    if match_length == 4:
+                        special_matches[(i, j)] = SpecialType.EXPLOSIVE
+                    elif match_length == 5:
+                        special_matches[(i, j)] = SpecialType.LINE
+                    elif match_length >= 6:
+                        special_matches[(i, j)] = SpecialType.MAGIC
+
+                j = k
+
+        # 检查垂直匹配
+        for j in range(cols):
+            i = 0
+            while i < rows:
+                if not grid[i][j]:
+                    i += 1
+                    continue
+
+                current_type = grid[i][j].type
+                match_length = 1
+                k = i + 1
+
+                # 计算垂直匹配长度
+                while k < rows and grid[k][j] and grid[k][j].type == current_type:
+                    match_length += 1
+                    k += 1
+
+                # 如果找到匹配
+                if match_length >= 3:
+                    matches.update((i+n, j) for n in range(match_length))
+
+                    # 根据匹配长度生成特殊符文
+                    if match_length == 4:
+                        special_matches[(i, j)] = SpecialType.EXPLOSIVE
+                    elif match_length == 5:
+                        special_matches[(i, j)] = SpecialType.LINE
+                    elif match_length >= 6:
+                        special_matches[(i, j)] = SpecialType.MAGIC
+
+                i = k
+
+        return matches, special_matches
+
+    def fill_empty(self, spawn_types=None):
+        """宝石下落并在顶部补充新宝石
+
+        spawn_types 为按补充顺序（逐列从上到下）给出新宝石类型的迭代器，
+        省略时随机生成。返回 (drops, spawns)：drops 为 ((行, 列), (新行, 列)) 列表，
+        spawns 为 (行, 列, 起始行, 类型) 列表，供动画使用
+        """
+        grid = self.grid
+        zobrist = self.zobrist
+        drops = []
+        spawns = []
+
+        # 从下往上逐行扫描（按行访问，大棋盘上缓存更友好），记录每列下方的空位数
+        empty_counts = [0] * self.cols
+        for i in range(self.rows-1, -1, -1):
+            row = grid[i]
+            for j in range(self.cols):
+                gem = row[j]
+                if gem is None:
+                    empty_counts[j] += 1
+                elif empty_counts[j] > 0:
+                    # 如果上方有宝石且下方有空位，让宝石下落
+                    target = i + empty_counts[j]
+                    if zobrist:
+                        self.hash ^= zobrist.key(i, j, gem) ^ zobrist.key(target, j, gem)
+                    grid[target][j] = gem
+                    row[j] = None
+                    drops.append(((i, j), (target, j)))
+
+        # 在顶部添加新的宝石，从棋盘上方落下
+        for j, empty_count in enumerate(empty_counts):
+            for i in range(empty_count):
+                gem_type = next(spawn_types) if spawn_types is not None else self.rng.choice(self.gem_types)
+                grid[i][j] = self.pool.acquire(gem_type)
+                if zobrist:
+                    self.hash ^= zobrist.key(i, j, grid[i][j])
+                spawns.append((i, j, -empty_count+i, gem_type))
+
+        if drops or spawns:
+            self.packed = None
+        return drops, spawns
+
+    def special_area(self, row, col, special_type):
+        """返回特殊符文激活时影响的格子"""
+        grid = self.grid
+        affected_gems = set()
+
+        if special_type == SpecialType.EXPLOSIVE:
+            # 爆炸效果：影响3x3范围
+            for i in range(max(0, row-1), min(self.rows, row+2)):
+                for j in range(max(0, col-1), min(self.cols, col+2)):
+                    if grid[i][j]:
+                        affected_gems.add((i, j))
+
+        elif special_type == SpecialType.LINE:
+            # 直线效果：清除整行和整列，各扫描一遍
+            for i in range(self.rows):
+                if grid[i][col]:
+                    affected_gems.add((i, col))
+            for j in range(self.cols):
+                if grid[row][j]:
+                    affected_gems.add((row, j))
+
+        elif special_type == SpecialType.MAGIC:
+            # 魔法效果：清除所有同类型的宝石
+            target_type = grid[row][col].type
+            for i in range(self.rows):
+                for j in range(self.cols):
+                    if grid[i][j] and grid[i][j].type == target_type:
+                        affected_gems.add((i, j))
+
+        return affected_gems
+
+    def chain_area(self, cells, keep=()):
+        """扩展消除范围：范围内的特殊符文被引爆，波及的特殊符文继续引爆
+
+        用工作队列逐个处理被引爆的符文，visited 保证每个格子只处理一次；
+        已清除过的行、列和魔法球类型不再重复扫描，整个过程最多扫描棋盘
+        常数遍。keep 中的格子（如原地生成的新符文）不会被消除或引爆。
+        返回 (合并后的消除格子集合, [((行, 列), SpecialType), ...])。
+        """
+        grid = self.grid
+        rows, cols = self.rows, self.cols
+        none, line, magic = SpecialType.NONE, SpecialType.LINE, SpecialType.MAGIC
+        removed = {(i, j) for i, j in cells if grid[i][j] is not None}
+        worklist = deque(pos for pos in removed if grid[pos[0]][pos[1]].special_type is not none)
+        visited = set()
+        triggered = []
+        cleared_rows, cleared_cols, cleared_types = set(), set(), set()
+
+        while worklist:
+            pos = worklist.popleft()
+            if pos in visited:
+                continue
+            visited.add(pos)
+            row, col = pos
+            gem = grid[row][col]
+            special_type = gem.special_type
+            triggered.append((pos, special_type))
+
+            if special_type is line:
+                area = []
+                if row not in cleared_rows:
+                    cleared_rows.add(row)
+                    area.extend((row, j) for j in range(cols))
+                if col not in cleared_cols:
+                    cleared_cols.add(col)
+                    area.extend((i, col) for i in range(rows))
+            elif special_type is magic:
+                # 同类型的魔法球影响范围相同
+                if gem.type in cleared_types:
+                    continue
+                cleared_types.add(gem.type)
+                area = self.special_area(row, col, magic)
+            else:
+                area = [(i, j) for i in range(max(0, row-1), min(rows, row+2))
+                        for j in range(max(0, col-1), min(cols, col+2))]
+
+            for cell in area:
+                if cell in removed or cell in keep:
+                    continue
+                target = grid[cell[0]][cell[1]]
+                if target is None:
+                    continue
+                removed.add(cell)
+                if target.special_type is not none:
+                    worklist.append(cell)
+
+        return removed, triggered
+
+    def _apply_step(self, removed, specials, combo, score, triggered=(), spawn_types=None):
+        """执行一步消除并补充，返回对应的 CascadeStep"""
+        for (i, j), special_type in specials.items():
+            # 原地升级为特殊符文，不再分配新的宝石对象
+            gem = self.grid[i][j]
+            if self.zobrist:
+                self.hash ^= self.zobrist.key(i, j, gem)
+            gem.special_type = special_type
+            if self.zobrist:
+                self.hash ^= self.zobrist.key(i, j, gem)
+            self.packed = None
+        for i, j in removed:
+            self.remove(i, j)
+        drops, spawns = self.fill_empty(spawn_types)
+        return CascadeStep(removed, specials, drops, spawns, combo, score, triggered)
+
+    def replay_step(self, removed, specials, spawn_types):
+        """按记录的消除格子、特殊符文和新宝石类型重放一步，返回 CascadeStep
+
+        下落由消除的格子决定，不需要记录；用于观战端跟随对局。
+        """
+        return self._apply_step(removed, specials, 0, 0, spawn_types=iter(spawn_types))
+
+    def resolve_cascade(self, initial_removal=None):
+        """立即计算完整的连锁过程
+
+        initial_removal 为先行消除的格子（如激活的特殊符文所在格）。每一步
+        被消除的特殊符文都会引爆并连锁，所有波及的格子合并为一次消除。
+        棋盘直接变为最终状态，返回 CascadeStep 列表作为动画时间线。
+        """
+        steps = []
+        combo = 0
+
+        if initial_removal:
+            removed, triggered = self.chain_area(initial_removal)
+            steps.append(self._apply_step(sorted(removed), {}, combo, 0, triggered))
+
+        while True:
+            matches, special_matches = self.find_matches()
+            if not matches:
+                break
+
+            # 增加连击计数和分数
+            combo += 1
+            score = len(matches) * 10 + combo * 5
+
+            # 特殊符文留在原位，其余匹配的宝石被消除
+            specials = {}
+            for pos, special_type in special_matches.items():
+                if pos in matches:
+                    matches.remove(pos)
+                    specials[pos] = special_type
+            # 新符文所在格原有的特殊符文先引爆，格子保留下来再升级，不会被覆盖而丢失
+            armed = [pos for pos in specials if self.grid[pos[0]][pos[1]].special_type is not SpecialType.NONE]
+
+            # 匹配中已有的特殊符文被引爆，额外波及的宝石每个10分
+            removed, triggered = self.chain_area(list(matches) + armed, keep=specials)
+            removed.difference_update(armed)
+            score += (len(removed) - len(matches)) * 10
+
+            steps.append(self._apply_step(sorted(removed), specials, combo, score, triggered))
+
+        return steps
+
+    def type_codes(self):
+        """返回每个格子的 (类型编号, 特殊符文编号)，空格为 (-1, 0)"""
+        return [[(self.type_index[gem.type], gem.special_type.value) if gem else (-1, 0)
+                 for gem in row] for row in self.grid]
+
+
+def dump_state(board, score=0, moves=0, combo=0, max_combo=0):
+    """把棋盘和计分打包成存档格式的 bytes，8x8 棋盘共 88 字节"""
+    header = SAVE_HEADER.pack(SAVE_MAGIC, SAVE_VERSION, board.rows, board.cols,
+                              len(board.gem_types), score, moves, combo, max_combo)
+    return header + board.snapshot()
+
+
+def load_state(data, board=None, gem_types=None):
+    """解析 dump_state() 的结果，返回 (棋盘, 计分字典)
+
+    给定 board 时恢复到这个棋盘上（行列数和宝石种类数必须一致），
+    否则新建棋盘；gem_types 省略时使用默认名称。
+    """
+    if len(data) < SAVE_HEADER.size:
+        raise ValueError("存档数据不完整")
+    magic, version, rows, cols, type_count, score, moves, combo, max_combo = \
+        SAVE_HEADER.unpack_from(data)
+    if magic != SAVE_MAGIC:
+        raise ValueError("不是有效的存档数据")
+    if version != SAVE_VERSION:
+        raise ValueError(f"不支持的存档版本: {version}")
+    cells = data[SAVE_HEADER.size:]
+    if len(cells) != rows * cols:
+        raise ValueError("存档数据不完整")
+    if board is None and gem_types is not None and len(gem_types) != type_count:
+        raise ValueError(f"存档为 {type_count} 种宝石，与当前的 {len(gem_types)} 种不符")
+    # 每个非空格子的类型编号都必须在范围内，restore() 不再检查
+    for index, code in enumerate(cells):
+        if code and not 1 <= code >> 2 <= type_count:
+            raise ValueError(f"存档第 {index} 格的编码 {code} 无效")
+
+    if board is None:
+        board = Board(gem_types or gem_type_names(type_count), rows, cols)
+    elif (board.rows, board.cols, len(board.gem_types)) != (rows, cols, type_count):
+        raise ValueError(f"存档为 {rows}x{cols}、{type_count} 种宝石，与当前棋盘不符")
+    board.restore(cells)
+    return board, {'score': score, 'moves': moves, 'combo': combo, 'max_combo': max_combo}
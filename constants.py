@@ -4,4 +4,9 @@ class GameState(Enum):
     MENU = 0      # 菜单/大厅状态
     PLAYING = 1   # 游戏进行中
     PAUSED = 2    # 游戏暂停
-    GAME_OVER = 3 # 游戏结束
\ No newline at end of file
+    GAME_OVER = 3 # 游戏结束
+
+# 开局保证的最少可行交换数；比赛服务器用同样的参数生成棋盘，必须与客户端一致
+MIN_START_MOVES = 3
+# 联机对局每名玩家的步数
+MATCH_MOVES = 30
@@ -0,0 +1,116 @@
+import random
+import threading
+import time
+
+# 发现消息使用的组播组（本地管理范围），只在局域网内传播
+MULTICAST_GROUP = '239.255.55.55'
+MULTICAST_TTL = 1
+
+# 大厅可见时的基本信标间隔（秒）；局域网里主机越多，每台主机的间隔越长，
+# 使整个局域网每秒的信标数不超过 LAN_BEACON_RATE 左右
+BEACON_INTERVAL = 2.0
+LAN_BEACON_RATE = 5.0
+# 大厅不可见或正在对局时，间隔每次加倍，最长到 MAX_BEACON_INTERVAL
+MAX_BEACON_INTERVAL = 10.0
+# 按需发送的快速信标：间隔和个数
+FAST_INTERVAL = 0.3
+FAST_BEACONS = 3
+# 间隔的随机抖动比例，避免多台主机同时发送
+JITTER = 0.25
+# 连续丢失这么多个信标仍不算离线
+MISSED_BEACONS = 2
+
+# 信标模式：大厅可见、大厅不可见、正在对局
+MODE_LOBBY = 'lobby'
+MODE_HIDDEN = 'hidden'
+MODE_MATCH = 'match'
+
+
+def peer_timeout(peer_count):
+    """超过这个秒数没有收到信标的主机及其房间视为离线
+
+    按有 peer_count 台其他主机时最长的信标间隔（含抖动）计算，容忍连续丢失
+    MISSED_BEACONS 个信标。
+    """
+    longest = max(MAX_BEACON_INTERVAL, (peer_count + 1) / LAN_BEACON_RATE)
+    return (MISSED_BEACONS + 1) * longest * (1 + JITTER)
+
+
+class BeaconScheduler:
+    """发现信标的发送计划
+
+    send_beacon 为发送一次信标的函数，peer_count 返回已发现的其他主机数。
+    大厅可见时按基本间隔发送，主机多时按比例放慢；大厅不可见或正在对局时
+    逐次退避；刷新或重新打开大厅时连续发送几个快速信标。每次间隔都加上随机
+    抖动。
+    """
+
+    def __init__(self, send_beacon, peer_count=lambda: 0, clock=time.time, rng=None):
+        self.send_beacon = send_beacon
+        self.peer_count = peer_count
+        self.clock = clock
+        self.rng = rng or random.Random()
+        self.mode = MODE_HIDDEN
+        self.backoff_interval = BEACON_INTERVAL
+        self.fast_remaining = 1  # 启动时立即发送一次
+        self.next_time = clock()
+        self.wake = threading.Event()
+        self.thread = None
+        self.beacons = 0
+
+    def start(self):
+        """在后台线程中按计划发送信标，重复调用不会启动多个线程"""
+        if self.thread is None:
+            self.thread = threading.Thread(target=self.run, daemon=True)
+            self.thread.start()
+
+    def set_mode(self, mode):
+        """切换模式；重新打开大厅时立即发送快速信标"""
+        if mode == self.mode:
+            return
+        self.mode = mode
+        self.backoff_interval = BEACON_INTERVAL
+        if mode == MODE_LOBBY:
+            self.request_fast()
+        else:
+            self.next_time = self.clock() + self.interval()
+            self.wake.set()
+
+    def request_fast(self, count=FAST_BEACONS):
+        """按需连续发送几个快速信标，例如点击刷新时"""
+        self.fast_remaining = max(self.fast_remaining, count)
+        self.next_time = self.clock()
+        self.wake.set()
+
+    def interval(self):
+        """下一个信标前的间隔（未加抖动）"""
+        if self.fast_remaining > 0:
+            return FAST_INTERVAL
+        lan_interval = (self.peer_count() + 1) / LAN_BEACON_RATE
+        if self.mode == MODE_LOBBY:
+            return max(BEACON_INTERVAL, lan_interval)
+        return max(self.backoff_interval, lan_interval)
+
+    def tick(self):
+        """到时间时发送一个信标并安排下一个，返回距离下一个信标的秒数"""
+        now = self.clock()
+        if now < self.next_time:
+            return self.next_time - now
+        try:
+            self.send_beacon()
+            self.beacons += 1
+        except Exception as e:
+            print(f"发送信标失败: {e}")
+        if self.fast_remaining > 0:
+            self.fast_remaining -= 1
+        elif self.mode != MODE_LOBBY:
+            self.backoff_interval = min(self.backoff_interval * 2, MAX_BEACON_INTERVAL)
+        delay = self.interval() * (1 + self.rng.uniform(-JITTER, JITTER))
+        self.next_time = now + delay
+        return delay
+
+    def run(self):
+        while True:
+            # 先清除再计算，计算期间的唤醒请求不会丢失
+            self.wake.clear()
+            self.wake.wait(self.tick())
@@ -0,0 +1,91 @@
+import json
+import os
+
+import pygame
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# 优先使用随游戏附带的字体文件
+BUNDLED_FONT = os.path.join(SCRIPT_DIR, 'assets', 'simhei.ttf')
+
+# 没有附带字体时按顺序查找的系统中文字体
+CJK_FONT_NAMES = [
+    'SimHei',              # Windows 黑体
+    'Microsoft YaHei',     # Windows 微软雅黑
+    'PingFang SC',         # macOS 苹方
+    'Noto Sans CJK SC',    # Linux 思源黑体
+    'WenQuanYi Micro Hei', # Linux 文泉驿微米黑
+    'Heiti TC',            # macOS 黑体-繁
+    'Arial Unicode MS'     # 通用 Unicode 字体
+]
+
+# 查找结果缓存在用户缓存目录的这个文件里，之后启动时不再扫描系统字体；
+# 安装了新字体后删除此文件即可重新查找
+CACHE_DIR = os.path.join(os.environ.get('XDG_CACHE_HOME') or
+                         os.path.join(os.path.expanduser('~'), '.cache'), 'sanxiao')
+FONT_CACHE_PATH = os.path.join(CACHE_DIR, 'font_cache.json')
+
+_font_path = None
+_resolved = False
+_fonts = {}  # 字号 -> Font
+
+
+def find_cjk_font():
+    """扫描系统字体，返回第一个可用的中文字体文件路径，找不到时返回 None"""
+    for name in CJK_FONT_NAMES:
+        path = pygame.font.match_font(name)
+        if path:
+            return path
+    return None
+
+
+def load_cached_path():
+    """读取缓存的字体路径，返回 (是否有效, 路径)"""
+    try:
+        with open(FONT_CACHE_PATH, encoding='utf-8') as f:
+            path = json.load(f).get('path')
+    except (OSError, ValueError, AttributeError):
+        return False, None
+    # 缓存的字体文件已被删除时重新查找
+    if path is not None and not os.path.exists(path):
+        return False, None
+    return True, path
+
+
+def save_cached_path(path):
+    try:
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        with open(FONT_CACHE_PATH, 'w', encoding='utf-8') as f:
+            json.dump({'path': path}, f, ensure_ascii=False)
+    except OSError as e:
+        print(f"字体缓存写入失败: {e}")
+
+
+def font_path():
+    """中文字体文件路径（None 表示使用 pygame 默认字体），每次运行只确定一次"""
+    global _font_path, _resolved
+    if not _resolved:
+        if os.path.exists(BUNDLED_FONT):
+            _font_path = BUNDLED_FONT
+        else:
+            cached, path = load_cached_path()
+            if not cached:
+                path = find_cjk_font()
+                save_cached_path(path)
+            _font_path = path
+        _resolved = True
+        print(f"使用字体: {_font_path or '默认字体'}")
+    return _font_path
+
+
+def get_font(size):
+    """返回指定字号的共享 Font 对象"""
+    font = _fonts.get(size)
+    if font is None:
+        try:
+            font = pygame.font.Font(font_path(), size)
+        except Exception as e:
+            print(f"字体加载错误: {e}")
+            font = pygame.font.Font(None, size)
+        _fonts[size] = font
+    return font
@@ -1,13 +1,22 @@
 import pygame
+import base64
 import random
 import sys
 import math
 import os
-from enum import Enum
-from constants import GameState
+from collections import deque
+from constants import GameState, MIN_START_MOVES, MATCH_MOVES
 from network_manager import NetworkManager
 from network_lobby import NetworkLobby
 from battle_platform import BattlePlatform
+from animation import GemAnimator, FixedTimestep
+from render_backend import WindowBackend, prepare_surface
+from tournament_screen import TournamentScreen
+from discovery import MODE_LOBBY, MODE_HIDDEN, MODE_MATCH
+from match_server import SERVER_PORT
+from font_manager import get_font
+from board import Board, SpecialType, GRID_SIZE, dump_state, load_state
+from ai import AIPlayer, apply_move
 
 # 初始化 Pygame
 pygame.init()
@@ -15,33 +24,36 @@ pygame.init()
 # 游戏常量
 WINDOW_WIDTH = 800
 WINDOW_HEIGHT = 600
-GRID_SIZE = 8
 CELL_SIZE = 60
-GRID_OFFSET_X = (WINDOW_WIDTH - GRID_SIZE * CELL_SIZE) // 2
-GRID_OFFSET_Y = (WINDOW_HEIGHT - GRID_SIZE * CELL_SIZE) // 2
 
 # 动画常量
 ANIMATION_SPEED = 0.2
 FADE_SPEED = 0.001
 DROP_SPEED = 0.5  # 添加掉落速度常量
 
-# 设置显示模式
-screen = pygame.display.set_mode((WINDOW_WIDTH, WINDOW_HEIGHT))
-pygame.display.set_caption("魔法符文消除")
+# 模拟固定按每秒 SIM_RATE 步推进，渲染最高 FRAME_RATE 帧
+SIM_RATE = 60
+FRAME_RATE = 60
+MAX_TICKS_PER_FRAME = 5  # 每帧最多追赶的模拟步数，超出部分跳过
+
+# 空闲时（没有动画）阻塞等待事件的最长时间，超时后低频刷新一次
+IDLE_TIMEOUT_MS = 250
+
+# 网络线程收到消息时投递的事件，用于唤醒空闲的主循环
+NETWORK_EVENT = pygame.USEREVENT + 1
+
+# 电脑对手每步的思考时间（秒）
+AI_TIME_BUDGET = 0.08
 
 # 获取当前脚本的目录
 SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
 ASSETS_DIR = os.path.join(SCRIPT_DIR, 'assets')
 
-# 特殊符文类型
-class SpecialType(Enum):
-    NONE = 0
-    EXPLOSIVE = 1  # 爆炸符文
-    LINE = 2       # 直线符文
-    MAGIC = 3      # 魔法球
+# 单人游戏存档（F5 保存，F9 读取，启动时加 --resume 继续上次的进度）
+SAVE_PATH = os.path.join(SCRIPT_DIR, 'savegame.dat')
 
 # 定义宝石类型和对应的图片文件名
-GEM_TYPES = {
+GEM_IMAGE_FILES = {
     'FIRE': 'fire.png',
     'WATER': 'water.png',
     'WIND': 'wind.png',
@@ -53,14 +65,14 @@ GEM_TYPES = {
 # 加载图片
 def load_gem_images():
     images = {}
-    for gem_type, image_file in GEM_TYPES.items():
+    for gem_type, image_file in GEM_IMAGE_FILES.items():
         try:
             # 构建完整的图片路径
             image_path = os.path.join(ASSETS_DIR, image_file)
             print(f"尝试加载图片: {image_path}")
             
             # 加载图片
-            image = pygame.image.load(image_path).convert_alpha()
+            image = prepare_surface(pygame.image.load(image_path), alpha=True)
             # 缩放到合适的大小
             image = pygame.transform.scale(image, (CELL_SIZE-4, CELL_SIZE-4))
             
@@ -86,147 +98,136 @@ def load_gem_images():
             
     return images
 
-# 加载所有宝石图片
-GEM_IMAGES = load_gem_images()
-GEM_TYPES = list(GEM_TYPES.keys())  # 转换为列表以便随机选择
-
-class Gem:
-    def __init__(self, type, row, col):
-        self.type = type
-        self.row = row
-        self.col = col
-        self.target_row = row
-        self.target_col = col
-        self.y = row * CELL_SIZE + GRID_OFFSET_Y
-        self.x = col * CELL_SIZE + GRID_OFFSET_X
-        self.alpha = 255
-        self.scale = 1.0
-        self.removing = False
-        self.remove_timer = 1.0
-        self.moving = False
-        self.special_type = SpecialType.NONE
-        self.special_effect_angle = 0  # 用于特效动画
-
-    def update(self, dt):
-        # 更新位置
-        target_x = self.target_col * CELL_SIZE + GRID_OFFSET_X
-        target_y = self.target_row * CELL_SIZE + GRID_OFFSET_Y
-        
-        dx = target_x - self.x
-        dy = target_y - self.y
-        
-        if abs(dx) > 0.1 or abs(dy) > 0.1:
-            self.moving = True
-            self.x += dx * DROP_SPEED * dt * 60
-            self.y += dy * DROP_SPEED * dt * 60
-        else:
-            self.moving = False
-            self.x = target_x
-            self.y = target_y
-
-        # 更新特效动画
-        self.special_effect_angle += dt * 2  # 旋转特效
+# 宝石图片在第一次绘制时加载，此时显示窗口（如果有）已经创建，可以转换像素格式
+GEM_IMAGES = {}
+GEM_TYPES = list(GEM_IMAGE_FILES.keys())  # 转换为列表以便随机选择
 
-        # 更新消除动画
-        if self.removing:
-            self.remove_timer -= dt
-            progress = 1.0 - max(0, self.remove_timer)
-            self.alpha = 255 * (1.0 - progress)
-            self.scale = 1.0 - (progress * 0.5)
-            return self.remove_timer <= 0
-        return False
+def gem_image(gem_type):
+    if not GEM_IMAGES:
+        GEM_IMAGES.update(load_gem_images())
+    return GEM_IMAGES[gem_type]
 
-    def draw(self, screen):
-        if self.alpha <= 0:
-            return
-            
-        size = int(CELL_SIZE * self.scale)
-        if size <= 0:
-            return
-            
-        # 创建临时surface
-        temp_surface = pygame.Surface((size, size), pygame.SRCALPHA)
+def draw_gem(screen, gem_type, special_type, x, y, alpha=255, scale=1.0, effect_angle=0):
+    """在 (x, y) 处绘制宝石，动画参数由 GemAnimator 提供"""
+    if alpha <= 0:
+        return
         
-        # 获取并缩放宝石图片
-        original_image = GEM_IMAGES[self.type]
-        if size != CELL_SIZE:
-            scaled_image = pygame.transform.scale(original_image, (size, size))
-        else:
-            scaled_image = original_image
+    size = int(CELL_SIZE * scale)
+    if size <= 0:
+        return
         
-        # 绘制宝石
-        temp_surface.blit(scaled_image, (0, 0))
+    # 创建临时surface
+    temp_surface = pygame.Surface((size, size), pygame.SRCALPHA)
+    
+    # 获取并缩放宝石图片
+    original_image = gem_image(gem_type)
+    if size != CELL_SIZE:
+        scaled_image = pygame.transform.scale(original_image, (size, size))
+    else:
+        scaled_image = original_image
+    
+    # 绘制宝石
+    temp_surface.blit(scaled_image, (0, 0))
+    
+    # 为特殊符文添加特效
+    if special_type != SpecialType.NONE:
+        effect_surface = pygame.Surface((size, size), pygame.SRCALPHA)
         
-        # 为特殊符文添加特效
-        if self.special_type != SpecialType.NONE:
-            effect_surface = pygame.Surface((size, size), pygame.SRCALPHA)
+        if special_type == SpecialType.EXPLOSIVE:
+            # 爆炸符文效果：脉动的光环
+            glow_size = abs(math.sin(effect_angle)) * 5 + size//2
+            pygame.draw.circle(effect_surface, (255, 165, 0, 100), 
+                             (size//2, size//2), int(glow_size))
             
-            if self.special_type == SpecialType.EXPLOSIVE:
-                # 爆炸符文效果：脉动的光环
-                glow_size = abs(math.sin(self.special_effect_angle)) * 5 + size//2
-                pygame.draw.circle(effect_surface, (255, 165, 0, 100), 
-                                 (size//2, size//2), int(glow_size))
-                
-            elif self.special_type == SpecialType.LINE:
-                # 直线符文效果：旋转的十字
-                center = size // 2
-                angle = self.special_effect_angle
-                length = size // 2
-                points = [
-                    (center + math.cos(angle) * length, center + math.sin(angle) * length),
-                    (center - math.cos(angle) * length, center - math.sin(angle) * length),
-                    (center + math.cos(angle + math.pi/2) * length, center + math.sin(angle + math.pi/2) * length),
-                    (center - math.cos(angle + math.pi/2) * length, center - math.sin(angle + math.pi/2) * length)
-                ]
-                for p1, p2 in [(points[0], points[1]), (points[2], points[3])]:
-                    pygame.draw.line(effect_surface, (255, 215, 0, 150), p1, p2, 3)
-                
-            elif self.special_type == SpecialType.MAGIC:
-                # 魔法球效果：旋转的星星
-                center = size // 2
-                points = []
-                num_points = 5
-                for i in range(num_points * 2):
-                    angle = self.special_effect_angle + i * math.pi / num_points
-                    radius = size // 3 if i % 2 == 0 else size // 6
-                    x = center + math.cos(angle) * radius
-                    y = center + math.sin(angle) * radius
-                    points.append((x, y))
-                pygame.draw.polygon(effect_surface, (255, 255, 255, 150), points)
+        elif special_type == SpecialType.LINE:
+            # 直线符文效果：旋转的十字
+            center = size // 2
+            angle = effect_angle
+            length = size // 2
+            points = [
+                (center + math.cos(angle) * length, center + math.sin(angle) * length),
+                (center - math.cos(angle) * length, center - math.sin(angle) * length),
+                (center + math.cos(angle + math.pi/2) * length, center + math.sin(angle + math.pi/2) * length),
+                (center - math.cos(angle + math.pi/2) * length, center - math.sin(angle + math.pi/2) * length)
+            ]
+            for p1, p2 in [(points[0], points[1]), (points[2], points[3])]:
+                pygame.draw.line(effect_surface, (255, 215, 0, 150), p1, p2, 3)
             
-            temp_surface.blit(effect_surface, (0, 0))
-        
-        # 应用透明度
-        if self.alpha < 255:
-            alpha_surface = pygame.Surface((size, size), pygame.SRCALPHA)
-            alpha_surface.fill((255, 255, 255, int(self.alpha)))
-            temp_surface.blit(alpha_surface, (0, 0), special_flags=pygame.BLEND_RGBA_MULT)
+        elif special_type == SpecialType.MAGIC:
+            # 魔法球效果：旋转的星星
+            center = size // 2
+            points = []
+            num_points = 5
+            for i in range(num_points * 2):
+                angle = effect_angle + i * math.pi / num_points
+                radius = size // 3 if i % 2 == 0 else size // 6
+                px = center + math.cos(angle) * radius
+                py = center + math.sin(angle) * radius
+                points.append((px, py))
+            pygame.draw.polygon(effect_surface, (255, 255, 255, 150), points)
         
-        # 绘制到屏幕
-        draw_x = self.x + (CELL_SIZE - size) // 2
-        draw_y = self.y + (CELL_SIZE - size) // 2
-        screen.blit(temp_surface, (draw_x, draw_y))
+        temp_surface.blit(effect_surface, (0, 0))
+    
+    # 应用透明度
+    if alpha < 255:
+        alpha_surface = pygame.Surface((size, size), pygame.SRCALPHA)
+        alpha_surface.fill((255, 255, 255, int(alpha)))
+        temp_surface.blit(alpha_surface, (0, 0), special_flags=pygame.BLEND_RGBA_MULT)
+    
+    # 绘制到屏幕
+    draw_x = x + (CELL_SIZE - size) // 2
+    draw_y = y + (CELL_SIZE - size) // 2
+    screen.blit(temp_surface, (draw_x, draw_y))
+
+def draw_grid(screen, animator, gem_types, blend=1.0, ticks=None):
+    """按 GemAnimator 中显示的内容绘制网格和所有宝石
+
+    blend 为位置插值系数，ticks 为特效闪烁使用的毫秒时钟（默认取当前时间）。
+    """
+    if ticks is None:
+        ticks = pygame.time.get_ticks()
+    glow_alpha = int(abs(math.sin(ticks * 0.005)) * 155 + 100)
+    glow = None
+    for i in range(animator.rows):
+        for j in range(animator.cols):
+            x = j * CELL_SIZE + animator.offset_x
+            y = i * CELL_SIZE + animator.offset_y
+            rect = pygame.Rect(x, y, CELL_SIZE, CELL_SIZE)
+            pygame.draw.rect(screen, (80, 80, 100), rect, 1)
+            
+            # 绘制宝石（动画回放中显示的内容可能落后于棋盘逻辑）
+            if animator.occupied[i, j]:
+                gem_type = gem_types[animator.gem_type[i, j]]
+                special_type = SpecialType(int(animator.special[i, j]))
+                draw_gem(screen, gem_type, special_type, *animator.state(i, j, blend))
+                # 为特殊符文添加闪光效果
+                if special_type != SpecialType.NONE:
+                    if glow is None:
+                        glow = pygame.Surface((CELL_SIZE, CELL_SIZE), pygame.SRCALPHA)
+                        pygame.draw.rect(glow, (255, 255, 200, glow_alpha),
+                                         (0, 0, CELL_SIZE, CELL_SIZE), 3)
+                    screen.blit(glow, (x, y))
 
 class Game:
-    def __init__(self):
+    def __init__(self, rows=GRID_SIZE, cols=GRID_SIZE, type_count=len(GEM_TYPES), backend=None):
         pygame.init()
         pygame.mixer.init(frequency=44100, size=-16, channels=2, buffer=512)
         
-        # 设置显示
-        self.screen = pygame.display.set_mode((WINDOW_WIDTH, WINDOW_HEIGHT))
-        pygame.display.set_caption("魔法符文消除")
+        # 设置显示（默认打开窗口，也可以传入 OffscreenBackend 离屏渲染）
+        self.backend = backend or WindowBackend(WINDOW_WIDTH, WINDOW_HEIGHT, "魔法符文消除")
+        self.screen = self.backend.surface
         
         # 加载背景图片
         try:
             background_path = os.path.join(ASSETS_DIR, 'background.png')
-            self.background = pygame.image.load(background_path).convert()
+            self.background = prepare_surface(pygame.image.load(background_path))
             self.background = pygame.transform.scale(self.background, (WINDOW_WIDTH, WINDOW_HEIGHT))
             print("背景图片加载成功")
         except Exception as e:
             print(f"背景图片加载失败: {e}")
             # 创建默认背景
             self.background = pygame.Surface(self.screen.get_size())
-            self.background = self.background.convert()
+            self.background = prepare_surface(self.background)
             self.background.fill((30, 30, 50))
         
         # 加载背景音乐
@@ -238,51 +239,16 @@ class Game:
         except Exception as e:
             print(f"背景音乐加载失败: {e}")
         
-        # 初始化字体
-        try:
-            # 尝试从assets目录加载自定义字体
-            font_path = os.path.join('assets', 'simhei.ttf')
-            if os.path.exists(font_path):
-                self.font = pygame.font.Font(font_path, 20)
-                self.small_font = pygame.font.Font(font_path, 20)
-                print("Game: 使用自定义字体文件")
-            else:
-                # 尝试系统中文字体
-                font_names = [
-                    'SimHei',           # Windows 黑体
-                    'Microsoft YaHei',   # Windows 微软雅黑
-                    'PingFang SC',      # macOS 苹方
-                    'Noto Sans CJK SC', # Linux 思源黑体
-                    'WenQuanYi Micro Hei', # Linux 文泉驿微米黑
-                    'Heiti TC',         # macOS 黑体-繁
-                    'Arial Unicode MS'  # 通用 Unicode 字体
-                ]
-                
-                font_loaded = False
-                for font_name in font_names:
-                    try:
-                        self.font = pygame.font.SysFont(font_name, 20)
-                        self.small_font = pygame.font.SysFont(font_name, 20)
-                        print(f"Game: 使用系统字体: {font_name}")
-                        font_loaded = True
-                        break
-                    except:
-                        continue
-                
-                if not font_loaded:
-                    print("Game: 无法加载中文字体，使用默认字体")
-                    self.font = pygame.font.Font(None, 20)
-                    self.small_font = pygame.font.Font(None, 20)
-        
-        except Exception as e:
-            print(f"Game: 字体加载错误: {e}")
-            self.font = pygame.font.Font(None, 20)
-            self.small_font = pygame.font.Font(None, 20)
+        # 字体由 font_manager 统一加载，各界面共享
+        self.font = get_font(20)
+        self.small_font = get_font(20)
         
         # 缓存主菜单文本
         self.menu_texts = {
             'single_player': self.font.render("单人游戏", True, (255, 255, 255)),
+            'vs_ai': self.font.render("人机对战", True, (255, 255, 255)),
             'multiplayer': self.font.render("联机对战", True, (255, 255, 255)),
+            'spectate': self.font.render("观战", True, (255, 255, 255)),
             'exit': self.font.render("退出游戏", True, (255, 255, 255))
         }
         
@@ -294,17 +260,36 @@ class Game:
         self.network = NetworkManager()
         self.network_lobby = NetworkLobby(self.screen, self.network)
         self.battle_platform = BattlePlatform(self.screen, self.network)
+        self.tournament = TournamentScreen(self.screen, self.network, self.small_font, gem_image)
         
-        self.grid = [[None for _ in range(GRID_SIZE)] for _ in range(GRID_SIZE)]
+        # 棋盘尺寸和宝石种类（最多为有图片的种类数）
+        self.gem_types = GEM_TYPES[:type_count]
+        self.grid_offset_x = (WINDOW_WIDTH - cols * CELL_SIZE) // 2
+        self.grid_offset_y = (WINDOW_HEIGHT - rows * CELL_SIZE) // 2
+        self.animator = GemAnimator(rows, cols, CELL_SIZE,
+                                    self.grid_offset_x, self.grid_offset_y, DROP_SPEED)
+        self.board = Board(self.gem_types, rows, cols)
+        self.timeline = deque()     # 待回放的连锁步骤
+        self.playing_step = None    # 正在播放消除动画的步骤
+        self.last_steps = []        # 最近一次激活特殊符文的连锁结果
         self.initialize_grid()
         
         self.selected = None
         self.score = 0
         self.moves = 30
+        self.last_broadcast = None  # 最近一次广播的 (分数, 剩余步数)
+        self.awaiting_result = False  # 步数用完，等待对手或比赛服务器的结果
         
-        print("可用字体:", pygame.font.get_fonts())  # 打印系统所有可用字体
+        # 电脑对手
+        self.ai_player = None
+        self.ai_board = None
+        self.ai_score = 0
+        self.ai_moves = 0
+        self.ai_turns = 0  # 电脑还没走的回合数
+        self.ai_search = None  # 进行中的搜索（PendingMove）
         
         self.clock = pygame.time.Clock()
+        self.timestep = FixedTimestep(SIM_RATE, MAX_TICKS_PER_FRAME)
         self.animating = False
         self.combo = 0
         self.max_combo = 0
@@ -335,68 +320,59 @@ class Game:
         
         # 设置网络管理器的回调函数
         self.network.on_game_start = self.start_multiplayer_game
+        self.network_event_pending = False
+        # 玩家、房间、观战对局或对局中的对手状态有变化时唤醒主循环
+        self.network.store.subscribe(
+            lambda kind, key, value, revision: self.notify_network_message(kind))
+        self.frame_count = 0
         
         print("游戏初始化完成")
         print(f"当前游戏状态: {self.game_state}")
         print("网络大厅初始化完成")
-        
-        self.battle_platform = BattlePlatform(self.screen, self.network)
 
-    def initialize_grid(self):
-        while True:
-            # 填充网格0
-            for i in range(GRID_SIZE):
-                for j in range(GRID_SIZE):
-                    gem_type = random.choice(GEM_TYPES)
-                    self.grid[i][j] = Gem(gem_type, i, j)
-            
-            # 检查是否有初始匹配
-            matches, _ = self.find_matches()
-            if not matches:
-                break
-            
-            # 如果有匹配，清空网格重试
-            self.grid = [[None for _ in range(GRID_SIZE)] for _ in range(GRID_SIZE)]
+    @property
+    def grid(self):
+        return self.board.grid
+
+    def initialize_grid(self, seed=None):
+        self.board.initialize(min_moves=MIN_START_MOVES, seed=seed)
+        self.animator.reset(self.board.type_codes())
+        self.timeline.clear()
+        self.playing_step = None
 
-    def draw(self):
-        """绘制游戏界面"""
+    def draw(self, blend=1.0):
+        """绘制游戏界面，blend 为两个模拟步之间的插值系数"""
         try:
             # 绘制背景
             self.screen.blit(self.background, (0, 0))
             
             # 绘制半透明的游戏区域背景
-            game_area = pygame.Surface((GRID_SIZE * CELL_SIZE + 20, GRID_SIZE * CELL_SIZE + 20))
+            game_area = pygame.Surface((self.board.cols * CELL_SIZE + 20,
+                                        self.board.rows * CELL_SIZE + 20))
             game_area.fill((30, 30, 50))
             game_area.set_alpha(180)
             self.screen.blit(game_area, 
-                            (GRID_OFFSET_X - 10, GRID_OFFSET_Y - 10))
+                            (self.grid_offset_x - 10, self.grid_offset_y - 10))
             
-            # 绘制网格
-            for i in range(GRID_SIZE):
-                for j in range(GRID_SIZE):
-                    x = j * CELL_SIZE + GRID_OFFSET_X
-                    y = i * CELL_SIZE + GRID_OFFSET_Y
-                    rect = pygame.Rect(x, y, CELL_SIZE, CELL_SIZE)
-                    pygame.draw.rect(self.screen, (80, 80, 100), rect, 1)
-                    
-                    # 绘制宝石
-                    if self.grid[i][j]:
-                        self.grid[i][j].draw(self.screen)
-                        # 为特殊符文添加闪光效果
-                        if self.grid[i][j].special_type != SpecialType.NONE:
-                            glow_color = (255, 255, 200, 
-                                        int(abs(math.sin(pygame.time.get_ticks() * 0.005)) * 155 + 100))
-                            s = pygame.Surface((CELL_SIZE, CELL_SIZE), pygame.SRCALPHA)
-                            pygame.draw.rect(s, glow_color, (0, 0, CELL_SIZE, CELL_SIZE), 3)
-                            self.screen.blit(s, (x, y))
+            # 绘制网格和宝石
+            draw_grid(self.screen, self.animator, self.gem_types, blend, self.backend.ticks())
             
             # 绘制选中效果
             if self.selected:
                 i, j = self.selected
-                x = j * CELL_SIZE + GRID_OFFSET_X
-                y = i * CELL_SIZE + GRID_OFFSET_Y
+                x = j * CELL_SIZE + self.grid_offset_x
+                y = i * CELL_SIZE + self.grid_offset_y
                 rect = pygame.Rect(x, y, CELL_SIZE, CELL_SIZE)
                 pygame.draw.rect(self.screen, (255, 255, 255), rect, 2)
+                
+                # 预览：鼠标所在的相邻格子能交换成功时显示绿色边框
+                hover = self.get_cell(pygame.mouse.get_pos())
+                if (hover and not self.animating and
+                        self.board.is_valid_swap(self.selected, hover)):
+                    x = hover[1] * CELL_SIZE + self.grid_offset_x
+                    y = hover[0] * CELL_SIZE + self.grid_offset_y
+                    rect = pygame.Rect(x, y, CELL_SIZE, CELL_SIZE)
+                    pygame.draw.rect(self.screen, (80, 255, 120), rect, 2)
             
             # 创建半透明的状态显示背景
             status_bg_width = 160   # 修改宽度
@@ -421,7 +397,14 @@ class Game:
                 y_offset += 28  # 进一步微调行间距
             
             # 在最后添加用户数据显示
+            opponent = None
             if self.network and self.network.current_room:
+                opponent = ("对手", self.network.opponent_score, self.network.opponent_moves)
+            elif self.ai_board:
+                opponent = ("电脑", self.ai_score, self.ai_moves)
+            
+            if opponent:
+                opponent_name, opponent_score, opponent_moves = opponent
                 # 创建半透明的状态显示背景
                 status_bg_width = 150
                 status_bg_height = 120
@@ -435,8 +418,8 @@ class Game:
                 texts = [
                     f"我方分数: {self.score}",
                     f"我方步数: {self.moves}",
-                    f"对手分数: {self.network.opponent_score}",
-                    f"对手步数: {self.network.opponent_moves}"
+                    f"{opponent_name}分数: {opponent_score}",
+                    f"{opponent_name}步数: {opponent_moves}"
                 ]
                 
                 for text in texts:
@@ -445,8 +428,6 @@ class Game:
                                    (WINDOW_WIDTH - status_bg_width, y_offset))
                     y_offset += 28
             
-            pygame.display.flip()
-            
         except Exception as e:
             print(f"绘制错误: {e}")
             import traceback
@@ -454,181 +435,85 @@ class Game:
 
     def get_cell(self, pos):
         x, y = pos
-        if (GRID_OFFSET_X <= x <= GRID_OFFSET_X + GRID_SIZE * CELL_SIZE and
-            GRID_OFFSET_Y <= y <= GRID_OFFSET_Y + GRID_SIZE * CELL_SIZE):
-            return ((y - GRID_OFFSET_Y) // CELL_SIZE,
-                   (x - GRID_OFFSET_X) // CELL_SIZE)
+        if (self.grid_offset_x <= x < self.grid_offset_x + self.board.cols * CELL_SIZE and
+            self.grid_offset_y <= y < self.grid_offset_y + self.board.rows * CELL_SIZE):
+            return ((y - self.grid_offset_y) // CELL_SIZE,
+                   (x - self.grid_offset_x) // CELL_SIZE)
         return None
 
     def find_matches(self):
         """查找匹配的宝石并返回特殊符文信息"""
-        matches = set()
-        special_matches = {}
-        
-        # 检查水平匹配
-        for i in range(GRID_SIZE):
-            j = 0
-            while j < GRID_SIZE:
-                if not self.grid[i][j]:
-                    j += 1
-                    continue
-                    
-                current_type = self.grid[i][j].type
-                match_length = 1
-                k = j + 1
-                
-                # 计算水平匹配长度
-                while k < GRID_SIZE and self.grid[i][k] and self.grid[i][k].type == current_type:
-                    match_length += 1
-                    k += 1
-                
-                # 如果找到匹配
-                if match_length >= 3:
-                    match_positions = [(i, j+n) for n in range(match_length)]
-                    matches.update(match_positions)
-                    
-                    # 根据匹配长度生成特殊符文
-                    if match_length == 4:
-                        special_matches[(i, j)] = SpecialType.EXPLOSIVE
-                    elif match_length == 5:
-                        special_matches[(i, j)] = SpecialType.LINE
-                    elif match_length >= 6:
-                        special_matches[(i, j)] = SpecialType.MAGIC
-                
-                j = k
-        
-        # 检查垂直匹配
-        for j in range(GRID_SIZE):
-            i = 0
-            while i < GRID_SIZE:
-                if not self.grid[i][j]:
-                    i += 1
-                    continue
-                    
-                current_type = self.grid[i][j].type
-                match_length = 1
-                k = i + 1
-                
-                # 计算垂直匹配长度
-                while k < GRID_SIZE and self.grid[k][j] and self.grid[k][j].type == current_type:
-                    match_length += 1
-                    k += 1
-                
-                # 如果找到匹配
-                if match_length >= 3:
-                    match_positions = [(i+n, j) for n in range(match_length)]
-                    matches.update(match_positions)
-                    
-                    # 根据匹配长度生成特殊符文
-                    if match_length == 4:
-                        special_matches[(i, j)] = SpecialType.EXPLOSIVE
-                    elif match_length == 5:
-                        special_matches[(i, j)] = SpecialType.LINE
-                    elif match_length >= 6:
-                        special_matches[(i, j)] = SpecialType.MAGIC
-                
-                i = k
-        
-        return matches, special_matches
+        return self.board.find_matches()
 
-    def remove_matches(self):
-        """移除匹配的宝石并创建特效"""
-        matches, special_matches = self.find_matches()
-        if matches:
-            print(f"找到匹配: {matches}")
-            print(f"特殊符文: {special_matches}")
-            
-            # 增加连击计数和分数
-            self.combo += 1
-            self.max_combo = max(self.max_combo, self.combo)
-            
-            base_score = len(matches) * 10
-            combo_bonus = self.combo * 5
-            self.score += base_score + combo_bonus
-            
-            # 处理特殊符文的生成
-            for pos, special_type in special_matches.items():
-                i, j = pos
-                if (i, j) in matches:  # 确保位置还在匹配集合中
-                    matches.remove((i, j))  # 从普通匹配中移除
-                    gem_type = self.grid[i][j].type
-                    new_gem = Gem(gem_type, i, j)
-                    new_gem.special_type = special_type
-                    new_gem.target_row = i
-                    new_gem.target_col = j
-                    self.grid[i][j] = new_gem
-                    print(f"生成特殊符文: 位置({i},{j}) 类型{special_type}")
-                    
-                    # 播放特殊符文生成音效
-                    if self.special_sound:
-                        self.special_sound.play()
-            
-            # 移除普通匹配
-            for i, j in matches:
-                if self.grid[i][j]:
-                    self.grid[i][j].removing = True
-                    self.grid[i][j].remove_timer = 1.0
-                    print(f"移除普通宝石: ({i},{j})")
-            
-            # 播放消除音效
-            if self.eliminate_sound:
-                self.eliminate_sound.play()
-            
+    def play_cascade(self, steps):
+        """结算连锁结果，并把步骤加入动画时间线"""
+        for step in steps:
+            self.score += step.score
+            self.max_combo = max(self.max_combo, step.combo)
+        self.timeline.extend(steps)
+        if steps:
             self.animating = True
+
+    def advance_timeline(self):
+        """当前动画播放完后回放时间线的下一阶段，没有内容时返回False"""
+        if self.playing_step is not None:
+            # 消除动画结束，播放下落和补充
+            step = self.playing_step
+            self.playing_step = None
+            for i, j in step.removed:
+                self.animator.clear(i, j)
+            for src, dst in step.drops:
+                self.animator.move(src, dst)
+            for i, j, start_row, gem_type in step.spawns:
+                self.animator.place(i, j, self.board.type_index[gem_type], start_row=start_row)
             return True
-        else:
-            self.combo = 0  # 重置连击
+        
+        if not self.timeline:
             return False
+        
+        step = self.timeline.popleft()
+        self.playing_step = step
+        self.combo = step.combo
+        
+        for (i, j), special_type in step.specials.items():
+            self.animator.set_special(i, j, special_type.value)
+            print(f"生成特殊符文: 位置({i},{j}) 类型{special_type}")
+            
+            # 播放特殊符文生成音效
+            if self.special_sound:
+                self.special_sound.play()
+        
+        for i, j in step.removed:
+            self.animator.mark_removing(i, j)
+        
+        # 连锁引爆的特殊符文
+        if step.triggered and step.combo > 0:
+            print(f"连锁引爆{len(step.triggered)}个特殊符文")
+            if self.special_sound:
+                self.special_sound.play()
+        
+        # 播放消除音效
+        if self.eliminate_sound:
+            self.eliminate_sound.play()
+        return True
 
     def activate_special_gem(self, row, col, special_type):
         """激活特殊符文效果"""
         try:
-            affected_gems = set()
             print(f"开始激活特殊符文: 位置({row},{col}) 类型{special_type}")
+            # 立即结算引爆、符文连锁和后续消除
+            steps = self.board.resolve_cascade(initial_removal=[(row, col)])
+            self.last_steps = steps
             
-            if special_type == SpecialType.EXPLOSIVE:
-                # 爆炸效果：影响3x3范围
-                for i in range(max(0, row-1), min(GRID_SIZE, row+2)):
-                    for j in range(max(0, col-1), min(GRID_SIZE, col+2)):
-                        if self.grid[i][j]:
-                            affected_gems.add((i, j))
-                            print(f"爆炸效果影响: ({i},{j})")
-                    
-            elif special_type == SpecialType.LINE:
-                # 直线效果：清除整行和整列
-                for i in range(GRID_SIZE):
-                    if self.grid[i][col]:
-                        affected_gems.add((i, col))
-                    for j in range(GRID_SIZE):
-                        if self.grid[row][j]:
-                            affected_gems.add((row, j))
-                    print(f"直线效果影响: {len(affected_gems)}个宝石")
-                
-            elif special_type == SpecialType.MAGIC:
-                # 魔法效果：清除所有同类型的宝石
-                target_type = self.grid[row][col].type
-                for i in range(GRID_SIZE):
-                    for j in range(GRID_SIZE):
-                        if self.grid[i][j] and self.grid[i][j].type == target_type:
-                            affected_gems.add((i, j))
-                    print(f"魔法效果影响: {len(affected_gems)}个宝石")
-            
-            if affected_gems:
-                # 移除受影响的宝石
-                for i, j in affected_gems:
-                    if self.grid[i][j]:
-                        self.grid[i][j].removing = True
-                        self.grid[i][j].remove_timer = 1.0
-                        print(f"标记移除宝石: ({i},{j})")
+            if steps:
+                self.play_cascade(steps)
                 
                 # 播放特殊效果音效
                 if self.special_sound:
                     self.special_sound.play()
                 
-                # 设置动画状态
-                self.animating = True
-                
-                print(f"特殊符文效果完成，影响了{len(affected_gems)}个宝石")
+                print(f"特殊符文效果完成，引爆了{len(steps[0].triggered)}个符文，"
+                      f"影响了{len(steps[0].removed)}个宝石")
                 return True
             
             return False
@@ -639,68 +524,21 @@ class Game:
             traceback.print_exc()
             return False
 
-    def fill_empty(self):
-        """填充空位并使宝石下落"""
-        # 标记所有需要下落的宝石
-        falling_gems = []
-        
-        # 从下往上检查每一列
-        for j in range(GRID_SIZE):
-            empty_count = 0
-            for i in range(GRID_SIZE-1, -1, -1):
-                if self.grid[i][j] is None:
-                    empty_count += 1
-                elif empty_count > 0:
-                    # 如果上方有宝石且下方有空位，让宝石下落
-                    gem = self.grid[i][j]
-                    gem.target_row = i + empty_count
-                    self.grid[i+empty_count][j] = gem
-                    self.grid[i][j] = None
-                    falling_gems.append(gem)
-            
-            # 在顶部添加新的宝石
-            for i in range(empty_count):
-                gem_type = random.choice(GEM_TYPES)
-                new_gem = Gem(gem_type, -empty_count+i, j)
-                new_gem.target_row = i
-                self.grid[i][j] = new_gem
-                falling_gems.append(new_gem)
-        
-        # 立即更新所有下落的宝石位置
-        for gem in falling_gems:
-            gem.moving = True
-
     def is_animating(self):
         """检查是否有动画正在播放"""
-        for i in range(GRID_SIZE):
-            for j in range(GRID_SIZE):
-                if self.grid[i][j] and (self.grid[i][j].removing or self.grid[i][j].moving):
-                    return True
-        return False
+        return self.animator.is_animating()
 
     def update_animations(self, dt):
-        """更新所有动画效果"""
+        """一次向量化更新所有宝石动画"""
         try:
-            any_removed = False
-            
-            # 更新所有宝石的动画
-            for i in range(GRID_SIZE):
-                for j in range(GRID_SIZE):
-                    if self.grid[i][j]:
-                        if self.grid[i][j].removing:
-                            if self.grid[i][j].update(dt):
-                                print(f"移除宝石: ({i},{j})")
-                                self.grid[i][j] = None
-                                any_removed = True
-                        else:
-                            self.grid[i][j].update(dt)
+            finished = self.animator.step(dt)
+            rows, cols = finished.nonzero()
             
-            # 如果有宝石被移除，立即触发填充
-            if any_removed:
-                print("检测到宝石移除，触发填充")
-                self.fill_empty()
+            # 消除动画结束的格子变空
+            for i, j in zip(rows.tolist(), cols.tolist()):
+                self.animator.clear(i, j)
             
-            return any_removed
+            return len(rows) > 0
             
         except Exception as e:
             print(f"更新动画错误: {e}")
@@ -708,34 +546,73 @@ class Game:
             traceback.print_exc()
             return False
 
-    def update_gem_positions(self, dt):
-        """更新所有宝石的位置"""
-        for i in range(GRID_SIZE):
-            for j in range(GRID_SIZE):
-                if self.grid[i][j]:
-                    self.grid[i][j].update(dt)
-                    
-                    # 如果宝石到达目标位置，更新其实际位置
-                    target_x = self.grid[i][j].target_col * CELL_SIZE + GRID_OFFSET_X
-                    target_y = self.grid[i][j].target_row * CELL_SIZE + GRID_OFFSET_Y
-                    
-                    if (abs(self.grid[i][j].x - target_x) < 1 and 
-                        abs(self.grid[i][j].y - target_y) < 1):
-                        self.grid[i][j].x = target_x
-                        self.grid[i][j].y = target_y
+    def step_frame(self, elapsed):
+        """推进一帧：按固定步长执行积累的模拟步，再按插值系数绘制"""
+        for _ in range(self.timestep.advance(elapsed)):
+            self.update(self.timestep.dt)
+        self.draw(self.timestep.blend)
+
+    def discovery_mode(self):
+        """发现信标的模式：对战大厅和观战界面可见、正在联机对局或其他"""
+        if self.game_state == GameState.PLAYING and self.network.current_room:
+            return MODE_MATCH
+        if self.game_state == GameState.MENU and self.menu_state in ("BATTLE", "TOURNAMENT"):
+            return MODE_LOBBY
+        return MODE_HIDDEN
+
+    def notify_network_message(self, message_type):
+        """状态存储有变化时在网络线程中调用：投递一个事件唤醒主循环，未处理前不重复投递"""
+        if not self.network_event_pending:
+            self.network_event_pending = True
+            pygame.event.post(pygame.event.Event(NETWORK_EVENT, message_type=message_type))
+
+    def is_idle(self):
+        """没有动画或定时刷新的内容时返回True，主循环可以阻塞等待事件"""
+        if self.game_state == GameState.PLAYING:
+            # 等待对局结果或有待恢复的服务器棋盘时每帧都要检查
+            session = self.network.session if self.network else None
+            if self.awaiting_result or self.ai_turns or (session and session.resync is not None):
+                return False
+            return not self.animating
+        if self.menu_state == "LOBBY":
+            return self.network_lobby.error_timer <= 0
+        return True
+
+    def wait_events(self):
+        """空闲时阻塞到有输入或网络事件，最多等待 IDLE_TIMEOUT_MS 毫秒"""
+        event = pygame.event.wait(IDLE_TIMEOUT_MS)
+        if event.type == pygame.NOEVENT:
+            return []
+        return [event] + pygame.event.get()
 
-    def run(self):
+    def run(self, uncapped=False, idle_wait=True):
+        """主循环，uncapped 为 True 时不限制渲染帧率
+
+        idle_wait 为 True 时，空闲状态下阻塞等待事件而不是每秒重绘60次。
+        """
         running = True
         last_time = pygame.time.get_ticks()
         
         while running:
+            if idle_wait and self.is_idle():
+                events = self.wait_events()
+                # 等待的时间不计入模拟
+                last_time = pygame.time.get_ticks()
+            else:
+                events = pygame.event.get()
+            
             current_time = pygame.time.get_ticks()
-            dt = (current_time - last_time) / 1000.0
+            elapsed = (current_time - last_time) / 1000.0
             last_time = current_time
             
-            for event in pygame.event.get():
+            for event in events:
                 if event.type == pygame.QUIT:
                     running = False
+                
+                if event.type == NETWORK_EVENT:
+                    # 网络状态有变化，这一帧的 update() 按版本号刷新大厅列表
+                    self.network_event_pending = False
+                    continue
                     
                 # 根据游戏状态和菜单状态处理事件
                 if self.game_state == GameState.MENU:
@@ -747,7 +624,9 @@ class Game:
                             spacing = 20
                             menu_items = [
                                 ("单人游戏", lambda: self.start_single_player()),
+                                ("人机对战", lambda: self.start_ai_game()),
                                 ("联机对战", lambda: setattr(self, 'menu_state', "BATTLE")),
+                                ("观战", lambda: setattr(self, 'menu_state', "TOURNAMENT")),
                                 ("退出游戏", sys.exit)
                             ]
                             
@@ -770,10 +649,16 @@ class Game:
                         result = self.battle_platform.handle_event(event)
                         if result == "START_GAME":
                             self.start_multiplayer_game()
+                    elif self.menu_state == "TOURNAMENT":
+                        if self.tournament.handle_event(event) == "BACK":
+                            self.menu_state = "MAIN"
                     
                 elif self.game_state == GameState.PLAYING:
                     self.handle_game_event(event)
             
+            # 大厅可见时正常发送发现信标，否则退避
+            self.network.discovery.set_mode(self.discovery_mode())
+            
             # 更新和绘制
             if self.game_state == GameState.MENU:
                 if self.menu_state == "MAIN":
@@ -784,17 +669,25 @@ class Game:
                 elif self.menu_state == "BATTLE":
                     self.battle_platform.update()
                     self.battle_platform.draw()
+                elif self.menu_state == "TOURNAMENT":
+                    self.tournament.update()
+                    self.tournament.draw()
             elif self.game_state == GameState.PLAYING:
-                self.update(dt)
-                self.draw()
+                self.step_frame(elapsed)
                 
-                # 如果是联机模式，广播游戏状态
+                # 如果是联机模式，分数或步数变化时广播游戏状态
                 if self.network and self.network.current_room:
-                    self.network.broadcast_game_state(self.score, self.moves)
+                    state = (self.score, self.moves)
+                    if state != self.last_broadcast:
+                        self.last_broadcast = state
+                        self.network.broadcast_game_state(self.score, self.moves)
             
-            pygame.display.flip()
-            self.clock.tick(60)
+            self.backend.present()
+            self.frame_count += 1
+            self.clock.tick(0 if uncapped else FRAME_RATE)
         
+        if self.ai_player:
+            self.ai_player.close()
         pygame.quit()
         sys.exit()
 
@@ -804,7 +697,9 @@ class Game:
         
         menu_items = [
             (self.menu_texts['single_player'], lambda: setattr(self, 'game_state', GameState.PLAYING)),
+            (self.menu_texts['vs_ai'], lambda: self.start_ai_game()),
             (self.menu_texts['multiplayer'], lambda: setattr(self, 'menu_state', "BATTLE")),
+            (self.menu_texts['spectate'], lambda: setattr(self, 'menu_state', "TOURNAMENT")),
             (self.menu_texts['exit'], sys.exit)
         ]
         
@@ -854,6 +749,8 @@ class Game:
                             print(f"点击特殊符文: 位置({row},{col}) 类型{current_gem.special_type}")
                             if self.activate_special_gem(row, col, current_gem.special_type):
                                 self.moves -= 1
+                                self.publish_move(('special', (row, col)), self.last_steps)
+                                self.ai_take_turn()
                                 # 播放点击音效
                                 if self.click_sound:
                                     self.click_sound.play()
@@ -865,7 +762,8 @@ class Game:
                             selected_row, selected_col = self.selected
                             if abs(row - selected_row) + abs(col - selected_col) == 1:
                                 # 相邻的宝石，尝试交换
-                                self.swap_gems(selected_row, selected_col, row, col)
+                                if self.swap_gems(selected_row, selected_col, row, col):
+                                    self.ai_take_turn()
                             self.selected = None
                         else:
                             # 选择宝石
@@ -873,6 +771,11 @@ class Game:
                             # 播放点击音效
                             if self.click_sound:
                                 self.click_sound.play()
+            elif event.type == pygame.KEYDOWN:
+                if event.key == pygame.K_F5:
+                    self.save_game()
+                elif event.key == pygame.K_F9:
+                    self.load_game()
                             
         except Exception as e:
             print(f"事件处理错误: {e}")
@@ -884,7 +787,6 @@ class Game:
         print("Starting single player game...")
         try:
             self.game_state = GameState.PLAYING
-            self.grid = [[None for _ in range(GRID_SIZE)] for _ in range(GRID_SIZE)]
             self.initialize_grid()
             self.selected = None
             self.score = 0
@@ -892,39 +794,159 @@ class Game:
             self.combo = 0
             self.max_combo = 0
             self.animating = False
+            self.awaiting_result = False
+            self.ai_board = None
+            self.ai_turns = 0
+            self.ai_search = None
             print("游戏初始化完成")
         except Exception as e:
             print(f"游戏初始化错误: {e}")
 
+    def save_game(self, path=SAVE_PATH):
+        """保存单人游戏进度，动画播放中和对战中不保存"""
+        if self.animating or self.ai_board or (self.network and self.network.current_room):
+            print("当前无法存档")
+            return False
+        try:
+            with open(path, 'wb') as f:
+                f.write(dump_state(self.board, self.score, self.moves, self.combo, self.max_combo))
+            print(f"游戏已保存: {path}")
+            return True
+        except OSError as e:
+            print(f"存档失败: {e}")
+            return False
+
+    def load_game(self, path=SAVE_PATH):
+        """读取存档，继续单人游戏；存档无效时当前的游戏保持不变"""
+        if self.animating or self.ai_board or (self.network and self.network.current_room):
+            print("当前无法读档")
+            return False
+        try:
+            with open(path, 'rb') as f:
+                data = f.read()
+            # 先解析到新棋盘上，确认有效后再替换当前游戏
+            board, state = load_state(data, gem_types=self.gem_types)
+            if (board.rows, board.cols, len(board.gem_types)) != \
+                    (self.board.rows, self.board.cols, len(self.gem_types)):
+                raise ValueError(f"存档为 {board.rows}x{board.cols}、{len(board.gem_types)} 种宝石，"
+                                 f"与当前棋盘不符")
+        except Exception as e:
+            # 损坏或其他版本的存档可能抛出任何异常，都按无效存档处理
+            print(f"读取存档失败: {e}")
+            return False
+        self.start_single_player()
+        self.board.restore(board.snapshot())
+        self.score = state['score']
+        self.moves = state['moves']
+        self.combo = state['combo']
+        self.max_combo = state['max_combo']
+        self.animator.reset(self.board.type_codes())
+        print(f"已读取存档: {path}")
+        return True
+
+    def start_ai_game(self):
+        """启动人机对战，电脑在相同初始布局的棋盘上同步走棋"""
+        print("Starting game against AI...")
+        try:
+            self.start_single_player()
+            seed = random.getrandbits(32)
+            self.initialize_grid(seed=seed)
+            
+            self.ai_board = Board(self.gem_types, self.board.rows, self.board.cols)
+            self.ai_board.initialize(min_moves=MIN_START_MOVES, seed=seed)
+            self.ai_score = 0
+            self.ai_moves = 30
+            
+            # 进程池在对局开始前启动，之后每步都复用
+            if self.ai_player is None:
+                self.ai_player = AIPlayer(time_budget=AI_TIME_BUDGET)
+            self.ai_player.start()
+            print("人机对战初始化完成")
+        except Exception as e:
+            print(f"人机对战初始化错误: {e}")
+            import traceback
+            traceback.print_exc()
+
+    def ai_take_turn(self):
+        """玩家走完一步后轮到电脑：在进程池中搜索，之后的帧里取结果，界面不卡顿"""
+        if self.ai_board and self.ai_moves > self.ai_turns:
+            self.ai_turns += 1
+            self.advance_ai()
+
+    def advance_ai(self):
+        """每帧调用：搜索完成时执行电脑的走法，还有没走的回合时开始下一次搜索"""
+        try:
+            if self.ai_search is not None:
+                if not self.ai_search.done():
+                    return
+                move = self.ai_search.result()
+                self.ai_search = None
+                self.ai_turns -= 1
+                self.ai_moves -= 1
+                if move is None:
+                    # 电脑无路可走时重新生成棋盘，和走一步一样消耗步数
+                    print("电脑无可行操作，重新生成棋盘")
+                    self.ai_board.initialize(min_moves=MIN_START_MOVES)
+                else:
+                    steps = apply_move(self.ai_board, move)
+                    self.ai_score += sum(step.score for step in steps)
+                    print(f"电脑走法: {move} 得分: {self.ai_score} "
+                          f"用时: {self.ai_player.last_stats.get('elapsed', 0) * 1000:.1f}ms")
+            if self.ai_turns > 0 and self.ai_moves > 0:
+                self.ai_search = self.ai_player.begin_move(self.ai_board)
+        except Exception as e:
+            print(f"电脑走棋错误: {e}")
+            import traceback
+            traceback.print_exc()
+            self.ai_search = None
+            self.ai_turns = 0
+
     def update(self, dt):
         if self.game_state == GameState.PLAYING:
+            if self.ai_board:
+                self.advance_ai()
+            # 比赛服务器判定某一步无效时恢复到服务器的棋盘
+            if not self.animating:
+                self.apply_resync()
             # 更新游戏状态
             if self.animating:
-                any_removed = self.update_animations(dt)
-                if any_removed:
-                    self.fill_empty()
-                    self.update_gem_positions(dt)
-                elif not self.is_animating():
+                self.update_animations(dt)
+                if not self.is_animating() and not self.advance_timeline():
+                    # 时间线播放完毕
                     self.animating = False
-                    if not self.remove_matches():
-                        if self.moves <= 0:
-                            self.handle_game_end()
-            
-            # 广播游戏状态
-            if self.network and self.network.current_room:
-                self.network.broadcast_game_state(self.score, self.moves)
+                    self.combo = 0
+                    if self.moves <= 0:
+                        self.handle_game_end()
+            elif self.awaiting_result:
+                self.handle_game_end()
 
     def handle_game_end(self):
         """处理游戏结束"""
+        self.awaiting_result = False
         if self.network and self.network.current_room:
+            session = self.network.session
+            if self.network.match_server and session:
+                # 胜负以比赛服务器为准
+                if session.server_result is None:
+                    self.awaiting_result = True
+                    self.show_waiting_dialog()
+                else:
+                    self.show_result_dialog(session.server_result)
             # 等待对手完成
-            if self.network.opponent_moves > 0:
+            elif self.network.opponent_moves > 0:
+                self.awaiting_result = True
                 self.show_waiting_dialog()
             else:
                 # 判断胜负
                 is_winner = self.score > self.network.opponent_score
                 self.network.broadcast_game_result(is_winner)
                 self.show_result_dialog(is_winner)
+        elif self.ai_board:
+            if self.ai_turns:
+                # 电脑的最后一步还在搜索，下一帧再判定
+                self.awaiting_result = True
+            else:
+                self.show_result_dialog(self.score > self.ai_score)
 
     def show_waiting_dialog(self):
         """显示等待对手完成的对话框"""
@@ -933,7 +955,7 @@ class Game:
         text = self.font.render("等待对手完成游戏...", True, (255, 255, 255))
         dialog.blit(text, (100, 80))
         self.screen.blit(dialog, (200, 200))
-        pygame.display.flip()
+        self.backend.present()
 
     def show_result_dialog(self, is_winner):
         """显示游戏结果对话框"""
@@ -945,7 +967,7 @@ class Game:
         )
         dialog.blit(text, (150, 80))
         self.screen.blit(dialog, (200, 200))
-        pygame.display.flip()
+        self.backend.present()
 
     def swap_gems(self, row1, col1, row2, col2):
         """交换两个宝石"""
@@ -958,29 +980,21 @@ class Game:
                 print("无效的交换：存在空宝石")
                 return
 
-            # 先执行交换
-            self.grid[row1][col1] = gem2
-            self.grid[row2][col2] = gem1
-            gem1.target_row, gem1.target_col = row2, col2
-            gem2.target_row, gem2.target_col = row1, col1
-
-            # 检查是否形成匹配
-            matches = self.find_matches()[0]
-            if matches:
-                print(f"形成新的匹配: {matches}")
-                self.moves -= 1
-                self.animating = True
-                if self.eliminate_sound:
-                    self.eliminate_sound.play()
-                return True
-            else:
-                print("未形成匹配，恢复交换")
-                # 恢复原位
-                self.grid[row1][col1] = gem1
-                self.grid[row2][col2] = gem2
-                gem1.target_row, gem1.target_col = row1, col1
-                gem2.target_row, gem2.target_col = row2, col2
+            # 只检查两个格子附近的行列，不能形成匹配时棋盘保持不变
+            if not self.board.is_valid_swap((row1, col1), (row2, col2)):
+                print("未形成匹配，取消交换")
                 return False
+
+            self.board.swap(row1, col1, row2, col2)
+            self.animator.swap((row1, col1), (row2, col2))
+            self.moves -= 1
+            # 立即结算整个连锁，动画随后按时间线回放
+            steps = self.board.resolve_cascade()
+            self.play_cascade(steps)
+            self.publish_move(('swap', (row1, col1), (row2, col2)), steps)
+            if self.eliminate_sound:
+                self.eliminate_sound.play()
+            return True
             
         except Exception as e:
             print(f"交换宝石错误: {e}")
@@ -988,6 +1002,39 @@ class Game:
             traceback.print_exc()
             return False
 
+    def publish_move(self, move, steps):
+        """联机对局中把这一步的棋盘变化推送给观战者，并提交给比赛服务器"""
+        if not self.network or not self.network.current_room:
+            return
+        publisher = self.network.publisher
+        if publisher.board is self.board:
+            publisher.publish_move(move, steps, self.score, self.moves)
+        if self.network.match_server:
+            self.network.send_match_move(move)
+
+    def apply_resync(self):
+        """比赛服务器发回的棋盘：恢复棋盘、得分和步数，补充改用服务器给的种子"""
+        session = self.network.session if self.network else None
+        message = session.resync if session else None
+        if message is None:
+            return
+        session.resync = None
+        try:
+            _, state = load_state(base64.b64decode(message['state']), self.board)
+        except ValueError as e:
+            print(f"恢复服务器棋盘失败: {e}")
+            return
+        self.board.rng = random.Random(message['seed'])
+        self.score = state['score']
+        self.moves = state['moves']
+        self.timeline.clear()
+        self.playing_step = None
+        self.selected = None
+        self.animator.reset(self.board.type_codes())
+        self.network.publisher.start(session.room_id, self.network.local_ip,
+                                     self.board, self.score, self.moves)
+        print(f"已恢复到服务器的棋盘: 分数 {self.score}, 剩余步数 {self.moves}")
+
     def start_multiplayer_game(self):
         """启动联机游戏"""
         print("Starting multiplayer game...")
@@ -1002,17 +1049,23 @@ class Game:
             
             self.game_state = GameState.PLAYING
             self.menu_state = None  # 清除菜单状态
-            self.grid = [[None for _ in range(GRID_SIZE)] for _ in range(GRID_SIZE)]
-            self.initialize_grid()
+            # 用房间ID作为种子，确保双方看到相同的初始布局和补充序列
+            self.initialize_grid(seed=int(self.network.current_room.room_id))
             self.selected = None
             self.score = 0
-            self.moves = 30
+            self.moves = MATCH_MOVES
             self.combo = 0
             self.max_combo = 0
             self.animating = False
+            self.last_broadcast = None
+            self.awaiting_result = False
+            self.network.publisher.start(self.network.current_room.room_id,
+                                         self.network.get_local_ip(),
+                                         self.board, self.score, self.moves)
             
-            # 设置随机种子确保双方看到相同的初始布局
-            random.seed(int(self.network.current_room.room_id))
+            # 配置了比赛服务器时在服务器上加入对应的比赛
+            if self.network.match_server:
+                self.network.join_match()
             
             print("联机游戏初始化完成")
             print(f"房间ID: {self.network.current_room.room_id}")
@@ -1025,4 +1078,11 @@ class Game:
 
 if __name__ == "__main__":
     game = Game()
-    game.run()  
\ No newline at end of file
+    # --server 地址[:端口] 使用比赛服务器（match_server.py）校验联机对局
+    if '--server' in sys.argv:
+        host, _, port = sys.argv[sys.argv.index('--server') + 1].partition(':')
+        game.network.match_server = (host, int(port or SERVER_PORT))
+    if '--resume' in sys.argv and not game.load_game():
+        print("无法继续上次的进度，开始新游戏")
+        game.start_single_player()
+    game.run(uncapped='--uncapped' in sys.argv)  
\ No newline at end of file
@@ -0,0 +1,301 @@
+import argparse
+import asyncio
+import base64
+import random
+import time
+
+from ai import apply_move
+from board import Board, SpecialType, dump_state
+from constants import MIN_START_MOVES, MATCH_MOVES
+from network_manager import RETRANSMIT_TICK, encode_message, decode_message
+from reliable_channel import ReliableChannel
+
+# 比赛服务器使用的 UDP 端口
+SERVER_PORT = 5556
+# 超过这个秒数没有任何操作的比赛被清理
+MATCH_TIMEOUT = 600.0
+# 每名玩家最多缓存多少个乱序到达的操作
+MAX_PENDING_MOVES = 32
+# 清理过期比赛的间隔（秒）
+CLEANUP_INTERVAL = 5.0
+
+
+class MatchPlayer:
+    """比赛中的一名玩家：服务器上的权威棋盘、得分和剩余步数"""
+
+    def __init__(self, addr, name, seed):
+        self.addr = addr
+        self.name = name
+        # 与客户端 start_multiplayer_game 相同的参数，开局棋盘和补充序列一致
+        self.board = Board()
+        self.board.initialize(min_moves=MIN_START_MOVES, seed=seed)
+        self.score = 0
+        self.moves = MATCH_MOVES
+        self.next_seq = 1
+        self.pending = {}  # 序号 -> 操作，等待前面的操作到达
+        self.rejected = 0
+
+    def status(self):
+        return {'score': self.score, 'moves': self.moves}
+
+
+class Match:
+    """一局比赛：以房间ID为比赛ID和随机种子，最多两名玩家"""
+
+    def __init__(self, match_id, clock=time.time):
+        self.match_id = match_id
+        self.seed = int(match_id)
+        self.clock = clock
+        self.players = {}  # 地址 -> MatchPlayer
+        self.last_active = clock()
+        self.finished = False
+
+    def join(self, addr, name):
+        """加入比赛，已满时返回 None；同一地址重复加入返回原来的玩家"""
+        self.last_active = self.clock()
+        if addr in self.players:
+            return self.players[addr]
+        if len(self.players) >= 2:
+            return None
+        player = MatchPlayer(addr, name, self.seed)
+        self.players[addr] = player
+        return player
+
+    def opponent(self, player):
+        return next((other for other in self.players.values() if other is not player), None)
+
+    def is_valid(self, player, move):
+        """检查操作在服务器的棋盘上是否可行"""
+        board = player.board
+        if player.moves <= 0:
+            return False
+        try:
+            if move[0] == 'swap':
+                (r1, c1), (r2, c2) = move[1], move[2]
+                if not (0 <= r1 < board.rows and 0 <= c1 < board.cols and
+                        0 <= r2 < board.rows and 0 <= c2 < board.cols):
+                    return False
+                if abs(r1 - r2) + abs(c1 - c2) != 1:
+                    return False
+                if not board.grid[r1][c1] or not board.grid[r2][c2]:
+                    return False
+                return board.is_valid_swap((r1, c1), (r2, c2))
+            if move[0] == 'special':
+                row, col = move[1]
+                if not (0 <= row < board.rows and 0 <= col < board.cols):
+                    return False
+                gem = board.grid[row][col]
+                return gem is not None and gem.special_type != SpecialType.NONE
+        except (TypeError, ValueError):
+            pass
+        return False
+
+    def accepts(self, player, seq):
+        """缓存满时不接收新的乱序操作
+
+        这时不回确认，客户端稍后重传；前面缺的操作到达、缓存腾空后再收下，
+        而不是确认了又丢掉，让这名玩家之后的操作都卡在缺口上。
+        """
+        return (seq <= player.next_seq or seq in player.pending or
+                len(player.pending) < MAX_PENDING_MOVES)
+
+    def submit(self, player, seq, move):
+        """提交一个操作，按序号依次执行，返回 [(序号, 是否有效), ...]"""
+        self.last_active = self.clock()
+        if seq < player.next_seq:
+            return []
+        player.pending[seq] = move
+        results = []
+        while player.next_seq in player.pending:
+            seq = player.next_seq
+            move = player.pending.pop(seq)
+            player.next_seq += 1
+            if self.is_valid(player, move):
+                if move[0] == 'swap':
+                    move = ('swap', tuple(move[1]), tuple(move[2]))
+                else:
+                    move = ('special', tuple(move[1]))
+                steps = apply_move(player.board, move)
+                player.score += sum(step.score for step in steps)
+                player.moves -= 1
+                results.append((seq, True))
+            else:
+                player.rejected += 1
+                results.append((seq, False))
+        return results
+
+    def is_over(self):
+        return len(self.players) == 2 and all(p.moves <= 0 for p in self.players.values())
+
+
+class MatchServer(asyncio.DatagramProtocol):
+    """无界面的比赛服务器：同时运行很多局比赛的权威棋盘
+
+    客户端把每一步操作提交给服务器，服务器在自己的棋盘上校验并执行，得分
+    以服务器为准。每步之后向双方推送最新的得分和剩余步数（不可靠，丢了等下
+    一次）；操作无效时可靠地发回服务器的棋盘，客户端恢复后继续；双方步数
+    用完时可靠地发送胜负。所有比赛在一个事件循环中处理，一步连锁的结算在
+    毫秒以内。
+    """
+
+    def __init__(self, clock=time.time):
+        self.clock = clock
+        self.transport = None
+        self.matches = {}  # 比赛ID -> Match
+        self.reliable = None
+        self.moves = 0
+        self.rejected = 0
+        self.deferred = 0  # 因缓存已满暂不确认、等客户端重传的操作
+        self.apply_time = 0.0
+
+    def connection_made(self, transport):
+        self.transport = transport
+        self.reliable = ReliableChannel(self.send, encode_message, 'server')
+        loop = asyncio.get_running_loop()
+        loop.call_later(RETRANSMIT_TICK, self.poll)
+        loop.call_later(CLEANUP_INTERVAL, self.cleanup)
+
+    def send(self, data, addr):
+        try:
+            self.transport.sendto(data, addr)
+            return True
+        except OSError as e:
+            print(f"发送到 {addr} 失败: {e}")
+            return False
+
+    def poll(self):
+        self.reliable.poll()
+        asyncio.get_running_loop().call_later(RETRANSMIT_TICK, self.poll)
+
+    def cleanup(self):
+        now = self.clock()
+        for match_id, match in list(self.matches.items()):
+            if now - match.last_active > MATCH_TIMEOUT:
+                del self.matches[match_id]
+                print(f"清理比赛: {match_id}")
+        asyncio.get_running_loop().call_later(CLEANUP_INTERVAL, self.cleanup)
+
+    def datagram_received(self, data, addr):
+        try:
+            message = decode_message(data)
+            if message['type'] == 'ack':
+                self.reliable.handle_ack(message)
+                return
+            if message['type'] == 'match_move' and not self.accepts_move(message, addr):
+                self.deferred += 1
+                return
+            if 'rel_seq' in message and not self.reliable.receive(message, addr):
+                return
+            if message['type'] == 'match_join':
+                self.handle_join(message, addr)
+            elif message['type'] == 'match_move':
+                self.handle_move(message, addr)
+        except Exception as e:
+            print(f"处理来自 {addr} 的消息错误: {e}")
+            import traceback
+            traceback.print_exc()
+
+    def handle_join(self, message, addr):
+        match_id = message['room_id']
+        match = self.matches.get(match_id)
+        if match is None:
+            match = self.matches[match_id] = Match(match_id, self.clock)
+            print(f"新比赛: {match_id}")
+        player = match.join(addr, message.get('name', ''))
+        if player is None:
+            self.reliable.send_message({'type': 'match_error', 'room_id': match_id,
+                                        'reason': "比赛已满"}, addr)
+            return
+        print(f"玩家 {player.name} {addr} 加入比赛 {match_id}")
+        self.send_state(match)
+
+    def accepts_move(self, message, addr):
+        match = self.matches.get(message['room_id'])
+        player = match.players.get(addr) if match else None
+        return player is None or match.accepts(player, message['seq'])
+
+    def handle_move(self, message, addr):
+        match = self.matches.get(message['room_id'])
+        player = match.players.get(addr) if match else None
+        if player is None:
+            return
+        start = time.perf_counter()
+        results = match.submit(player, message['seq'], message['move'])
+        self.apply_time += time.perf_counter() - start
+        if not results:
+            return
+        self.moves += len(results)
+        if not all(valid for _, valid in results):
+            self.rejected += sum(1 for _, valid in results if not valid)
+            self.send_resync(match, player)
+        self.send_state(match)
+        if match.is_over() and not match.finished:
+            match.finished = True
+            self.send_result(match)
+
+    def send_state(self, match):
+        """向双方推送自己和对手的得分、剩余步数"""
+        for player in match.players.values():
+            opponent = match.opponent(player)
+            self.send(encode_message({
+                'type': 'match_state',
+                'room_id': match.match_id,
+                'seq': player.next_seq - 1,
+                'player': player.status(),
+                'opponent': opponent.status() if opponent else None
+            }), player.addr)
+
+    def send_resync(self, match, player):
+        """操作无效：发回服务器的棋盘，并换一个双方共用的补充种子
+
+        随机数状态无法放进一个数据报，双方从新的种子重新开始补充。
+        """
+        seed = random.getrandbits(32)
+        player.board.rng = random.Random(seed)
+        self.reliable.send_message({
+            'type': 'match_resync',
+            'room_id': match.match_id,
+            'seq': player.next_seq - 1,
+            'seed': seed,
+            'state': base64.b64encode(dump_state(player.board, player.score, player.moves)).decode('ascii')
+        }, player.addr)
+
+    def send_result(self, match):
+        """双方步数用完：按服务器的得分判定胜负"""
+        for player in match.players.values():
+            opponent = match.opponent(player)
+            self.reliable.send_message({
+                'type': 'match_result',
+                'room_id': match.match_id,
+                'is_winner': player.score > opponent.score,
+                'score': player.score,
+                'opponent_score': opponent.score
+            }, player.addr)
+        print(f"比赛 {match.match_id} 结束: " +
+              ", ".join(f"{p.name} {p.score}" for p in match.players.values()))
+
+
+async def serve(host='0.0.0.0', port=SERVER_PORT):
+    loop = asyncio.get_running_loop()
+    transport, server = await loop.create_datagram_endpoint(
+        MatchServer, local_addr=(host, port))
+    print(f"比赛服务器已启动: {host}:{transport.get_extra_info('sockname')[1]}")
+    try:
+        await asyncio.Event().wait()
+    finally:
+        transport.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="魔法符文消除比赛服务器")
+    parser.add_argument('--host', default='0.0.0.0')
+    parser.add_argument('--port', type=int, default=SERVER_PORT)
+    args = parser.parse_args()
+    try:
+        asyncio.run(serve(args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
@@ -1,6 +1,6 @@
 import pygame
-import os
 from constants import GameState
+from font_manager import get_font
 
 class InputBox:
     def __init__(self, x, y, width, height, placeholder="", font=None):
@@ -112,54 +112,9 @@ class NetworkLobby:
         self.screen = screen
         self.network = network_manager
         
-        # 初始化字体
-        try:
-            # 尝试从assets目录加载自定义字体
-            font_path = os.path.join('assets', 'simhei.ttf')  # 确保此文件存在
-            if os.path.exists(font_path):
-                self.font = pygame.font.Font(font_path, 36)
-                self.small_font = pygame.font.Font(font_path, 24)
-                print("NetworkLobby: 使用自定义字体文件")
-            else:
-                # 尝试系统中文字体
-                font_names = [
-                    'SimHei',           # Windows 黑体
-                    'Microsoft YaHei',   # Windows 微软雅黑
-                    'PingFang SC',      # macOS 苹方
-                    'Noto Sans CJK SC', # Linux 思源黑体
-                    'WenQuanYi Micro Hei', # Linux 文泉驿微米黑
-                    'Heiti TC',         # macOS 黑体-繁
-                    'Arial Unicode MS'  # 通用 Unicode 字体
-                ]
-                
-                font_loaded = False
-                for font_name in font_names:
-                    try:
-                        self.font = pygame.font.SysFont(font_name, 36)
-                        self.small_font = pygame.font.SysFont(font_name, 24)
-                        print(f"NetworkLobby: 使用系统字体: {font_name}")
-                        font_loaded = True
-                        break
-                    except:
-                        continue
-                
-                if not font_loaded:
-                    print("NetworkLobby: 无法加载中文字体，使用默认字体")
-                    self.font = pygame.font.Font(None, 36)
-                    self.small_font = pygame.font.Font(None, 24)
-        
-        except Exception as e:
-            print(f"NetworkLobby: 字体加载错误: {e}")
-            self.font = pygame.font.Font(None, 36)
-            self.small_font = pygame.font.Font(None, 24)
-        
-        # 测试字体渲染
-        try:
-            test_text = "测试文字"
-            test_surface = self.font.render(test_text, True, (255, 255, 255))
-            print("NetworkLobby: 字体渲染测试成功")
-        except Exception as e:
-            print(f"NetworkLobby: 字体渲染测试失败: {e}")
+        # 初始化字体（与其他界面共享）
+        self.font = get_font(36)
+        self.small_font = get_font(24)
         
         self.ip_input = ""
         self.room_name_input = ""
@@ -264,5 +219,3 @@ class NetworkLobby:
                 True, (100, 255, 100))
             ready_rect = ready_text.get_rect(center=(400, 400))
             self.screen.blit(ready_text, ready_rect)
-        
-        pygame.display.flip() 
\ No newline at end of file
@@ -1,8 +1,81 @@
 import socket
+import selectors
+import collections
+import struct
 import pickle
+import json
 import threading
 import os
 import time
+from spectator import MatchPublisher, MatchFeed, DELTA_MAGIC, FEED_TIMEOUT, unpack_delta
+from state_store import StateStore
+from reliable_channel import ReliableChannel
+from discovery import BeaconScheduler, MULTICAST_GROUP, MULTICAST_TTL, peer_timeout
+
+# 游戏使用的 UDP 端口
+PORT = 5555
+# 接收缓冲大小，需要能放下观战增量（见 spectator.MAX_DELTA_BYTES）
+RECV_BUFFER = 4096
+# 监听线程最长阻塞的秒数，到时检查需要重传的控制消息
+RETRANSMIT_TICK = 0.05
+# 套接字的内核接收缓冲（SO_RCVBUF，字节），很多主机每帧发送对局状态时不至于溢出；
+# 实际大小受系统上限（Linux 的 net.core.rmem_max）限制
+SOCKET_RECV_BUFFER = 1 << 20
+# 每次唤醒每个套接字最多读取的数据报数，读完或到上限后整批处理
+MAX_BATCH = 256
+# 一批中只处理最新一条的消息类型及其键：同一房间的对局状态、同一主机的在线状态
+COALESCE_KEYS = {
+    'game_state': 'room_id',
+    'presence': 'ip',
+}
+# 房间内由对方发出的消息类型，来源必须是会话记录的对方地址；加入请求是建立会话
+# 的握手，观战和比赛服务器的消息来自别的主机，都不在此列
+PEER_MESSAGES = {'start_game', 'game_state', 'game_result', 'ready_state', 'leave_room', 'room'}
+
+# 消息编解码。局域网上任何主机都能向本机的端口发包，pickle.loads 会执行数据里
+# 的代码，线上只用还原基本类型的 JSON；pickle 保留用于基准对比
+def _json_encode(message):
+    return json.dumps(message, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+MESSAGE_CODECS = {
+    'json': (_json_encode, json.loads),
+    'pickle': (pickle.dumps, pickle.loads)
+}
+MESSAGE_CODEC = 'json'
+
+def encode_message(message, codec=MESSAGE_CODEC):
+    return MESSAGE_CODECS[codec][0](message)
+
+def decode_message(data, codec=MESSAGE_CODEC):
+    return MESSAGE_CODECS[codec][1](data)
+
+def decode_packet(data):
+    """解码收到的数据报：观战增量为二进制格式，其他为 encode_message() 编码的消息"""
+    if data[:1] == DELTA_MAGIC:
+        return unpack_delta(data)
+    return decode_message(data)
+
+def udp_queue_bytes(port):
+    """本机绑定在 port 上的 UDP 套接字在内核接收队列中积压的字节数（Linux），无法读取时为 None"""
+    try:
+        with open('/proc/net/udp') as f:
+            next(f)
+            for line in f:
+                fields = line.split()
+                if int(fields[1].split(':')[1], 16) == port:
+                    return int(fields[4].split(':')[1], 16)
+    except (OSError, ValueError, IndexError, StopIteration):
+        pass
+    return None
+
+def set_receive_buffer(sock, size=SOCKET_RECV_BUFFER):
+    """设置接收缓冲并改为非阻塞（监听线程一次读空），返回内核实际分配的大小"""
+    try:
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, size)
+    except OSError as e:
+        print(f"设置接收缓冲失败: {e}")
+    sock.setblocking(False)
+    return sock.getsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF)
 
 class Player:
     def __init__(self, name, ip):
@@ -14,42 +87,232 @@ class Player:
     def __str__(self):
         return f"Player({self.name}, {self.ip}, {self.status})"
 
+_room_id_lock = threading.Lock()
+_last_room_id = 0
+
+def new_room_id():
+    """新的房间ID：毫秒时间戳，同一进程内严格递增（一个进程可以主持很多房间）"""
+    global _last_room_id
+    with _room_id_lock:
+        _last_room_id = max(_last_room_id + 1, int(time.time() * 1000))
+        return str(_last_room_id)
+
 class Room:
     def __init__(self, host_player):
         self.host = host_player
         self.guest = None
         self.status = "等待中"  # 等待中、准备中、游戏中
-        self.room_id = str(int(time.time()))  # 使用时间戳作为房间ID
+        self.room_id = new_room_id()  # 使用时间戳作为房间ID
         self.host_ready = False   # 添加房主准备状态
         self.guest_ready = False  # 添加客人准备状态
+        self.last_active = time.time()  # 最近一次收到房间通告的时间
         
     def __str__(self):
         return f"Room({self.room_id}, host={self.host.name}, guest={self.guest.name if self.guest else 'None'})"
 
+class RoomSession:
+    """一个房间的会话：房间、本机在房间里的角色、对方的地址和这一局的状态
+
+    每个会话使用自己的 UDP 套接字和临时端口，只和对方单播通信，局域网里的其他
+    主机不会收到。双方在加入请求和房主的回复里交换端口。一个 NetworkManager
+    可以同时有很多会话，收到的消息按房间ID分发到各自的会话。
+    """
+
+    def __init__(self, room, is_host, peer_ip=None, peer_port=None, recv_buffer=SOCKET_RECV_BUFFER):
+        self.room = room
+        self.room_id = room.room_id
+        self.is_host = is_host
+        self.peer_ip = peer_ip
+        self.peer_port = peer_port
+        self.socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.socket.bind(('', 0))
+        set_receive_buffer(self.socket, recv_buffer)
+        self.port = self.socket.getsockname()[1]
+        self.is_ready = False
+        self.opponent_ready = False
+        self.opponent_score = 0
+        self.opponent_moves = 0
+        self.opponent_result = None  # 对手报告的结果：True 表示对手获胜
+        # 比赛服务器模式：已提交的操作数、服务器判定的结果和待恢复的棋盘
+        self.move_seq = 0
+        self.server_result = None
+        self.resync = None
+        self.packets_sent = 0
+        self.bytes_sent = 0
+
+    def route(self, default_port):
+        """发往对方的（套接字, 地址），不知道对方会话端口时发往对方的公共端口"""
+        return (self.socket, (self.peer_ip, self.peer_port or default_port))
+
+    def set_ready(self, is_ready):
+        self.is_ready = is_ready
+        if self.is_host:
+            self.room.host_ready = is_ready
+        else:
+            self.room.guest_ready = is_ready
+        self.update_status()
+
+    def set_opponent_ready(self, is_ready):
+        self.opponent_ready = is_ready
+        if self.is_host:
+            self.room.guest_ready = is_ready
+        else:
+            self.room.host_ready = is_ready
+        self.update_status()
+
+    def update_status(self):
+        if self.room.host_ready and self.room.guest_ready:
+            self.room.status = "准备完成"
+        else:
+            self.room.status = "准备中"
+
+    def close(self):
+        self.socket.close()
+
 class NetworkManager:
-    def __init__(self):
+    def __init__(self, port=PORT, recv_buffer=SOCKET_RECV_BUFFER):
         self.connected = False
         self.players = []  # 存储在线玩家列表
         self.socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)  # UDP socket用于广播
+        self.local_ip = self.get_local_ip()
         
-        # 添加监听socket
+        # 添加监听socket；port 为 0 时使用临时端口（同一台机器上运行多个实例时）
         self.listen_socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
         self.listen_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-        self.listen_socket.bind(('', 5555))  # 绑定到所有网卡
+        self.listen_socket.bind(('', port))  # 绑定到所有网卡
+        self.port = self.listen_socket.getsockname()[1]
+        self.recv_buffer = recv_buffer
+        self.recv_buffer_actual = set_receive_buffer(self.listen_socket, recv_buffer)
+        self.join_multicast_group()
         
-        # 启动监听线程
-        self.listen_thread = threading.Thread(target=self.listen_for_broadcasts, daemon=True)
-        self.listen_thread.start()
+        # 发现消息（在线状态、房间）发往组播组，只有加入组的主机会收到
+        self.multicast_socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.multicast_socket.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_TTL, MULTICAST_TTL)
+        
+        # 玩家、房间、观战对局和房间会话的版本化状态，只由网络层写入，界面只读
+        self.store = StateStore()
+        
+        # 观战：向订阅者推送自己的棋盘，以及跟随的其他玩家的棋盘
+        self.publisher = MatchPublisher(self.send_bytes, encode_message)
+        self.feeds = {}  # (房间ID, 玩家IP) -> MatchFeed，观战者离开后由监听线程清理
+        self.last_feed_prune = time.time()
+        
+        # 加入、准备、开始、离开和对局结果逐个单播给对方并等待确认
+        self.reliable = ReliableChannel(self.send_route, encode_message, self.local_ip)
+        
+        # 房间ID -> RoomSession。current_room 是本机玩家所在的房间，
+        # 其他会话是本进程代为主持或加入的房间
+        self.sessions = {}
+        self.selector = selectors.DefaultSelector()
+        self.selector.register(self.listen_socket, selectors.EVENT_READ)
+        
+        # 消息类型 -> 处理函数 handler(会话, 消息, 来源地址)；会话为消息中房间ID对应的会话
+        self.handlers = {
+            'start_game': self.handle_start_game,
+            'game_state': self.handle_game_state,
+            'game_result': self.handle_game_result,
+            'room': self.handle_room_message,
+            'presence': self.handle_presence,
+            'join_request': self.handle_join_request,
+            'ready_state': self.handle_ready_state,
+            'leave_room': self.handle_leave_room,
+            'spectate': self.handle_spectator_message,
+            'spectate_resync': self.handle_spectator_message,
+            'board_delta': self.handle_spectator_message,
+            'board_keyframe': self.handle_spectator_message,
+            'match_state': self.handle_match_message,
+            'match_resync': self.handle_match_message,
+            'match_result': self.handle_match_message,
+            'match_error': self.handle_match_message,
+        }
+        # 接收统计：按类型收到的数据报数、合并掉的旧消息数，以及每批的大小
+        self.received = collections.Counter()
+        self.coalesced = collections.Counter()
+        self.receive_errors = collections.Counter()
+        self.batches = 0
+        self.batch_messages = 0
+        self.max_batch = 0
+        self.full_batches = 0  # 读到 MAX_BATCH 上限、内核里可能还有积压的次数
+        
+        # 比赛服务器的 (地址, 端口)，设置后联机对局的操作由服务器校验，得分和胜负以服务器为准
+        self.match_server = None
+        
+        # 发现信标的发送计划，由对战大厅启动
+        self.discovery = BeaconScheduler(self.send_beacon, lambda: len(self.players))
         
-        print("NetworkManager initialized")
-
         self.rooms = {}  # 存储所有可见的房间
         self.current_room = None  # 当前所在的房间
-        self.is_ready = False  # 添加准备状态
-        self.opponent_ready = False  # 添加对手准备状态
         self.last_cleanup = time.time()
         self.cleanup_interval = 5.0  # 每5秒清理一次
         
+        # 启动监听线程
+        self.listen_thread = threading.Thread(target=self.listen_for_broadcasts, daemon=True)
+        self.listen_thread.start()
+        
+        print("NetworkManager initialized")
+
+    @property
+    def session(self):
+        """本机玩家所在房间的会话"""
+        room = self.current_room
+        return self.sessions.get(room.room_id) if room else None
+
+    def session_for(self, room_id=None):
+        """指定房间的会话，省略时为本机玩家所在房间的会话"""
+        return self.sessions.get(room_id) if room_id else self.session
+
+    # 本机玩家的准备状态和对手信息，来自所在房间的会话
+    @property
+    def is_ready(self):
+        session = self.session
+        return session.is_ready if session else False
+
+    @property
+    def opponent_ready(self):
+        session = self.session
+        return session.opponent_ready if session else False
+
+    @property
+    def opponent_score(self):
+        session = self.session
+        return session.opponent_score if session else 0
+
+    @property
+    def opponent_moves(self):
+        session = self.session
+        return session.opponent_moves if session else 0
+
+    def open_session(self, room, is_host, peer_ip=None, peer_port=None):
+        """为房间建立会话，替换这个房间之前的会话"""
+        self.close_session(self.sessions.get(room.room_id))
+        session = RoomSession(room, is_host, peer_ip, peer_port, self.recv_buffer)
+        self.sessions[room.room_id] = session
+        self.selector.register(session.socket, selectors.EVENT_READ, session)
+        return session
+
+    def close_session(self, session):
+        """关闭会话；会话可能已经从 sessions 中移除（等待离开消息确认时）"""
+        if session is None:
+            return
+        if self.sessions.get(session.room_id) is session:
+            del self.sessions[session.room_id]
+            self.store.remove('session', session.room_id)
+        try:
+            self.selector.unregister(session.socket)
+        except (KeyError, ValueError):
+            pass
+        session.close()
+
+    def touch_room(self, room):
+        """房间对象有变化后登记到状态存储"""
+        if room is not None:
+            self.store.put('room', room.room_id, room)
+
+    def touch_session(self, session):
+        """会话里对手或比赛服务器的状态有变化后登记到状态存储，空闲的界面据此刷新"""
+        if session is not None and self.sessions.get(session.room_id) is session:
+            self.store.put('session', session.room_id, session)
+
     def get_local_ip(self):
         """获取本机IP地址"""
         try:
@@ -61,28 +324,48 @@ class NetworkManager:
         except Exception:
             return "127.0.0.1"
 
-    def broadcast_presence(self):
-        """广播自己的存在"""
+    def join_multicast_group(self):
+        """监听套接字加入发现组播组，失败时仍能收到广播"""
         try:
+            membership = struct.pack('4s4s', socket.inet_aton(MULTICAST_GROUP), socket.inet_aton('0.0.0.0'))
+            self.listen_socket.setsockopt(socket.IPPROTO_IP, socket.IP_ADD_MEMBERSHIP, membership)
+            return True
+        except OSError as e:
+            print(f"加入组播组失败，只能收到广播: {e}")
+            return False
+
+    def send_discovery(self, message):
+        """把发现消息发到组播组，网络不支持组播时改用广播"""
+        data = encode_message(message)
+        try:
+            self.multicast_socket.sendto(data, (MULTICAST_GROUP, self.port))
+        except OSError:
             broadcast_socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
             broadcast_socket.setsockopt(socket.SOL_SOCKET, socket.SO_BROADCAST, 1)
-            
-            # 修改广播地址为局域网广播地址
-            broadcast_address = '255.255.255.255'  # 全网广播
-            port = 5555
-            
+            broadcast_socket.sendto(data, ('255.255.255.255', self.port))
+            broadcast_socket.close()
+
+    def broadcast_presence(self):
+        """通告自己的存在"""
+        try:
             message = {
                 'type': 'presence',
                 'name': socket.gethostname(),
-                'ip': self.get_local_ip()
+                'ip': self.local_ip
             }
-            
-            broadcast_socket.sendto(pickle.dumps(message), (broadcast_address, port))
-            broadcast_socket.close()
+            self.send_discovery(message)
             print(f"已广播在线状态: {message}")
         except Exception as e:
             print(f"广播失败: {e}")
+
+    def send_beacon(self):
+        """发送一次发现信标：在线状态，以及本机主持的房间"""
+        self.broadcast_presence()
+        for session in list(self.sessions.values()):
+            if session.is_host:
+                self.broadcast_room(session.room)
     
+
     def request_player_list(self):
         """
         请求获取在线玩家列表
@@ -170,40 +453,38 @@ class NetworkManager:
             print(f"拒绝邀请失败: {e}")
             return False
 
+    def room_message(self, room):
+        """房间的完整状态消息"""
+        return {
+            'type': 'room',
+            'room_id': room.room_id,
+            'host_name': room.host.name,
+            'host_ip': room.host.ip,
+            'status': room.status,
+            'guest': room.guest.name if room.guest else None,
+            'guest_ip': room.guest.ip if room.guest else None,
+            'host_ready': room.host_ready,  # 添加准备状态
+            'guest_ready': room.guest_ready  # 添加准备状态
+        }
+
     def broadcast_room(self, room):
-        """广播房间信息"""
+        """通告房间信息"""
         try:
-            broadcast_socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-            broadcast_socket.setsockopt(socket.SOL_SOCKET, socket.SO_BROADCAST, 1)
-            
-            message = {
-                'type': 'room',
-                'room_id': room.room_id,
-                'host_name': room.host.name,
-                'host_ip': room.host.ip,
-                'status': room.status,
-                'guest': room.guest.name if room.guest else None,
-                'host_ready': room.host_ready,  # 添加准备状态
-                'guest_ready': room.guest_ready  # 添加准备状态
-            }
-            
-            broadcast_socket.sendto(pickle.dumps(message), ('255.255.255.255', 5555))
-            broadcast_socket.close()
+            message = self.room_message(room)
+            self.send_discovery(message)
             print(f"已广播房间信息: {message}")
         except Exception as e:
             print(f"广播房间失败: {e}")
     
     def create_room(self):
-        """创建新房间"""
+        """创建新房间，本机玩家作为房主"""
         try:
-            local_player = Player(socket.gethostname(), self.get_local_ip())
+            local_player = Player(socket.gethostname(), self.local_ip)
             room = Room(local_player)
-            room.status = "等待中"
-            self.rooms[room.room_id] = room
+            if self.session:
+                self.close_session(self.session)
+            self.host_room(room)
             self.current_room = room
-            
-            # 立即广播新房间信息
-            self.broadcast_room(room)
             print(f"创建房间成功: {room.room_id}")
             return room
         except Exception as e:
@@ -211,35 +492,54 @@ class NetworkManager:
             import traceback
             traceback.print_exc()
             return None
+
+    def host_room(self, room):
+        """主持一个房间：建立等待客人加入的会话并通告房间，返回会话
+
+        本进程可以同时主持很多房间（例如作为比赛现场的主机），每个房间一个会话。
+        """
+        room.status = "等待中"
+        self.rooms[room.room_id] = room
+        session = self.open_session(room, is_host=True)
+        self.touch_room(room)
+        
+        # 立即广播新房间信息
+        self.broadcast_room(room)
+        return session
     
-    def join_room(self, room_id, host_ip):
-        """加入房间"""
+
+    def join_room(self, room_id, host_ip, host_port=None, local=True):
+        """加入房间
+
+        host_port 为房主的公共端口，省略时与本机相同；local 为 False 时只建立
+        会话，不作为本机玩家所在的房间。
+        """
         try:
             if room_id in self.rooms:
                 room = self.rooms[room_id]
                 if room.status != "等待中":
                     print(f"房间 {room_id} 不可加入：状态为 {room.status}")
                     return False
-                    
-                # 重置准备状态
-                self.is_ready = False
-                self.opponent_ready = False
                 
-                # 发送加入请求
+                if local and self.session:
+                    self.close_session(self.session)
+                    
+                # 发送加入请求，附上自己的会话端口；准备状态随新会话重置
+                session = self.open_session(room, is_host=False, peer_ip=host_ip)
                 message = {
                     'type': 'join_request',
                     'room_id': room_id,
                     'player_name': socket.gethostname(),
-                    'player_ip': self.get_local_ip()
+                    'player_ip': self.local_ip,
+                    'session_port': session.port
                 }
                 
-                # 创建新的socket发送请求
-                join_socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-                join_socket.sendto(pickle.dumps(message), (host_ip, 5555))
-                join_socket.close()
+                # 可靠地发给房主的公共端口，丢包时自动重传
+                self.reliable.send_message(message, (session.socket, (host_ip, host_port or self.port)))
                 
                 # 更新本地房间状态
-                self.current_room = room
+                if local:
+                    self.current_room = room
                 print(f"发送加入房间请求: {room_id}")
                 return True
                 
@@ -252,17 +552,72 @@ class NetworkManager:
             traceback.print_exc()
             return False
 
-    def handle_join_request(self, message):
-        """处理加入房间请求"""
-        if self.current_room and message['room_id'] == self.current_room.room_id:
-            if not self.current_room.guest:
-                guest = Player(message['player_name'], message['player_ip'])
-                self.current_room.guest = guest
-                self.current_room.status = "准备中"
-                self.broadcast_room(self.current_room)
-                print(f"玩家 {guest.name} 加入房间")
-                return True
-        return False
+    def send_control(self, message, session, on_done=None):
+        """通过可靠通道把控制消息发给会话的对方，还没有对方时不发送"""
+        if session and session.peer_ip:
+            self.reliable.send_message(message, session.route(self.port), on_done)
+
+
+
+    def start_room_game(self, room_id=None):
+        """房主开始游戏：可靠地通知客人，再广播房间状态让观战者知道对局开始"""
+        session = self.session_for(room_id)
+        room = session.room
+        self.send_control({
+            'type': 'start_game',
+            'room_id': room.room_id,
+            'host_ip': room.host.ip
+        }, session)
+        room.status = "游戏中"
+        self.touch_room(room)
+        self.broadcast_room(room)
+
+    def leave_current_room(self):
+        """离开当前房间并通知房间里的其他玩家"""
+        room = self.current_room
+        if room is None:
+            return
+        self.current_room = None
+        self.leave_room(room.room_id)
+
+    def leave_room(self, room_id):
+        """离开房间：通知对方，收到确认（或放弃重传）后关闭会话"""
+        session = self.sessions.pop(room_id, None)
+        if session is None:
+            return
+        if self.current_room and self.current_room.room_id == room_id:
+            self.current_room = None
+        self.touch_room(session.room)
+        if session.peer_ip:
+            self.send_control({
+                'type': 'leave_room',
+                'room_id': room_id,
+                'player_ip': self.local_ip
+            }, session, on_done=lambda delivered: self.close_session(session))
+        else:
+            self.close_session(session)
+
+    def handle_join_request(self, session, message, addr):
+        """房主处理加入请求：记录客人和它的会话端口，回复房间状态"""
+        if session is None or not session.is_host:
+            return False
+        room = session.room
+        if room.guest and session.peer_ip:
+            print(f"房间 {room.room_id} 已满，忽略加入请求")
+            return False
+        guest = Player(message['player_name'], message['player_ip'])
+        room.guest = guest
+        room.status = "准备中"
+        session.peer_ip = addr[0]
+        session.peer_port = message.get('session_port')
+        session.opponent_ready = False
+        self.touch_room(room)
+        self.broadcast_room(room)
+        # 之后与客人的通信都走直连会话；广播可能丢失，客人另外可靠地收到
+        # 一份房间状态，附带房主的会话端口
+        self.send_control(dict(self.room_message(room), session_port=session.port), session)
+        print(f"玩家 {guest.name} 加入房间")
+        return True
 
     def send_data(self, data):
         """发送通用数据"""
@@ -270,7 +625,7 @@ class NetworkManager:
             broadcast_socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
             broadcast_socket.setsockopt(socket.SOL_SOCKET, socket.SO_BROADCAST, 1)
             
-            broadcast_socket.sendto(pickle.dumps(data), ('255.255.255.255', 5555))
+            broadcast_socket.sendto(encode_message(data), ('255.255.255.255', self.port))
             broadcast_socket.close()
             print(f"发送数据: {data}")
             return True
@@ -278,68 +633,178 @@ class NetworkManager:
             print(f"发送数据失败: {e}")
             return False
     
-    def send_ready_state(self, is_ready):
-        """发送准备状态"""
+    def send_bytes(self, data, ip):
+        """向指定IP的公共端口单播已编码的数据，成功返回 True"""
         try:
-            if self.current_room:
-                self.is_ready = is_ready
-                # 更新本地房间状态
-                if self.current_room.host.ip == self.get_local_ip():
-                    self.current_room.host_ready = is_ready
-                elif self.current_room.guest and self.current_room.guest.ip == self.get_local_ip():
-                    self.current_room.guest_ready = is_ready
+            self.socket.sendto(data, (ip, self.port))
+            return True
+        except Exception as e:
+            print(f"发送到 {ip} 失败: {e}")
+            return False
+
+    def send_route(self, data, route):
+        """从指定套接字向指定地址发送，route 为 (套接字, 地址)"""
+        sock, addr = route
+        try:
+            sock.sendto(data, addr)
+            return True
+        except OSError as e:
+            print(f"发送到 {addr} 失败: {e}")
+            return False
+
+    def join_match(self, room_id=None):
+        """在比赛服务器上加入房间对应的比赛"""
+        session = self.session_for(room_id)
+        if session is None or self.match_server is None:
+            return False
+        session.move_seq = 0
+        session.server_result = None
+        session.resync = None
+        self.reliable.send_message({
+            'type': 'match_join',
+            'room_id': session.room_id,
+            'name': socket.gethostname()
+        }, (session.socket, self.match_server))
+        return True
+
+    def send_match_move(self, move, room_id=None):
+        """把一步操作可靠地提交给比赛服务器，move 为 ('swap', a, b) 或 ('special', pos)"""
+        session = self.session_for(room_id)
+        if session is None or self.match_server is None:
+            return
+        session.move_seq += 1
+        self.reliable.send_message({
+            'type': 'match_move',
+            'room_id': session.room_id,
+            'seq': session.move_seq,
+            'move': move
+        }, (session.socket, self.match_server))
 
-                # 发送准备状态消息
+    def handle_match_message(self, session, message, addr):
+        """处理比赛服务器的消息"""
+        if session is None:
+            return
+        if message['type'] == 'match_state':
+            # 对手的得分和步数以服务器为准
+            if message['opponent']:
+                session.opponent_score = message['opponent']['score']
+                session.opponent_moves = message['opponent']['moves']
+        elif message['type'] == 'match_resync':
+            # 只恢复反映最新一步的棋盘，之后提交的操作还会再校验
+            if message['seq'] >= session.move_seq:
+                session.resync = message
+            print(f"服务器判定操作无效，恢复到第 {message['seq']} 步的棋盘")
+        elif message['type'] == 'match_result':
+            session.opponent_score = message['opponent_score']
+            session.opponent_moves = 0
+            session.server_result = message['is_winner']
+            print(f"服务器判定结果: {'获胜' if message['is_winner'] else '落败'} "
+                  f"({message['score']} : {message['opponent_score']})")
+        elif message['type'] == 'match_error':
+            print(f"比赛服务器错误: {message['reason']}")
+        self.touch_session(session)
+
+    def watch_room(self, room):
+        """观战：向房间里的两名玩家订阅（续订）棋盘推送"""
+        for player in (room.host, room.guest):
+            if player is None or not player.ip:
+                continue
+            key = (room.room_id, player.ip)
+            if key not in self.feeds:
+                self.feeds[key] = MatchFeed(room.room_id, player.ip)
+                self.store.put('match', key, self.feeds[key])
+            self.feeds[key].last_watched = time.time()
+            self.send_bytes(encode_message({
+                'type': 'spectate',
+                'room_id': room.room_id,
+                'ip': self.local_ip
+            }), player.ip)
+
+    def prune_feeds(self, now=None):
+        """丢弃观战者已经不再续订的对局棋盘"""
+        now = time.time() if now is None else now
+        for key, feed in list(self.feeds.items()):
+            if now - feed.last_watched > FEED_TIMEOUT:
+                del self.feeds[key]
+                self.store.remove('match', key)
+
+    def handle_spectator_message(self, session, message, addr):
+        """处理观战相关的消息"""
+        if message['type'] in ('spectate', 'spectate_resync'):
+            # 自己是玩家：有观战者订阅或请求补发关键帧
+            if self.publisher.room_id == message['room_id']:
+                if message['type'] == 'spectate':
+                    self.publisher.subscribe(message['ip'])
+                else:
+                    self.publisher.send_keyframe([message['ip']])
+            return
+
+        # 自己是观战者：收到增量或关键帧
+        key = (message['room_id'], message['player_ip'])
+        feed = self.feeds.get(key)
+        if feed is None:
+            return
+        version = feed.version
+        if feed.receive(message):
+            self.send_bytes(encode_message({
+                'type': 'spectate_resync',
+                'room_id': message['room_id'],
+                'ip': self.local_ip
+            }), message['player_ip'])
+        if feed.version != version:
+            self.store.put('match', key, feed)
+
+    def send_ready_state(self, is_ready, room_id=None):
+        """发送准备状态，room_id 省略时为本机玩家所在的房间"""
+        try:
+            session = self.session_for(room_id)
+            if session:
+                room = session.room
+                session.set_ready(is_ready)
+
+                # 可靠地把准备状态发给对方
                 ready_message = {
                     'type': 'ready_state',
-                    'room_id': self.current_room.room_id,
-                    'player_ip': self.get_local_ip(),
+                    'room_id': room.room_id,
+                    'player_ip': self.local_ip,
                     'is_ready': is_ready,
-                    'is_host': self.current_room.host.ip == self.get_local_ip()
+                    'is_host': session.is_host
                 }
-                self.send_data(ready_message)
+                self.send_control(ready_message, session)
+                self.touch_room(room)
 
-                # 更新房间状态
-                if self.current_room.host_ready and self.current_room.guest_ready:
-                    self.current_room.status = "准备完成"
-                else:
-                    self.current_room.status = "准备中"
-
-                # 广播房间状态（包含完整的准备状态）
-                room_message = {
-                    'type': 'room',
-                    'room_id': self.current_room.room_id,
-                    'host_name': self.current_room.host.name,
-                    'host_ip': self.current_room.host.ip,
-                    'status': self.current_room.status,
-                    'guest': self.current_room.guest.name if self.current_room.guest else None,
-                    'guest_ip': self.current_room.guest.ip if self.current_room.guest else None,
-                    'host_ready': self.current_room.host_ready,
-                    'guest_ready': self.current_room.guest_ready
-                }
-                self.send_data(room_message)
+                # 房主向大厅广播房间状态；客人的准备状态由房主收到后广播
+                if session.is_host:
+                    self.broadcast_room(room)
                 
                 print(f"发送准备状态: {'已准备' if is_ready else '未准备'}")
-                print(f"当前房间状态: 房主{'已' if self.current_room.host_ready else '未'}准备, "
-                      f"客人{'已' if self.current_room.guest_ready else '未'}准备")
+                print(f"当前房间状态: 房主{'已' if room.host_ready else '未'}准备, "
+                      f"客人{'已' if room.guest_ready else '未'}准备")
                 return True
         except Exception as e:
             print(f"发送准备状态失败: {e}")
             return False
     
+
     def cleanup_stale_data(self):
         """清理过期的玩家和房间数据"""
         current_time = time.time()
         if current_time - self.last_cleanup >= self.cleanup_interval:
             self.last_cleanup = current_time
             
-            # 清理离线玩家
+            # 清理离线玩家：超时按信标的最长间隔计算
+            timeout = peer_timeout(len(self.players))
+            for player in self.players:
+                if current_time - player.last_seen >= timeout:
+                    self.store.remove('player', player.ip)
             self.players = [player for player in self.players 
-                          if current_time - player.last_seen < 10]
+                          if current_time - player.last_seen < timeout]
             
             # 清理空房间或过期房间
             stale_rooms = []
             for room_id, room in self.rooms.items():
+                if room_id in self.sessions:
+                    continue  # 本进程主持或加入的房间随会话关闭
                 try:
                     # 检查房主是否在线
                     host_online = any(p.ip == room.host.ip for p in self.players)
@@ -349,7 +814,7 @@ class NetworkManager:
                         continue
                     
                     # 检查空房间
-                    if not room.guest and current_time - room.last_active > 30:
+                    if not room.guest and current_time - room.last_active > timeout:
                         stale_rooms.append(room_id)
                         print(f"标记清理房间 {room_id}: 空房间超时")
                         
@@ -361,136 +826,227 @@ class NetworkManager:
             for room_id in stale_rooms:
                 if room_id in self.rooms:
                     del self.rooms[room_id]
+                    self.store.remove('room', room_id)
                     if self.current_room and self.current_room.room_id == room_id:
                         self.current_room = None
+                    self.close_session(self.sessions.get(room_id))
                     print(f"清理房间: {room_id}")
 
     def listen_for_broadcasts(self):
-        """监听其他玩家的广播"""
+        """监听公共端口和所有会话端口，所有消息都在这个线程里处理
+
+        每次唤醒把就绪的套接字读空（每个最多 MAX_BATCH 个数据报），再整批处理。
+        """
         while True:
             try:
-                data, addr = self.listen_socket.recvfrom(1024)
-                message = pickle.loads(data)
-                
-                if message['type'] == 'start_game':
-                    # 处理开始游戏消息
-                    if (self.current_room and 
-                        message['room_id'] == self.current_room.room_id):
-                        self.current_room.status = "游戏中"
-                        # 添加一个回调函数来通知游戏状态改变
-                        if hasattr(self, 'on_game_start'):
-                            self.on_game_start()
-                        print("收到开始游戏消息，准备进入游戏")
-                
-                elif message['type'] == 'game_state':
-                    # 处理游戏状态更新
-                    if (self.current_room and 
-                        message['room_id'] == self.current_room.room_id and
-                        message['player_ip'] != self.get_local_ip()):
-                        # 更新对手的游戏状态
-                        self.opponent_score = message['score']
-                        self.opponent_moves = message['moves_left']
-                        print(f"对手状态更新 - 分数: {self.opponent_score}, 步数: {self.opponent_moves}")
-                
-                elif message['type'] == 'room':
-                    # 处理房间广播
-                    room_id = message['room_id']
-                    # 创建或更新房间
-                    if room_id not in self.rooms:
-                        # 创建新房间
-                        host = Player(message['host_name'], message['host_ip'])
-                        room = Room(host)
-                        room.room_id = room_id
-                        room.status = message['status']
-                        room.host_ready = message.get('host_ready', False)
-                        room.guest_ready = message.get('guest_ready', False)
-                        if message.get('guest'):
-                            room.guest = Player(message['guest'], message.get('guest_ip'))
-                        self.rooms[room_id] = room
-                        print(f"发现新房间: {room_id}")
-                    else:
-                        # 更新现有房间
-                        room = self.rooms[room_id]
-                        room.status = message['status']
-                        room.host_ready = message.get('host_ready', False)
-                        room.guest_ready = message.get('guest_ready', False)
-                        if message.get('guest'):
-                            if not room.guest:
-                                room.guest = Player(message['guest'], message.get('guest_ip'))
-                            else:
-                                room.guest.ip = message.get('guest_ip')
-                        else:
-                            room.guest = None
-                    
-                    # 如果是当前房间，同步状态
-                    if self.current_room and room_id == self.current_room.room_id:
-                        self.current_room = room
-                        if self.current_room.guest and self.current_room.guest.ip == self.get_local_ip():
-                            self.opponent_ready = room.host_ready
-                        else:
-                            self.opponent_ready = room.guest_ready if room.guest else False
-                        
-                    print(f"房间状态更新: {room_id} - {room.status}")
-
-                elif message['type'] == 'presence':
-                    # 检查是否是自己发出的广播
-                    if message['ip'] != self.get_local_ip():
-                        # 更新或添加玩家
-                        new_player = Player(message['name'], message['ip'])
-                        
-                        # 检查玩家是否已存在
-                        existing_player = next(
-                            (p for p in self.players if p.ip == message['ip']), 
-                            None
-                        )
-                        
-                        if existing_player:
-                            existing_player.last_seen = time.time()
-                            existing_player.status = "在线"
-                        else:
-                            self.players.append(new_player)
-                            
-                        print(f"收到玩家广播: {message}")
-                        print(f"当前在线玩家数: {len(self.players)}")
-                    
-                elif message['type'] == 'join_request':
-                    # 处理加入请求
-                    if self.current_room and message['room_id'] == self.current_room.room_id:
-                        guest = Player(message['player_name'], message['player_ip'])
-                        self.current_room.guest = guest
-                        self.broadcast_room(self.current_room)
-                        print(f"玩家加入房间: {guest.name}")
-                
-                elif message['type'] == 'ready_state':
-                    # 处理准备状态更新
-                    self.handle_ready_state(message)
-                    
-                elif message['type'] == 'leave_room':
-                    # 处理离开房间
-                    if (self.current_room and 
-                        message['room_id'] == self.current_room.room_id):
-                        if message['player_ip'] == self.current_room.host.ip:
-                            # 房主离开，解散房间
-                            self.current_room = None
-                            print("房主离开，房间已解散")
-                        elif self.current_room.guest and message['player_ip'] == self.current_room.guest.ip:
-                            # 客人离开
-                            self.current_room.guest = None
-                            self.opponent_ready = False
-                            print("玩家离开房间")
-                        self.broadcast_room(self.current_room)
+                self.reliable.poll()
+                batch = []
+                for key, _ in self.selector.select(RETRANSMIT_TICK):
+                    self.drain(key.fileobj, batch)
+                if batch:
+                    self.handle_batch(batch)
+                now = time.time()
+                if now - self.last_feed_prune >= FEED_TIMEOUT:
+                    self.last_feed_prune = now
+                    self.prune_feeds(now)
+                self.cleanup_stale_data()
                 
             except Exception as e:
                 print(f"监听广播错误: {e}")
                 import traceback
                 traceback.print_exc()
 
+    def drain(self, sock, batch):
+        """读出套接字中已到达的数据报，追加 (消息, 套接字, 地址) 到 batch"""
+        for _ in range(MAX_BATCH):
+            try:
+                data, addr = sock.recvfrom(RECV_BUFFER)
+            except BlockingIOError:
+                return
+            except OSError:
+                return  # 会话套接字刚被关闭
+            try:
+                message = decode_packet(data)
+            except ValueError:
+                message = None
+            # 只接受带类型的消息对象，一个坏包不影响同一批里其他主机的消息
+            if isinstance(message, dict) and 'type' in message:
+                batch.append((message, sock, addr))
+            else:
+                self.receive_errors['decode'] += 1
+        self.full_batches += 1
+
+    def handle_batch(self, batch):
+        """处理一批消息；可以合并的类型只处理每个键最新的一条"""
+        self.batches += 1
+        self.batch_messages += len(batch)
+        self.max_batch = max(self.max_batch, len(batch))
+        latest = {}
+        for index, (message, _, _) in enumerate(batch):
+            field = COALESCE_KEYS.get(message.get('type'))
+            if field and 'rel_seq' not in message:
+                latest[(message['type'], message.get(field))] = index
+        
+        for index, (message, sock, addr) in enumerate(batch):
+            message_type = message.get('type')
+            self.received[message_type] += 1
+            field = COALESCE_KEYS.get(message_type)
+            if field and 'rel_seq' not in message and \
+                    latest[(message_type, message.get(field))] != index:
+                self.coalesced[message_type] += 1
+                continue
+            try:
+                self.handle_message(message, sock, addr)
+            except Exception as e:
+                self.receive_errors['handler'] += 1
+                print(f"处理 {message_type} 消息错误: {e}")
+                import traceback
+                traceback.print_exc()
+
+    def receive_stats(self):
+        """接收路径的统计：按类型的计数、批大小和公共端口在内核中积压的字节数"""
+        return {
+            'received': dict(self.received),
+            'coalesced': dict(self.coalesced),
+            'errors': dict(self.receive_errors),
+            'batches': self.batches,
+            'mean_batch': self.batch_messages / self.batches if self.batches else 0.0,
+            'max_batch': self.max_batch,
+            'full_batches': self.full_batches,
+            'recv_buffer': self.recv_buffer_actual,
+            'queued_bytes': udp_queue_bytes(self.port)
+        }
+
+    def handle_message(self, message, sock=None, addr=None):
+        """处理收到的一条消息：按类型查处理函数，房间内的消息交给对应的会话"""
+        # 可靠通道：确认消息不再往下处理，重复的控制消息只回确认
+        if message['type'] == 'ack':
+            self.reliable.handle_ack(message)
+            return
+        session = self.sessions.get(message.get('room_id'))
+        # 局域网上的其他主机不能冒充对方；在确认之前丢弃，真正的对方没收到确认会重传
+        if session and not self.is_from_peer(session, message, addr):
+            self.receive_errors['foreign_sender'] += 1
+            return
+        if 'rel_seq' in message and not self.reliable.receive(message, (sock, addr)):
+            return
+        
+        handler = self.handlers.get(message['type'])
+        if handler is None:
+            self.receive_errors['unknown_type'] += 1
+            return
+        handler(session, message, addr)
+
+    def is_from_peer(self, session, message, addr):
+        """房间内的消息是否来自会话的对方（按IP比较，对方可能从会话端口或公共端口发送）"""
+        if message['type'] not in PEER_MESSAGES or addr is None:
+            return True
+        if message['type'] == 'room' and session.is_host:
+            return True  # 自己主持的房间的通告，处理时会忽略
+        return session.peer_ip is not None and addr[0] == session.peer_ip
+
+    def handle_start_game(self, session, message, addr):
+        # 观战者据此知道哪些房间正在对局
+        if message.get('room_id') in self.rooms:
+            self.rooms[message['room_id']].status = "游戏中"
+            self.touch_room(self.rooms[message['room_id']])
+        # 处理开始游戏消息
+        if session:
+            session.room.status = "游戏中"
+            self.touch_room(session.room)
+            # 本机玩家所在的房间开始时通知游戏
+            if session is self.session and hasattr(self, 'on_game_start'):
+                self.on_game_start()
+            print("收到开始游戏消息，准备进入游戏")
+
+    def handle_game_state(self, session, message, addr):
+        # 更新对手的游戏状态；使用比赛服务器时不采信对手自己报告的分数
+        if session and self.match_server is None:
+            session.opponent_score = message['score']
+            session.opponent_moves = message['moves_left']
+            self.touch_session(session)
+
+    def handle_game_result(self, session, message, addr):
+        if session:
+            session.opponent_result = message['is_winner']
+            self.touch_session(session)
+            print(f"对手报告结果: {'对手获胜' if message['is_winner'] else '对手落败'}")
+
+    def handle_room_message(self, session, message, addr):
+        """处理房间通告，以及房主回复给客人的房间状态"""
+        room_id = message['room_id']
+        # 创建或更新房间
+        if room_id not in self.rooms:
+            # 创建新房间
+            host = Player(message['host_name'], message['host_ip'])
+            room = Room(host)
+            room.room_id = room_id
+            room.status = message['status']
+            room.host_ready = message.get('host_ready', False)
+            room.guest_ready = message.get('guest_ready', False)
+            if message.get('guest'):
+                room.guest = Player(message['guest'], message.get('guest_ip'))
+            self.rooms[room_id] = room
+            print(f"发现新房间: {room_id}")
+        elif session and session.is_host:
+            # 自己主持的房间以本地状态为准（收到的是自己发出的通告）
+            return
+        else:
+            # 更新现有房间；内容没有变化的重复通告不登记
+            room = self.rooms[room_id]
+            room.last_active = time.time()
+            before = (room.status, room.host_ready, room.guest_ready,
+                      room.guest.name if room.guest else None, room.guest.ip if room.guest else None)
+            room.status = message['status']
+            room.host_ready = message.get('host_ready', False)
+            room.guest_ready = message.get('guest_ready', False)
+            if message.get('guest'):
+                if not room.guest:
+                    room.guest = Player(message['guest'], message.get('guest_ip'))
+                else:
+                    room.guest.ip = message.get('guest_ip')
+            else:
+                room.guest = None
+            after = (room.status, room.host_ready, room.guest_ready,
+                     room.guest.name if room.guest else None, room.guest.ip if room.guest else None)
+            if before == after and not session:
+                return
+        
+        # 作为客人加入的房间：同步房主的准备状态和会话端口
+        if session and not session.is_host:
+            if message.get('session_port'):
+                session.peer_port = message['session_port']
+            session.opponent_ready = room.host_ready
+        self.touch_room(room)
+
+    def handle_presence(self, session, message, addr):
+        # 检查是否是自己发出的广播
+        if message['ip'] == self.local_ip:
+            return
+        # 检查玩家是否已存在
+        existing_player = next(
+            (p for p in self.players if p.ip == message['ip']), 
+            None
+        )
+        
+        if existing_player:
+            existing_player.last_seen = time.time()
+            # 只刷新在线时间时不算变化，界面不必重建
+            if existing_player.status != "在线":
+                existing_player.status = "在线"
+                self.store.put('player', existing_player.ip, existing_player)
+        else:
+            new_player = Player(message['name'], message['ip'])
+            self.players.append(new_player)
+            self.store.put('player', new_player.ip, new_player)
+            print(f"发现新玩家: {new_player}, 当前在线玩家数: {len(self.players)}")
+
     def check_firewall(self):
         """检查防火墙设置"""
         try:
             test_socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
             test_socket.setsockopt(socket.SOL_SOCKET, socket.SO_BROADCAST, 1)
-            test_socket.sendto(b"test", ('255.255.255.255', 5555))
+            test_socket.sendto(b"test", ('255.255.255.255', PORT))
             test_socket.close()
             print("防火墙测试通过")
             return True
@@ -535,7 +1091,7 @@ class NetworkManager:
         """记录网络状态"""
         try:
             print("\n=== 网络状态诊断 ===")
-            print(f"本机IP: {self.get_local_ip()}")
+            print(f"本机IP: {self.local_ip}")
             print(f"广播地址: {self.get_broadcast_address()}")
             print(f"已发现玩家数: {len(self.players)}")
             print(f"网络接口: {self.get_network_interfaces()}")
@@ -543,93 +1099,76 @@ class NetworkManager:
         except Exception as e:
             print(f"状态记录错误: {e}")
 
-    def handle_leave_room(self, message):
-        """处理离开房间消息"""
-        room_id = message.get('room_id')
-        player_ip = message.get('player_ip')
-        
-        if room_id in self.rooms:
-            room = self.rooms[room_id]
-            
-            # 如果是房主离开，删除房间
-            if player_ip == room.host.ip:
-                del self.rooms[room_id]
-                if self.current_room and self.current_room.room_id == room_id:
-                    self.current_room = None
-                print(f"房间 {room_id} 已解散")
-                
-            # 如果是客人离开，更新房间状态
-            elif room.guest and player_ip == room.guest.ip:
-                room.guest = None
-                room.guest_ready = False  # 重置客人准备状态
-                room.status = "等待中"
-                print(f"玩家离开房间 {room_id}")
-                
-                # 重置当前房间状态
-                if self.current_room and self.current_room.room_id == room_id:
-                    self.current_room = None
-                    self.is_ready = False
-                    self.opponent_ready = False
-            
-            # 广播房间状态更新
-            if room_id in self.rooms:
-                self.broadcast_room(self.rooms[room_id])
+    def handle_leave_room(self, session, message, addr):
+        """处理对方离开房间的消息"""
+        if session is None:
+            return
+        room = session.room
+        if session.is_host:
+            # 客人离开，房间重新等待加入
+            room.guest = None
+            room.guest_ready = False
+            room.status = "等待中"
+            session.peer_ip = None
+            session.peer_port = None
+            session.opponent_ready = False
+            self.touch_room(room)
+            self.broadcast_room(room)
+            print(f"玩家离开房间 {room.room_id}")
+        else:
+            # 房主离开，解散房间
+            if self.current_room is room:
+                self.current_room = None
+            self.rooms.pop(room.room_id, None)
+            self.store.remove('room', room.room_id)
+            # 确认已经回给房主，这里可以直接关闭会话
+            self.close_session(session)
+            print(f"房主离开，房间 {room.room_id} 已解散")
 
-    def broadcast_game_state(self, score, moves_left):
-        """广播游戏状态"""
-        if self.current_room:
+    def broadcast_game_state(self, score, moves_left, room_id=None):
+        """把游戏状态发给对手：经直连会话单播，不可靠，丢了等下一次"""
+        session = self.session_for(room_id)
+        if session and session.peer_ip:
             message = {
                 'type': 'game_state',
-                'room_id': self.current_room.room_id,
-                'player_ip': self.get_local_ip(),
+                'room_id': session.room_id,
+                'player_ip': self.local_ip,
                 'score': score,
                 'moves_left': moves_left
             }
-            self.send_data(message)
+            self.send_route(encode_message(message), session.route(self.port))
 
-    def broadcast_game_result(self, is_winner):
-        """广播游戏结果"""
-        if self.current_room:
+    def broadcast_game_result(self, is_winner, room_id=None):
+        """把游戏结果可靠地发给对手"""
+        session = self.session_for(room_id)
+        if session:
             message = {
                 'type': 'game_result',
-                'room_id': self.current_room.room_id,
-                'player_ip': self.get_local_ip(),
+                'room_id': session.room_id,
+                'player_ip': self.local_ip,
                 'is_winner': is_winner
             }
-            self.send_data(message)
+            self.send_control(message, session)
 
-    def handle_ready_state(self, message):
-        """处理准备状态消息"""
+    def handle_ready_state(self, session, message, addr):
+        """处理对方的准备状态消息"""
+        if session is None:
+            return
         try:
-            if (self.current_room and 
-                message['room_id'] == self.current_room.room_id):
-                
-                player_ip = message['player_ip']
-                is_ready = message['is_ready']
-                is_host = message.get('is_host', False)
-                
-                # 更新房间中的准备状态
-                if is_host:
-                    self.current_room.host_ready = is_ready
-                    if player_ip != self.get_local_ip():
-                        self.opponent_ready = is_ready
-                    print(f"房主准备状态更新: {'已准备' if is_ready else '未准备'}")
-                else:
-                    self.current_room.guest_ready = is_ready
-                    if player_ip != self.get_local_ip():
-                        self.opponent_ready = is_ready
-                    print(f"客人准备状态更新: {'已准备' if is_ready else '未准备'}")
-                
-                # 更新房间状态
-                if self.current_room.host_ready and self.current_room.guest_ready:
-                    self.current_room.status = "准备完成"
-                else:
-                    self.current_room.status = "准备中"
-                
-                print(f"房间状态更新 - 房主: {'已准备' if self.current_room.host_ready else '未准备'}, "
-                      f"客人: {'已准备' if self.current_room.guest_ready else '未准备'}")
+            room = session.room
+            is_ready = message['is_ready']
+            session.set_opponent_ready(is_ready)
+            print(f"{'客人' if session.is_host else '房主'}准备状态更新: {'已准备' if is_ready else '未准备'}")
+            self.touch_room(room)
+            
+            # 房主向大厅广播合并后的房间状态
+            if session.is_host:
+                self.broadcast_room(room)
+            
+            print(f"房间状态更新 - 房主: {'已准备' if room.host_ready else '未准备'}, "
+                  f"客人: {'已准备' if room.guest_ready else '未准备'}")
 
         except Exception as e:
             print(f"处理准备状态错误: {e}")
             import traceback
-            traceback.print_exc()
\ No newline at end of file
+            traceback.print_exc()
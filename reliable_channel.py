@@ -0,0 +1,175 @@
+import collections
+import random
+import threading
+import time
+
+# 第一次重传前等待的秒数，之后每次乘以 RETRY_BACKOFF
+RETRY_INTERVAL = 0.2
+RETRY_BACKOFF = 2.0
+# 重传多少次仍没有确认就放弃
+MAX_RETRIES = 6
+# 每个发送方记住最近多少个已收到的序号，用于去重
+DEDUPE_WINDOW = 256
+# 对方第一次发送到最后一次重传之间的秒数
+RETRY_SPAN = sum(RETRY_INTERVAL * RETRY_BACKOFF ** i for i in range(MAX_RETRIES))
+# 超过这个秒数没有消息的发送方不再记录：它之前的消息已经不会再重传
+SENDER_TIMEOUT = 2 * RETRY_SPAN
+# 同一个 IP 最多记录几个 epoch。对方重启后换新的 epoch，旧的不会再出现；
+# 留几个给同一台主机上同时运行的多个通道
+MAX_EPOCHS_PER_SENDER = 4
+# 去重表最多记录的发送方数，超出时丢弃最久没有消息的
+MAX_SENDERS = 4096
+
+
+class ReliableChannel:
+    """控制消息的可靠投递：序号、确认、指数退避重传和去重
+
+    加入、准备、开始、离开和对局结果这类消息丢一个包房间就会卡住，改为逐个
+    单播给对方并等待确认；没有确认时按退避间隔重传，收到重复的消息只回确认
+    不再处理。高频的 game_state 不经过这里，丢了等下一次。
+
+    send 为 send(data, dest) 形式的单播发送函数，dest 是调用方给出的目标（例如
+    IP，或者套接字和地址），确认发回收到消息时给出的 reply_to。encode 把消息
+    编码为 bytes。每个通道带一个随机的 epoch，对方重启后序号从头开始、或者同一
+    台主机上有多个通道时都不会被误判为重复。
+    """
+
+    def __init__(self, send, encode, local_ip, clock=time.time,
+                 retry_interval=RETRY_INTERVAL, backoff=RETRY_BACKOFF, max_retries=MAX_RETRIES):
+        self.send = send
+        self.encode = encode
+        self.local_ip = local_ip
+        self.clock = clock
+        self.retry_interval = retry_interval
+        self.backoff = backoff
+        self.max_retries = max_retries
+        self.epoch = random.getrandbits(31)
+        self.seq = 0
+        self.lock = threading.Lock()
+        self.pending = {}   # 序号 -> [数据, 目标, 下次重传时间, 已重传次数, 当前间隔, 完成回调]
+        # (发送方IP, epoch) -> [已收到序号的集合, 按到达顺序的序号列表, 最近一次收到的时间]，
+        # 按最近收到的时间排列，最久没有消息的在前
+        self.received = collections.OrderedDict()
+        self.epochs = {}  # 发送方IP -> 这个 IP 的 epoch 列表，最近出现的在后
+        self.on_failure = None  # 放弃重传时的回调 on_failure(消息序号, 目标)
+        self.sent = 0
+        self.retransmits = 0
+        self.acks = 0
+        self.duplicates = 0
+        self.failures = 0
+        self.bytes_sent = 0
+
+    def transmit(self, data, dest):
+        if self.send(data, dest):
+            self.bytes_sent += len(data)
+
+    def send_message(self, message, dest, on_done=None):
+        """可靠地单播一条消息，返回分配的序号
+
+        on_done(是否送达) 在收到确认或放弃重传时调用。
+        """
+        with self.lock:
+            self.seq += 1
+            seq = self.seq
+            message = dict(message, rel_from=self.local_ip, rel_epoch=self.epoch, rel_seq=seq)
+            data = self.encode(message)
+            self.pending[seq] = [data, dest, self.clock() + self.retry_interval, 0,
+                                 self.retry_interval, on_done]
+            self.sent += 1
+        self.transmit(data, dest)
+        return seq
+
+    def receive(self, message, reply_to):
+        """收到一条可靠消息：向 reply_to 回确认，新消息返回 True，重复的返回 False"""
+        sender = (message['rel_from'], message['rel_epoch'])
+        seq = message['rel_seq']
+        # 对方没收到确认时会重传，所以重复的消息也要再确认一次
+        self.transmit(self.encode({
+            'type': 'ack',
+            'ack_epoch': message['rel_epoch'],
+            'ack_seq': seq
+        }), reply_to)
+
+        with self.lock:
+            now = self.clock()
+            entry = self.received.get(sender)
+            if entry is None:
+                entry = self.received[sender] = [set(), [], now]
+                epochs = self.epochs.setdefault(sender[0], [])
+                epochs.append(sender[1])
+                if len(epochs) > MAX_EPOCHS_PER_SENDER:
+                    self.forget((sender[0], epochs[0]))
+            else:
+                entry[2] = now
+                self.received.move_to_end(sender)
+            self.prune_senders(now)
+            seen, order = entry[0], entry[1]
+            if seq in seen:
+                self.duplicates += 1
+                return False
+            seen.add(seq)
+            order.append(seq)
+            if len(order) > DEDUPE_WINDOW:
+                seen.discard(order.pop(0))
+        return True
+
+    def forget(self, sender):
+        """从去重表中删除一个发送方（调用方持有锁）"""
+        del self.received[sender]
+        epochs = self.epochs[sender[0]]
+        epochs.remove(sender[1])
+        if not epochs:
+            del self.epochs[sender[0]]
+
+    def prune_senders(self, now):
+        """删除超时或超出数量上限的发送方（调用方持有锁）"""
+        while self.received:
+            sender, entry = next(iter(self.received.items()))
+            if now - entry[2] <= SENDER_TIMEOUT and len(self.received) <= MAX_SENDERS:
+                break
+            self.forget(sender)
+
+    def handle_ack(self, message):
+        if message['ack_epoch'] != self.epoch:
+            return  # 不是这个通道（或上一次运行）发出的消息的确认
+        with self.lock:
+            entry = self.pending.pop(message['ack_seq'], None)
+            if entry is None:
+                return
+            self.acks += 1
+        if entry[5]:
+            entry[5](True)
+
+    def poll(self):
+        """重传到期的未确认消息，重传次数用完的放弃"""
+        now = self.clock()
+        due = []
+        failed = []
+        with self.lock:
+            self.prune_senders(now)
+            for seq, entry in list(self.pending.items()):
+                data, dest, next_time, retries, interval, on_done = entry
+                if now < next_time:
+                    continue
+                if retries >= self.max_retries:
+                    del self.pending[seq]
+                    self.failures += 1
+                    failed.append((seq, dest, on_done))
+                    continue
+                entry[3] = retries + 1
+                entry[4] = interval * self.backoff
+                entry[2] = now + entry[4]
+                self.retransmits += 1
+                due.append((data, dest))
+        for data, dest in due:
+            self.transmit(data, dest)
+        for seq, dest, on_done in failed:
+            print(f"控制消息 {seq} 发送到 {dest} 失败：没有收到确认")
+            if on_done:
+                on_done(False)
+            if self.on_failure:
+                self.on_failure(seq, dest)
+
+    def idle(self):
+        """没有等待确认的消息"""
+        return not self.pending
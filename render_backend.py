@@ -0,0 +1,54 @@
+import os
+
+import pygame
+
+
+def prepare_surface(surface, alpha=False):
+    """有显示窗口时转换成窗口的像素格式以加快绘制，离屏渲染时原样返回"""
+    if pygame.display.get_surface() is None:
+        return surface
+    return surface.convert_alpha() if alpha else surface.convert()
+
+
+class WindowBackend:
+    """渲染到窗口，每帧结束时翻转显示缓冲"""
+
+    def __init__(self, width, height, caption=""):
+        self.surface = pygame.display.set_mode((width, height))
+        pygame.display.set_caption(caption)
+        self.frames = 0
+
+    def present(self):
+        pygame.display.flip()
+        self.frames += 1
+
+    def ticks(self):
+        """特效动画使用的毫秒时钟"""
+        return pygame.time.get_ticks()
+
+
+class OffscreenBackend:
+    """渲染到离屏 Surface，不打开窗口
+
+    用于没有显示设备的机器上的渲染基准和截图对比。特效时钟按帧数推进
+    （每帧 1000/frame_rate 毫秒），同样的输入每次画出同样的画面。
+    """
+
+    def __init__(self, width, height, frame_rate=60):
+        # 事件队列需要初始化视频子系统，没有显示设备时使用 SDL 的 dummy 驱动
+        if not pygame.display.get_init():
+            os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+            pygame.display.init()
+        self.surface = pygame.Surface((width, height))
+        self.frame_rate = frame_rate
+        self.frames = 0
+
+    def present(self):
+        self.frames += 1
+
+    def ticks(self):
+        return self.frames * 1000 // self.frame_rate
+
+    def snapshot(self, path):
+        """把当前画面保存为 PNG"""
+        pygame.image.save(self.surface, path)
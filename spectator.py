@@ -0,0 +1,340 @@
+import base64
+import socket
+import struct
+import time
+
+from board import SpecialType, dump_state, load_state
+
+# 每隔多少步附带发送一次完整棋盘（关键帧），丢包后即使没有收到补发请求也能恢复
+KEYFRAME_INTERVAL = 10
+# 观战者每隔多少秒续订一次，超过 SUBSCRIBER_TIMEOUT 秒未续订的观战者不再推送
+SUBSCRIBE_INTERVAL = 2.0
+SUBSCRIBER_TIMEOUT = 6.0
+# 两次请求补发关键帧之间的最短间隔（秒）
+RESYNC_INTERVAL = 0.5
+# 等待补齐的乱序增量最多缓存的条数
+MAX_PENDING = 32
+# 增量编码后超过这个大小时改发关键帧，保证不超过接收缓冲
+MAX_DELTA_BYTES = 1400
+# 观战者超过这个秒数没有续订（离开观战界面）后，丢弃跟随的棋盘
+FEED_TIMEOUT = SUBSCRIBER_TIMEOUT
+
+# 二进制增量数据报的首字节，与 JSON（'{'）和 pickle（0x80）编码的消息区分
+DELTA_MAGIC = b'\xd1'
+# 首字节、房间ID、玩家IPv4、序号、分数、剩余步数、标志、连锁步数
+DELTA_HEADER = struct.Struct('!cQ4sIiHBH')
+DELTA_SPECIAL = 1  # 标志：操作为激活特殊符文（否则为交换）
+DELTA_WIDE = 2     # 标志：格子编号用两个字节（棋盘超过 256 格）
+# 增量里可以出现的特殊符文编码（不含 NONE）
+SPECIAL_CODES = {special.value for special in SpecialType} - {SpecialType.NONE.value}
+
+
+def encode_delta(move, steps, cols, type_index):
+    """把一步操作和连锁结果编码成紧凑的列表
+
+    move 为 ('swap', a, b) 或 ('special', pos)；每个连锁步只记录消除的格子、
+    原地升级的特殊符文和补充的新宝石类型，格子用 行*列数+列 表示，下落由
+    消除的格子决定，不需要发送。
+    """
+    if move[0] == 'swap':
+        (r1, c1), (r2, c2) = move[1], move[2]
+        encoded_move = [0, r1 * cols + c1, r2 * cols + c2]
+    else:
+        row, col = move[1]
+        encoded_move = [1, row * cols + col]
+    encoded_steps = [[[i * cols + j for i, j in step.removed],
+                      [[i * cols + j, special.value] for (i, j), special in step.specials.items()],
+                      [type_index[gem_type] for _, _, _, gem_type in step.spawns]]
+                     for step in steps]
+    return encoded_move, encoded_steps
+
+
+def pack_delta(room_id, player_ip, seq, score, moves, encoded_move, encoded_steps, cells):
+    """把 encode_delta() 的结果和对局信息打包成二进制数据报
+
+    房间ID为数字字符串、玩家IP为 IPv4 时才能打包，否则抛出 ValueError。每个
+    连锁步依次为：消除格子数和格子、新特殊符文数和 (格子, 类型)、补充数和宝石
+    类型编号，数量为两个字节（特殊符文一个字节），类型各一个字节。
+    """
+    flags = (DELTA_SPECIAL if encoded_move[0] else 0) | (DELTA_WIDE if cells > 256 else 0)
+    cell = 'H' if flags & DELTA_WIDE else 'B'
+    try:
+        parts = [DELTA_HEADER.pack(DELTA_MAGIC, int(room_id), socket.inet_aton(player_ip),
+                                   seq, score, moves, flags, len(encoded_steps)),
+                 struct.pack(f'!{len(encoded_move) - 1}{cell}', *encoded_move[1:])]
+        for removed, specials, spawns in encoded_steps:
+            parts.append(struct.pack(f'!H{len(removed)}{cell}', len(removed), *removed))
+            parts.append(struct.pack('!B' + f'{cell}B' * len(specials), len(specials),
+                                     *(value for pair in specials for value in pair)))
+            parts.append(struct.pack(f'!H{len(spawns)}B', len(spawns), *spawns))
+    except (struct.error, OSError) as e:
+        raise ValueError(f"无法打包增量: {e}")
+    return b''.join(parts)
+
+
+def unpack_delta(data):
+    """解析 pack_delta() 的数据报，返回与 JSON 增量消息相同结构的字典"""
+    try:
+        _, room_id, ip, seq, score, moves, flags, step_count = DELTA_HEADER.unpack_from(data)
+        cell = 'H' if flags & DELTA_WIDE else 'B'
+        offset = DELTA_HEADER.size
+
+        def read(fmt):
+            nonlocal offset
+            values = struct.unpack_from('!' + fmt, data, offset)
+            offset += struct.calcsize('!' + fmt)
+            return list(values)
+
+        move = [1] + read(cell) if flags & DELTA_SPECIAL else [0] + read(cell * 2)
+        steps = []
+        for _ in range(step_count):
+            removed = read(f'{read("H")[0]}{cell}')
+            pairs = read(f'{cell}B' * read('B')[0])
+            specials = [pairs[i:i + 2] for i in range(0, len(pairs), 2)]
+            spawns = read(f'{read("H")[0]}B')
+            steps.append([removed, specials, spawns])
+    except struct.error as e:
+        raise ValueError(f"增量数据不完整: {e}")
+    return {
+        'type': 'board_delta',
+        'room_id': str(room_id),
+        'player_ip': socket.inet_ntoa(ip),
+        'seq': seq,
+        'move': move,
+        'steps': steps,
+        'score': score,
+        'moves': moves
+    }
+
+
+def check_delta(board, move, steps):
+    """检查增量能否在 board 上完整重放，不能时抛出 ValueError
+
+    格子编号、符文和宝石类型都要在范围内，每一步补充的宝石数要正好填满空位；
+    全部检查通过后 apply_delta() 才修改棋盘，坏的增量不会留下改了一半的棋盘。
+    """
+    size = board.rows * board.cols
+
+    def cell(index):
+        if not isinstance(index, int) or not 0 <= index < size:
+            raise ValueError(f"增量中的格子编号无效: {index!r}")
+        return divmod(index, board.cols)
+
+    try:
+        if move[0] == 0:
+            (r1, c1), (r2, c2) = cell(move[1]), cell(move[2])
+            if abs(r1 - r2) + abs(c1 - c2) != 1:
+                raise ValueError("增量中的交换不相邻")
+        elif move[0] == 1:
+            cell(move[1])
+        else:
+            raise ValueError(f"增量中的操作类型无效: {move[0]!r}")
+        # 棋盘本来的空格在第一步补充
+        empty = sum(1 for row in board.grid for gem in row if gem is None)
+        for removed, specials, spawns in steps:
+            for index in removed:
+                cell(index)
+            if len(set(removed)) != len(removed):
+                raise ValueError("增量中有重复消除的格子")
+            for index, special in specials:
+                cell(index)
+                if index in removed or special not in SPECIAL_CODES:
+                    raise ValueError(f"增量中的特殊符文无效: {index!r}, {special!r}")
+            if len(spawns) != len(removed) + empty:
+                raise ValueError("增量中补充的宝石数与空位不符")
+            if any(not isinstance(code, int) or not 0 <= code < len(board.gem_types) for code in spawns):
+                raise ValueError("增量中的宝石类型无效")
+            empty = 0
+    except (TypeError, IndexError) as e:
+        raise ValueError(f"增量格式错误: {e}")
+
+
+def apply_delta(board, move, steps):
+    """在棋盘上重放 encode_delta() 的结果，返回 CascadeStep 列表；增量无效时棋盘不变"""
+    check_delta(board, move, steps)
+    cols = board.cols
+    if move[0] == 0:
+        (r1, c1), (r2, c2) = divmod(move[1], cols), divmod(move[2], cols)
+        board.swap(r1, c1, r2, c2)
+    gem_types = board.gem_types
+    return [board.replay_step([divmod(index, cols) for index in removed],
+                              {divmod(index, cols): SpecialType(special) for index, special in specials},
+                              [gem_types[code] for code in spawns])
+            for removed, specials, spawns in steps]
+
+
+class MatchPublisher:
+    """对局中的玩家一方：把自己每一步的棋盘变化推送给订阅的观战者
+
+    encode 把消息编码为 bytes，send 为 send(data, ip) 形式的单播发送函数。
+    每条消息只编码一次，逐个发给订阅的观战者，不向全网广播。
+    """
+
+    def __init__(self, send, encode, keyframe_interval=KEYFRAME_INTERVAL, timeout=SUBSCRIBER_TIMEOUT):
+        self.send = send
+        self.encode = encode
+        self.keyframe_interval = keyframe_interval
+        self.timeout = timeout
+        self.subscribers = {}  # ip -> 最近一次订阅时间
+        self.room_id = None
+        self.player_ip = None
+        self.board = None
+        self.seq = 0
+        self.score = 0
+        self.moves = 0
+        self.bytes_sent = 0
+
+    def start(self, room_id, player_ip, board, score, moves):
+        """开始一局新的对局，已有的观战者收到新的关键帧
+
+        序号不归零，观战端不会把新对局的关键帧当作过期数据丢弃。
+        """
+        self.room_id = room_id
+        self.player_ip = player_ip
+        self.board = board
+        self.score = score
+        self.moves = moves
+        self.send_keyframe()
+
+    def active_subscribers(self):
+        now = time.time()
+        for ip, last_seen in list(self.subscribers.items()):
+            if now - last_seen > self.timeout:
+                del self.subscribers[ip]
+        return list(self.subscribers)
+
+    def subscribe(self, ip):
+        """观战者订阅或续订；新的观战者立即收到一个关键帧"""
+        is_new = ip not in self.subscribers
+        self.subscribers[ip] = time.time()
+        if is_new and self.board is not None:
+            self.send_keyframe([ip])
+
+    def keyframe(self):
+        return {
+            'type': 'board_keyframe',
+            'room_id': self.room_id,
+            'player_ip': self.player_ip,
+            'seq': self.seq,
+            'state': base64.b64encode(dump_state(self.board, self.score, self.moves)).decode('ascii')
+        }
+
+    def send_all(self, data, ips):
+        for ip in ips:
+            if self.send(data, ip):
+                self.bytes_sent += len(data)
+
+    def send_keyframe(self, ips=None):
+        """发送完整棋盘，ips 省略时发给所有观战者"""
+        if self.board is None:
+            return
+        self.send_all(self.encode(self.keyframe()),
+                      self.active_subscribers() if ips is None else ips)
+
+    def publish_move(self, move, steps, score, moves):
+        """推送一步操作的增量，每 keyframe_interval 步改发一次关键帧"""
+        if self.board is None:
+            return
+        self.seq += 1
+        self.score = score
+        self.moves = moves
+        subscribers = self.active_subscribers()
+        if not subscribers:
+            return
+
+        # 增量用二进制格式，比 JSON 小得多；关键帧和其他消息仍用 encode 编码
+        encoded_move, encoded_steps = encode_delta(move, steps, self.board.cols, self.board.type_index)
+        try:
+            data = pack_delta(self.room_id, self.player_ip, self.seq, score, moves,
+                              encoded_move, encoded_steps, self.board.rows * self.board.cols)
+        except ValueError:
+            data = None
+        if data is None or len(data) > MAX_DELTA_BYTES or self.seq % self.keyframe_interval == 0:
+            # 定期改发关键帧；连锁过长、增量超过接收缓冲或无法打包时也改发关键帧
+            data = self.encode(self.keyframe())
+        self.send_all(data, subscribers)
+
+
+class MatchFeed:
+    """观战端跟随一名玩家的棋盘：按序号应用增量，缺号时请求关键帧"""
+
+    def __init__(self, room_id, player_ip):
+        self.room_id = room_id
+        self.player_ip = player_ip
+        self.board = None
+        self.seq = 0
+        self.score = 0
+        self.moves = 0
+        self.version = 0         # 每次棋盘变化加一，界面据此判断是否重绘
+        self.pending = {}        # 序号 -> 先到的增量
+        self.last_received = time.time()
+        self.last_watched = time.time()  # 观战者最近一次订阅（续订）的时间
+        self.last_resync = 0.0
+        self.gaps = 0
+        self.resyncs = 0
+
+    def receive(self, message):
+        """处理一条增量或关键帧，需要向玩家请求补发关键帧时返回 True"""
+        self.last_received = time.time()
+        seq = message['seq']
+        if message['type'] == 'board_keyframe':
+            if self.board is None or seq >= self.seq:
+                state = base64.b64decode(message['state'])
+                try:
+                    self.board, info = load_state(state, self.board)
+                except ValueError:
+                    # 新对局的棋盘尺寸不同
+                    self.board, info = load_state(state)
+                self.seq = seq
+                self.score = info['score']
+                self.moves = info['moves']
+                self.version += 1
+                self.apply_pending()
+            return False
+
+        if self.board is not None and seq <= self.seq:
+            return False  # 重复或过期
+        if self.board is not None and seq == self.seq + 1:
+            if not self.apply(message):
+                return self.request_resync()
+            self.apply_pending()
+            return False
+
+        # 还没有关键帧或中间缺号：先缓存，请求补发
+        self.pending[seq] = message
+        if len(self.pending) > MAX_PENDING:
+            del self.pending[min(self.pending)]
+        self.gaps += 1
+        return self.request_resync()
+
+    def apply(self, message):
+        """应用一条增量；增量无效时棋盘保持不变并返回 False，等待关键帧"""
+        try:
+            apply_delta(self.board, message['move'], message['steps'])
+        except ValueError as e:
+            print(f"丢弃无效增量 {message['seq']}: {e}")
+            return False
+        self.seq = message['seq']
+        self.score = message['score']
+        self.moves = message['moves']
+        self.version += 1
+        return True
+
+    def apply_pending(self):
+        """应用已经连续的缓存增量，丢弃过期的"""
+        for seq in sorted(self.pending):
+            if seq <= self.seq:
+                del self.pending[seq]
+            elif seq == self.seq + 1:
+                if not self.apply(self.pending.pop(seq)):
+                    break
+            else:
+                break
+
+    def request_resync(self):
+        now = time.time()
+        if now - self.last_resync < RESYNC_INTERVAL:
+            return False
+        self.last_resync = now
+        self.resyncs += 1
+        return True
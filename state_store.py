@@ -0,0 +1,79 @@
+import threading
+
+# 存储的实体类型；session 是本机所在房间的会话（对手的得分、步数和比赛服务器的结果）
+KINDS = ('player', 'room', 'match', 'session')
+
+
+class StateStore:
+    """网络层与界面之间的版本化状态存储
+
+    按类型和键保存玩家、房间、观战对局和本机的房间会话。每次写入或删除都分配一个单调递增的
+    版本号，同时记录实体和类型的最新版本；界面比较版本号，只重建变化的部分。
+    只有网络层写入（对象原地修改后调用 put 登记变化），界面只读。
+
+    订阅者的回调为 callback(类型, 键, 值, 版本号)，删除时值为 None。回调在
+    写入的线程（通常是网络监听线程）中调用，只应设置标志或投递事件。
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.revision = 0
+        self.entities = {kind: {} for kind in KINDS}      # 类型 -> {键: (版本, 值)}
+        self.kind_revisions = dict.fromkeys(KINDS, 0)
+        self.subscribers = []  # [(类型集合, 回调), ...]
+
+    def put(self, kind, key, value):
+        """写入或更新实体，返回新的版本号"""
+        with self.lock:
+            self.revision += 1
+            revision = self.revision
+            self.entities[kind][key] = (revision, value)
+            self.kind_revisions[kind] = revision
+        self.notify(kind, key, value, revision)
+        return revision
+
+    def remove(self, kind, key):
+        """删除实体，不存在时不做任何事"""
+        with self.lock:
+            if key not in self.entities[kind]:
+                return
+            del self.entities[kind][key]
+            self.revision += 1
+            revision = self.revision
+            self.kind_revisions[kind] = revision
+        self.notify(kind, key, None, revision)
+
+    def get(self, kind, key, default=None):
+        entry = self.entities[kind].get(key)
+        return entry[1] if entry else default
+
+    def revision_of(self, kind, key):
+        """实体的版本号，不存在时为 0"""
+        entry = self.entities[kind].get(key)
+        return entry[0] if entry else 0
+
+    def kind_revision(self, kind):
+        """这一类实体最近一次变化的版本号"""
+        return self.kind_revisions[kind]
+
+    def items(self, kind):
+        """[(键, 值), ...] 的副本，按首次写入的顺序"""
+        with self.lock:
+            return [(key, value) for key, (_, value) in self.entities[kind].items()]
+
+    def values(self, kind):
+        return [value for _, value in self.items(kind)]
+
+    def subscribe(self, callback, kinds=KINDS):
+        self.subscribers.append((frozenset(kinds), callback))
+
+    def unsubscribe(self, callback):
+        self.subscribers = [(kinds, cb) for kinds, cb in self.subscribers if cb is not callback]
+
+    def notify(self, kind, key, value, revision):
+        for kinds, callback in list(self.subscribers):
+            if kind in kinds:
+                try:
+                    callback(kind, key, value, revision)
+                except Exception as e:
+                    print(f"状态订阅回调错误: {e}")
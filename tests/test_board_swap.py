@@ -0,0 +1,62 @@
+import random
+
+import pytest
+
+from board import Board, gem_type_names
+
+
+def adjacent_pairs(board):
+    for i in range(board.rows):
+        for j in range(board.cols):
+            if j + 1 < board.cols:
+                yield (i, j), (i, j + 1)
+            if i + 1 < board.rows:
+                yield (i, j), (i + 1, j)
+
+
+def forms_match(board, a, b):
+    """真正交换后扫描整个棋盘"""
+    copy = board.copy()
+    copy.swap(*a, *b)
+    return bool(copy.find_matches()[0])
+
+
+@pytest.mark.parametrize('seed', range(10))
+@pytest.mark.parametrize('type_count, rows, cols', [(6, 8, 8), (4, 6, 10), (5, 12, 5)])
+def test_is_valid_swap_agrees_with_find_matches(seed, type_count, rows, cols):
+    board = Board(gem_type_names(type_count), rows, cols, rng=random.Random(seed))
+    board.initialize(seed=seed)
+    assert board.find_matches() == (set(), {})
+    before = board.snapshot()
+
+    expected = set()
+    for a, b in adjacent_pairs(board):
+        valid = forms_match(board, a, b)
+        assert board.is_valid_swap(a, b) == valid, (a, b)
+        assert board.is_valid_swap(b, a) == valid, (b, a)
+        if valid:
+            expected.add(frozenset((a, b)))
+
+    assert {frozenset(move) for move in board.find_valid_moves()} == expected
+    assert board.snapshot() == before
+
+
+def test_is_valid_swap_rejects_bad_pairs():
+    board = Board(rng=random.Random(1))
+    board.initialize(seed=1)
+    a, b = board.find_valid_moves()[0]
+    assert board.is_valid_swap(a, b)
+    assert not board.is_valid_swap(a, a)
+    assert not board.is_valid_swap((0, 0), (1, 1))
+    assert not board.is_valid_swap((0, 0), (0, 2))
+    assert not board.is_valid_swap((0, 7), (0, 8))
+    assert not board.is_valid_swap((-1, 0), (0, 0))
+
+
+def test_is_valid_swap_ignores_empty_cells():
+    board = Board(rng=random.Random(2))
+    board.initialize(seed=2)
+    a, b = board.find_valid_moves()[0]
+    board.remove(*a)
+    assert not board.is_valid_swap(a, b)
+    assert not board.is_valid_swap(b, a)
@@ -0,0 +1,104 @@
+import random
+
+import pytest
+
+from board import Board, SpecialType, gem_type_names
+
+# 底色按 (行 + 2*列) % 6 排列，没有任何三连；第 7 种宝石只用于摆放测试用的匹配
+TYPES = gem_type_names(7)
+MARK = 6
+
+
+def make_board(marked=(), specials=None, seed=0):
+    codes = [[((i + 2 * j) % 6, 0) for j in range(8)] for i in range(8)]
+    for i, j in marked:
+        codes[i][j] = (MARK, 0)
+    for (i, j), special in (specials or {}).items():
+        codes[i][j] = (codes[i][j][0], special.value)
+    board = Board(TYPES, rng=random.Random(seed))
+    board.load_codes(codes)
+    return board
+
+
+def test_base_board_has_no_matches():
+    assert make_board().find_matches() == (set(), {})
+
+
+def test_three_in_a_row():
+    board = make_board([(7, 0), (7, 1), (7, 2)])
+    steps = board.resolve_cascade()
+    first = steps[0]
+    assert first.removed == [(7, 0), (7, 1), (7, 2)]
+    assert first.specials == {}
+    assert first.triggered == []
+    assert (first.combo, first.score) == (1, 35)
+    # 上方的宝石各下落一格，顶部补充三个
+    assert sorted(first.drops) == sorted(((i, j), (i + 1, j)) for i in range(7) for j in range(3))
+    assert sorted((i, j, start) for i, j, start, _ in first.spawns) == [(0, 0, -1), (0, 1, -1), (0, 2, -1)]
+
+
+def test_four_in_a_row_makes_explosive():
+    board = make_board([(7, 2), (7, 3), (7, 4), (7, 5)])
+    first = board.resolve_cascade()[0]
+    assert first.specials == {(7, 2): SpecialType.EXPLOSIVE}
+    assert first.removed == [(7, 3), (7, 4), (7, 5)]
+    assert first.score == 4 * 10 + 5
+
+
+def test_special_in_match_is_triggered():
+    board = make_board([(7, 0), (7, 1), (7, 2)], {(7, 1): SpecialType.EXPLOSIVE})
+    first = board.resolve_cascade()[0]
+    assert first.triggered == [((7, 1), SpecialType.EXPLOSIVE)]
+    assert first.removed == sorted((i, j) for i in (6, 7) for j in range(3))
+    # 额外波及的三个格子每个10分
+    assert first.score == 35 + 30
+
+
+def test_existing_special_fires_before_promotion():
+    board = make_board([(7, 0), (7, 1), (7, 2), (7, 3)], {(7, 0): SpecialType.LINE})
+    first = board.resolve_cascade()[0]
+    assert first.triggered == [((7, 0), SpecialType.LINE)]
+    # 整行和整列被清除，符文所在格保留下来升级为爆炸符文
+    expected = {(7, j) for j in range(1, 8)} | {(i, 0) for i in range(7)}
+    assert set(first.removed) == expected
+    assert first.specials == {(7, 0): SpecialType.EXPLOSIVE}
+    assert first.score == 45 + (len(expected) - 3) * 10
+
+
+def test_initial_removal_chains_specials():
+    board = make_board(specials={(3, 3): SpecialType.LINE, (3, 6): SpecialType.EXPLOSIVE})
+    first = board.resolve_cascade([(3, 3)])[0]
+    assert (first.combo, first.score) == (0, 0)
+    assert first.triggered == [((3, 3), SpecialType.LINE), ((3, 6), SpecialType.EXPLOSIVE)]
+    expected = ({(3, j) for j in range(8)} | {(i, 3) for i in range(8)} |
+                {(i, j) for i in (2, 3, 4) for j in (5, 6, 7)})
+    assert first.removed == sorted(expected)
+
+
+@pytest.mark.parametrize('seed', range(20))
+def test_cascade_ends_stable(seed):
+    board = Board(rng=random.Random(seed))
+    board.initialize(seed=seed)
+    a, b = board.find_valid_moves()[0]
+    board.swap(*a, *b)
+    steps = board.resolve_cascade()
+    assert steps
+    assert [step.combo for step in steps] == list(range(1, len(steps) + 1))
+    assert all(step.score > 0 for step in steps)
+    assert board.find_matches() == (set(), {})
+    assert all(gem is not None for row in board.grid for gem in row)
+
+
+@pytest.mark.parametrize('seed', range(20))
+def test_timeline_replays_to_same_board(seed):
+    board = Board(rng=random.Random(seed))
+    board.initialize(seed=seed)
+    a, b = board.find_valid_moves()[0]
+    board.swap(*a, *b)
+    replica = board.copy()
+    steps = board.resolve_cascade()
+    for step in steps:
+        replayed = replica.replay_step(step.removed, step.specials,
+                                       [gem_type for _, _, _, gem_type in step.spawns])
+        assert sorted(replayed.drops) == sorted(step.drops)
+    assert replica.snapshot() == board.snapshot()
@@ -0,0 +1,184 @@
+import copy
+import json
+import random
+
+import pytest
+
+import spectator
+from board import Board, SpecialType, gem_type_names
+from spectator import (DELTA_MAGIC, MatchFeed, MatchPublisher, apply_delta, encode_delta,
+                       pack_delta, unpack_delta)
+
+
+def play_move(board, rng, specials=True):
+    """在 board 上走一步（specials 为真时偶尔激活特殊符文），返回 (move, steps)"""
+    if specials and rng.random() < 0.2:
+        pos = (rng.randrange(board.rows), rng.randrange(board.cols))
+        board.grid[pos[0]][pos[1]].special_type = rng.choice(
+            [SpecialType.EXPLOSIVE, SpecialType.LINE, SpecialType.MAGIC])
+        board.packed = None
+        return ('special', pos), None
+    moves = board.find_valid_moves()
+    if not moves:
+        board.initialize(min_moves=1)
+        moves = board.find_valid_moves()
+    a, b = rng.choice(moves)
+    board.swap(*a, *b)
+    return ('swap', a, b), board.resolve_cascade()
+
+
+def moves_of(board, rng, count, specials=True):
+    """逐步产生 (走法前的快照, move, steps)"""
+    for _ in range(count):
+        move, steps = play_move(board, rng, specials)
+        if steps is None:
+            # 先记下带符文的棋盘，观战端从这里开始重放
+            before = board.snapshot()
+            steps = board.resolve_cascade([move[1]])
+        else:
+            before = None
+        yield before, move, steps
+
+
+@pytest.mark.parametrize('rows, cols, type_count', [(8, 8, 6), (20, 20, 7), (4, 70, 5)])
+def test_pack_unpack_apply_round_trip(rows, cols, type_count):
+    rng = random.Random(rows * cols)
+    board = Board(gem_type_names(type_count), rows, cols, rng=rng)
+    board.initialize(seed=rows)
+    mirror = Board(board.gem_types, rows, cols)
+    mirror.restore(board.snapshot())
+
+    for seq, (before, move, steps) in enumerate(moves_of(board, rng, 30), 1):
+        if before is not None:
+            mirror.restore(before)
+        encoded_move, encoded_steps = encode_delta(move, steps, cols, board.type_index)
+        data = pack_delta('12345', '192.168.1.7', seq, seq * 10, 30 - seq,
+                          encoded_move, encoded_steps, rows * cols)
+        assert data[:1] == DELTA_MAGIC
+        message = unpack_delta(data)
+        assert message == {'type': 'board_delta', 'room_id': '12345', 'player_ip': '192.168.1.7',
+                           'seq': seq, 'move': encoded_move, 'steps': encoded_steps,
+                           'score': seq * 10, 'moves': 30 - seq}
+        replayed = apply_delta(mirror, message['move'], message['steps'])
+        assert [(step.removed, step.specials) for step in replayed] == \
+            [(step.removed, step.specials) for step in steps]
+        assert mirror.snapshot() == board.snapshot()
+
+
+@pytest.mark.parametrize('room_id, player_ip', [('room-1', '10.0.0.1'), ('1', '::1'), ('1', 'host')])
+def test_pack_rejects_unpackable_identity(room_id, player_ip):
+    with pytest.raises(ValueError):
+        pack_delta(room_id, player_ip, 1, 0, 0, [0, 0, 1], [], 64)
+
+
+def test_unpack_rejects_truncated_data():
+    board = Board(rng=random.Random(5))
+    board.initialize(seed=5)
+    _, move, steps = next(moves_of(board, random.Random(1), 1))
+    data = pack_delta('1', '10.0.0.1', 1, 0, 0, *encode_delta(move, steps, 8, board.type_index), 64)
+    for length in range(len(data)):
+        with pytest.raises(ValueError):
+            unpack_delta(data[:length])
+
+
+def recorded_delta():
+    """返回 (走法前的棋盘, move, steps)，steps 至少有一步"""
+    board = Board(rng=random.Random(9))
+    board.initialize(seed=9)
+    before = board.copy()
+    a, b = board.find_valid_moves()[0]
+    board.swap(*a, *b)
+    return before, *encode_delta(('swap', a, b), board.resolve_cascade(), 8, board.type_index)
+
+
+def corrupt(move, steps, case):
+    move, steps = list(move), copy.deepcopy(steps)
+    if case == 'move kind':
+        move[0] = 2
+    elif case == 'move index':
+        move[2] = 64
+    elif case == 'not adjacent':
+        move[2] = move[1] + 9 if move[1] < 55 else move[1] - 9
+    elif case == 'removed index':
+        steps[-1][0][-1] = 64
+    elif case == 'duplicate removed':
+        steps[-1][0].append(steps[-1][0][0])
+        steps[-1][2].append(0)
+    elif case == 'special code':
+        steps[-1][1].append([steps[-1][0][0] + 64, 1])
+    elif case == 'special on removed cell':
+        steps[-1][1].append([steps[-1][0][0], 1])
+    elif case == 'special none':
+        steps[0][1].append([next(i for i in range(64) if i not in steps[0][0]), 0])
+    elif case == 'spawn code':
+        steps[-1][2][-1] = 6
+    elif case == 'too few spawns':
+        steps[-1][2].pop()
+    elif case == 'too many spawns':
+        steps[-1][2].append(0)
+    elif case == 'not a list':
+        steps[-1][0] = 5
+    return move, steps
+
+
+@pytest.mark.parametrize('case', ['move kind', 'move index', 'not adjacent', 'removed index',
+                                  'duplicate removed', 'special code', 'special on removed cell',
+                                  'special none', 'spawn code', 'too few spawns',
+                                  'too many spawns', 'not a list'])
+def test_malformed_delta_leaves_board_untouched(case):
+    board, move, steps = recorded_delta()
+    before = board.snapshot()
+    move, steps = corrupt(move, steps, case)
+    with pytest.raises(ValueError):
+        apply_delta(board, move, steps)
+    assert board.snapshot() == before
+
+
+def decode(data):
+    return unpack_delta(data) if data[:1] == DELTA_MAGIC else json.loads(data)
+
+
+def test_feed_follows_publisher_and_recovers_from_loss(monkeypatch):
+    monkeypatch.setattr(spectator, 'RESYNC_INTERVAL', 0.0)
+    sent = []
+    publisher = MatchPublisher(lambda data, ip: sent.append(data) or True,
+                               lambda message: json.dumps(message).encode())
+    rng = random.Random(3)
+    board = Board(rng=rng)
+    board.initialize(seed=3)
+    publisher.start('42', '10.0.0.5', board, 0, 30)
+    publisher.subscribe('10.0.0.9')
+    feed = MatchFeed('42', '10.0.0.5')
+
+    feed.receive(decode(sent.pop()))
+    for n, (_, move, steps) in enumerate(moves_of(board, rng, 40, specials=False)):
+        publisher.publish_move(move, steps, n, 30)
+        datagrams = sent[:]
+        sent.clear()
+        # 每隔几步丢一个包，下一步缺号时像网络层一样请求补发关键帧
+        if n % 7 == 3:
+            continue
+        for data in datagrams:
+            if feed.receive(decode(data)):
+                publisher.send_keyframe(['10.0.0.9'])
+                feed.receive(decode(sent.pop()))
+        assert feed.seq == publisher.seq
+        assert feed.board.snapshot() == board.snapshot()
+    assert feed.gaps and feed.resyncs
+
+
+def test_feed_drops_bad_delta_and_asks_for_keyframe():
+    board, move, steps = recorded_delta()
+    feed = MatchFeed('1', '10.0.0.1')
+    feed.board = board
+    before = board.snapshot()
+    bad_move, bad_steps = corrupt(move, steps, 'spawn code')
+    message = {'type': 'board_delta', 'seq': 1, 'move': bad_move, 'steps': bad_steps,
+               'score': 100, 'moves': 29}
+    assert feed.receive(message) is True
+    assert (feed.seq, feed.score, feed.version) == (0, 0, 0)
+    assert feed.board.snapshot() == before
+
+    feed.last_resync = 0.0
+    assert feed.receive(dict(message, move=move, steps=steps)) is False
+    assert (feed.seq, feed.score) == (1, 100)
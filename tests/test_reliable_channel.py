@@ -0,0 +1,185 @@
+import json
+
+import pytest
+
+import reliable_channel
+from reliable_channel import MAX_EPOCHS_PER_SENDER, SENDER_TIMEOUT, ReliableChannel
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class Link:
+    """记录发出的数据报，send 返回 True 表示发出"""
+
+    def __init__(self):
+        self.sent = []
+
+    def __call__(self, data, dest):
+        self.sent.append((json.loads(data), dest))
+        return True
+
+
+def encode(message):
+    return json.dumps(message).encode()
+
+
+def make_channel(ip='10.0.0.1', **kwargs):
+    clock = Clock()
+    link = Link()
+    channel = ReliableChannel(link, encode, ip, clock=clock, **kwargs)
+    return channel, link, clock
+
+
+def test_ack_completes_message():
+    sender, sender_link, _ = make_channel('10.0.0.1')
+    receiver, receiver_link, _ = make_channel('10.0.0.2')
+    results = []
+    sender.send_message({'type': 'ready_state'}, '10.0.0.2', results.append)
+
+    message, dest = sender_link.sent[0]
+    assert dest == '10.0.0.2'
+    assert receiver.receive(message, '10.0.0.1') is True
+    ack, reply_to = receiver_link.sent[0]
+    assert reply_to == '10.0.0.1'
+    assert ack == {'type': 'ack', 'ack_epoch': sender.epoch, 'ack_seq': message['rel_seq']}
+
+    sender.handle_ack(ack)
+    assert results == [True]
+    assert sender.idle()
+    assert sender.acks == 1
+
+
+def test_ack_from_other_epoch_is_ignored():
+    sender, link, _ = make_channel()
+    results = []
+    seq = sender.send_message({'type': 'start_game'}, 'peer', results.append)
+    sender.handle_ack({'type': 'ack', 'ack_epoch': sender.epoch + 1, 'ack_seq': seq})
+    assert not sender.idle()
+    assert results == []
+
+
+def test_retransmits_with_backoff_then_fails():
+    sender, link, clock = make_channel(retry_interval=0.2, backoff=2.0, max_retries=3)
+    results = []
+    failures = []
+    sender.on_failure = lambda seq, dest: failures.append((seq, dest))
+    seq = sender.send_message({'type': 'leave_room'}, 'peer', results.append)
+    start = clock.now
+
+    # 到期前不重传
+    clock.now = start + 0.19
+    sender.poll()
+    assert len(link.sent) == 1
+
+    # 间隔 0.2、0.4、0.8 依次重传
+    due = start
+    for interval in (0.2, 0.4, 0.8):
+        due += interval
+        clock.now = due - 0.01
+        sender.poll()
+        clock.now = due
+        sender.poll()
+    assert sender.retransmits == 3
+    assert len(link.sent) == 4
+    assert all(message == link.sent[0][0] for message, _ in link.sent)
+    assert results == []
+
+    # 重传次数用完后放弃
+    clock.now = due + 1.6
+    sender.poll()
+    assert results == [False]
+    assert failures == [(seq, 'peer')]
+    assert sender.failures == 1
+    assert sender.idle()
+
+
+def test_duplicate_is_acked_but_not_delivered():
+    sender, sender_link, _ = make_channel('10.0.0.1')
+    receiver, receiver_link, _ = make_channel('10.0.0.2')
+    sender.send_message({'type': 'game_result'}, 'peer')
+    message = sender_link.sent[0][0]
+
+    assert receiver.receive(message, 'a') is True
+    assert receiver.receive(message, 'a') is False
+    assert receiver.duplicates == 1
+    # 每次都回确认，对方丢了第一个确认时还能收到第二个
+    assert [ack['ack_seq'] for ack, _ in receiver_link.sent] == [message['rel_seq']] * 2
+
+
+def test_same_seq_from_new_epoch_is_new():
+    receiver, _, _ = make_channel('10.0.0.2')
+    first = {'type': 'room', 'rel_from': '10.0.0.1', 'rel_epoch': 1, 'rel_seq': 1}
+    restarted = dict(first, rel_epoch=2)
+    assert receiver.receive(first, 'a') is True
+    assert receiver.receive(restarted, 'a') is True
+    assert receiver.receive(first, 'a') is False
+
+
+def test_dedupe_window_is_bounded(monkeypatch):
+    monkeypatch.setattr(reliable_channel, 'DEDUPE_WINDOW', 4)
+    receiver, _, _ = make_channel('10.0.0.2')
+    for seq in range(1, 11):
+        receiver.receive({'rel_from': 'x', 'rel_epoch': 1, 'rel_seq': seq}, 'a')
+    seen, order, _ = receiver.received[('x', 1)]
+    assert seen == {7, 8, 9, 10}
+    assert order == [7, 8, 9, 10]
+
+
+def test_old_epochs_of_sender_are_dropped():
+    receiver, _, _ = make_channel('10.0.0.2')
+    for epoch in range(MAX_EPOCHS_PER_SENDER + 3):
+        receiver.receive({'rel_from': '10.0.0.1', 'rel_epoch': epoch, 'rel_seq': 1}, 'a')
+    assert len(receiver.received) == MAX_EPOCHS_PER_SENDER
+    assert receiver.epochs['10.0.0.1'] == list(range(3, MAX_EPOCHS_PER_SENDER + 3))
+
+
+def test_idle_senders_are_pruned():
+    receiver, _, clock = make_channel('10.0.0.2')
+    receiver.receive({'rel_from': '10.0.0.1', 'rel_epoch': 1, 'rel_seq': 1}, 'a')
+    clock.now += SENDER_TIMEOUT / 2
+    receiver.receive({'rel_from': '10.0.0.3', 'rel_epoch': 1, 'rel_seq': 1}, 'a')
+    clock.now += SENDER_TIMEOUT / 2 + 0.1
+    receiver.poll()
+    assert list(receiver.received) == [('10.0.0.3', 1)]
+    assert list(receiver.epochs) == ['10.0.0.3']
+
+
+def test_sender_table_is_capped(monkeypatch):
+    monkeypatch.setattr(reliable_channel, 'MAX_SENDERS', 8)
+    receiver, _, clock = make_channel('10.0.0.2')
+    for i in range(50):
+        clock.now += 0.01
+        receiver.receive({'rel_from': f'10.1.0.{i}', 'rel_epoch': 1, 'rel_seq': 1}, 'a')
+        assert len(receiver.received) <= 8
+    assert list(receiver.received)[0] == ('10.1.0.42', 1)
+
+
+@pytest.mark.parametrize('lost_acks', [0, 1, 3])
+def test_delivered_once_despite_lost_acks(lost_acks):
+    sender, sender_link, clock = make_channel('10.0.0.1')
+    receiver, receiver_link, _ = make_channel('10.0.0.2')
+    results = []
+    delivered = []
+    sender.send_message({'type': 'start_game'}, 'peer', results.append)
+    while not sender.idle():
+        for message, _ in sender_link.sent:
+            if receiver.receive(message, 'a'):
+                delivered.append(message['rel_seq'])
+        sender_link.sent.clear()
+        acks = [ack for ack, _ in receiver_link.sent]
+        receiver_link.sent.clear()
+        if lost_acks:
+            lost_acks -= 1
+        else:
+            for ack in acks:
+                sender.handle_ack(ack)
+        clock.now += 10
+        sender.poll()
+    assert delivered == [1]
+    assert results == [True]
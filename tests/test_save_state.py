@@ -0,0 +1,110 @@
+import random
+import struct
+
+import pytest
+
+from board import SAVE_HEADER, SAVE_MAGIC, SAVE_VERSION, Board, SpecialType, dump_state, load_state
+
+
+def played_board(seed=0, rows=8, cols=None):
+    board = Board(rows=rows, cols=cols, rng=random.Random(seed))
+    board.initialize(seed=seed)
+    board.grid[1][2].special_type = SpecialType.LINE
+    board.grid[3][4].special_type = SpecialType.MAGIC
+    board.packed = None
+    return board
+
+
+def test_round_trip_new_board():
+    board = played_board()
+    data = dump_state(board, score=1234, moves=17, combo=3, max_combo=9)
+    assert len(data) == SAVE_HEADER.size + 64
+    loaded, info = load_state(data)
+    assert info == {'score': 1234, 'moves': 17, 'combo': 3, 'max_combo': 9}
+    assert loaded.type_codes() == board.type_codes()
+    assert loaded.snapshot() == board.snapshot()
+
+
+def test_round_trip_into_existing_board():
+    board = played_board(seed=1, rows=5, cols=11)
+    target = played_board(seed=2, rows=5, cols=11)
+    loaded, info = load_state(dump_state(board, -5, 0), target)
+    assert loaded is target
+    assert info['score'] == -5
+    assert target.type_codes() == board.type_codes()
+
+
+def test_round_trip_keeps_empty_cells():
+    board = played_board()
+    board.remove(0, 0)
+    loaded, _ = load_state(dump_state(board))
+    assert loaded.grid[0][0] is None
+    assert loaded.snapshot() == board.snapshot()
+
+
+def header(**fields):
+    values = dict(magic=SAVE_MAGIC, version=SAVE_VERSION, rows=8, cols=8, types=6,
+                  score=0, moves=0, combo=0, max_combo=0)
+    values.update(fields)
+    return SAVE_HEADER.pack(*values.values())
+
+
+def valid_cells():
+    return dump_state(played_board())[SAVE_HEADER.size:]
+
+
+@pytest.mark.parametrize('data', [
+    b'',
+    b'SXSV',
+    header(magic=b'SAVE') + valid_cells(),
+    header(version=SAVE_VERSION + 1) + valid_cells(),
+    header() + valid_cells()[:-1],
+    header() + valid_cells() + b'\x04',
+    header(rows=9) + valid_cells(),
+    header(rows=0, cols=0) + valid_cells(),
+], ids=['empty', 'short header', 'magic', 'version', 'truncated', 'trailing', 'rows', 'no cells'])
+def test_corrupt_save_is_rejected(data):
+    with pytest.raises(ValueError):
+        load_state(data)
+
+
+def test_every_truncation_is_rejected():
+    data = dump_state(played_board())
+    for length in range(len(data)):
+        with pytest.raises(ValueError):
+            load_state(data[:length])
+
+
+@pytest.mark.parametrize('code', [1, 2, 3, (6 + 1) << 2, 255])
+def test_invalid_cell_code_is_rejected(code):
+    # 类型为 0 却带特殊符文，或类型编号超出宝石种类数
+    cells = bytearray(valid_cells())
+    cells[10] = code
+    with pytest.raises(ValueError, match='第 10 格'):
+        load_state(header() + bytes(cells))
+
+
+def test_failed_load_leaves_board_untouched():
+    board = played_board(seed=3)
+    before = board.snapshot()
+    cells = bytearray(valid_cells())
+    cells[-1] = 255
+    for data in (header() + bytes(cells), header(rows=4, cols=16) + valid_cells(),
+                 header(types=5) + valid_cells()):
+        with pytest.raises(ValueError):
+            load_state(data, board)
+        assert board.snapshot() == before
+
+
+def test_gem_type_count_must_match():
+    data = dump_state(played_board())
+    with pytest.raises(ValueError):
+        load_state(data, gem_types=['A', 'B', 'C'])
+    loaded, _ = load_state(data, gem_types=list('ABCDEF'))
+    assert loaded.gem_types == list('ABCDEF')
+
+
+def test_header_is_little_endian():
+    data = dump_state(played_board(), score=1, moves=2)
+    assert data[:4] == SAVE_MAGIC
+    assert struct.unpack_from('<ii', data, 8) == (1, 2)
@@ -0,0 +1,110 @@
+import time
+
+import pygame
+
+from board import SpecialType
+from spectator import SUBSCRIBE_INTERVAL
+
+# 观战界面最多同时显示的对局数
+MAX_MATCHES = 4
+
+
+class TournamentScreen:
+    """局域网观战界面：同时显示多场进行中的对局，每场两名玩家的棋盘
+
+    gem_image 为按宝石类型返回图片的函数。每个棋盘画到自己的缓存 Surface 上，
+    只有收到新的增量后才重画。
+    """
+
+    def __init__(self, screen, network, font, gem_image, cell_size=16):
+        self.screen = screen
+        self.network = network
+        self.font = font
+        self.gem_image = gem_image
+        self.cell_size = cell_size
+        self.last_subscribe = 0.0
+        self.images = {}         # 宝石类型 -> 缩小后的图片
+        self.board_cache = {}    # (房间ID, 玩家IP) -> (状态存储版本, Surface)
+        self.back_button = pygame.Rect(20, 550, 100, 32)
+        self.title = font.render("观战 - 进行中的对局", True, (255, 255, 255))
+        self.empty_text = font.render("暂无进行中的对局", True, (200, 200, 200))
+        self.back_text = font.render("返回", True, (255, 255, 255))
+
+    def matches(self):
+        """正在进行的对局，最多 MAX_MATCHES 场"""
+        rooms = [room for room in self.network.store.values('room') if room.status == "游戏中"]
+        return rooms[:MAX_MATCHES]
+
+    def update(self):
+        """定期订阅（续订）正在进行的对局"""
+        now = time.time()
+        if now - self.last_subscribe >= SUBSCRIBE_INTERVAL:
+            self.last_subscribe = now
+            for room in self.matches():
+                self.network.watch_room(room)
+
+    def handle_event(self, event):
+        """点击返回按钮时返回 "BACK" """
+        if event.type == pygame.MOUSEBUTTONDOWN and self.back_button.collidepoint(event.pos):
+            return "BACK"
+        if event.type == pygame.KEYDOWN and event.key == pygame.K_ESCAPE:
+            return "BACK"
+        return None
+
+    def small_image(self, gem_type):
+        image = self.images.get(gem_type)
+        if image is None:
+            image = pygame.transform.smoothscale(self.gem_image(gem_type),
+                                                 (self.cell_size, self.cell_size))
+            self.images[gem_type] = image
+        return image
+
+    def render_board(self, feed):
+        """按需重画一名玩家的小棋盘：状态存储中这场对局的版本变化后才重画"""
+        key = (feed.room_id, feed.player_ip)
+        revision = self.network.store.revision_of('match', key)
+        cached = self.board_cache.get(key)
+        if cached and cached[0] == revision:
+            return cached[1]
+        board = feed.board
+        size = self.cell_size
+        surface = pygame.Surface((board.cols * size, board.rows * size))
+        surface.fill((30, 30, 50))
+        for i, row in enumerate(board.grid):
+            for j, gem in enumerate(row):
+                if gem is None:
+                    continue
+                surface.blit(self.small_image(gem.type), (j * size, i * size))
+                if gem.special_type != SpecialType.NONE:
+                    pygame.draw.rect(surface, (255, 255, 200), (j * size, i * size, size, size), 1)
+        self.board_cache[key] = (revision, surface)
+        return surface
+
+    def draw(self):
+        self.screen.fill((30, 30, 50))
+        self.screen.blit(self.title, (20, 15))
+
+        matches = self.matches()
+        if not matches:
+            self.screen.blit(self.empty_text, (20, 60))
+        width, height = self.screen.get_size()
+        cell_width, cell_height = width // 2, (height - 100) // 2
+        for index, room in enumerate(matches):
+            x = (index % 2) * cell_width + 20
+            y = (index // 2) * cell_height + 50
+            self.screen.blit(self.font.render(f"房间 {room.room_id[-6:]}", True, (200, 200, 200)), (x, y))
+            players = [room.host] + ([room.guest] if room.guest else [])
+            for k, player in enumerate(players):
+                px = x + k * (cell_width // 2)
+                feed = self.network.store.get('match', (room.room_id, player.ip))
+                label = f"{player.name}"
+                if feed and feed.board is not None:
+                    label += f" {feed.score}分 {feed.moves}步"
+                    self.screen.blit(self.render_board(feed), (px, y + 50))
+                else:
+                    self.screen.blit(self.font.render("等待数据...", True, (150, 150, 150)), (px, y + 50))
+                self.screen.blit(self.font.render(label, True, (255, 255, 255)), (px, y + 25))
+
+        pygame.draw.rect(self.screen, (100, 100, 100), self.back_button)
+        pygame.draw.rect(self.screen, (200, 200, 200), self.back_button, 2)
+        self.screen.blit(self.back_text, self.back_text.get_rect(center=self.back_button.center))
@@ -0,0 +1,117 @@
+import random
+import sys
+from collections import OrderedDict
+
+from board import SpecialType
+
+# 固定种子，保证不同进程里同一棋盘的哈希一致
+ZOBRIST_SEED = 20240601
+
+
+class ZobristTable:
+    """为每个 (格子, 宝石类型, 特殊符文) 组合生成一个64位随机键"""
+
+    def __init__(self, rows, cols, gem_types, seed=ZOBRIST_SEED):
+        rng = random.Random(seed)
+        self.rows = rows
+        self.cols = cols
+        self.type_index = {gem_type: i for i, gem_type in enumerate(gem_types)}
+        self.keys = [[[[rng.getrandbits(64) for _ in SpecialType]
+                       for _ in gem_types]
+                      for _ in range(cols)]
+                     for _ in range(rows)]
+
+    def key(self, row, col, gem):
+        """格子上宝石对应的键，空格为0"""
+        if gem is None:
+            return 0
+        return self.keys[row][col][self.type_index[gem.type]][gem.special_type.value]
+
+    def hash_grid(self, grid):
+        """完整计算棋盘哈希"""
+        value = 0
+        for i, row in enumerate(grid):
+            for j, gem in enumerate(row):
+                if gem is not None:
+                    value ^= self.keys[i][j][self.type_index[gem.type]][gem.special_type.value]
+        return value
+
+
+def _deep_size(value):
+    """粗略估计缓存值占用的字节数"""
+    size = sys.getsizeof(value)
+    if isinstance(value, dict):
+        size += sum(_deep_size(k) + _deep_size(v) for k, v in value.items())
+    elif isinstance(value, (list, tuple, set, frozenset)):
+        size += sum(_deep_size(item) for item in value)
+    return size
+
+
+class TranspositionTable:
+    """按棋盘哈希缓存匹配结果、可行交换和评估分数
+
+    capacity 为最多保存的条目数，eviction 为淘汰策略：
+    'lru' 淘汰最久未使用的条目，'fifo' 淘汰最早写入的条目。
+    """
+
+    def __init__(self, capacity=50000, eviction='lru'):
+        if eviction not in ('lru', 'fifo'):
+            raise ValueError(f"未知的淘汰策略: {eviction}")
+        self.capacity = capacity
+        self.eviction = eviction
+        self.entries = OrderedDict()  # (类型, 哈希) -> (值, 估计字节数)
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, kind, board_hash):
+        """查找缓存，kind 区分缓存内容（如 'matches'、'moves'），未命中返回 None"""
+        key = (kind, board_hash)
+        entry = self.entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        if self.eviction == 'lru':
+            self.entries.move_to_end(key)
+        return entry[0]
+
+    def put(self, kind, board_hash, value):
+        key = (kind, board_hash)
+        old = self.entries.pop(key, None)
+        if old is not None:
+            self.bytes -= old[1]
+        size = _deep_size(key) + _deep_size(value)
+        self.entries[key] = (value, size)
+        self.bytes += size
+        while len(self.entries) > self.capacity:
+            _, (_, evicted_size) = self.entries.popitem(last=False)
+            self.bytes -= evicted_size
+            self.evictions += 1
+
+    def clear(self):
+        """清空缓存和统计"""
+        self.entries.clear()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def hit_rate(self):
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def memory_bytes(self):
+        """缓存占用内存的估计值"""
+        return sys.getsizeof(self.entries) + self.bytes
+
+    def stats(self):
+        return {
+            'entries': len(self.entries),
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'hit_rate': self.hit_rate(),
+            'memory_bytes': self.memory_bytes()
+        }